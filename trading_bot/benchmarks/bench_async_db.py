@@ -0,0 +1,92 @@
+"""
+Concurrent-candidate throughput: sync DB calls in asyncio.to_thread vs database_async.
+
+Each simulated candidate does what process_candidate/execute_trade_logic do
+against the DB (fundamental lookup, config read, balance read, analysis write)
+plus one blocking "network" call (yfinance/news) that must run in a thread.
+On the sync path the DB calls compete with those network calls for the same
+thread-pool slots.
+
+Usage:
+    python benchmarks/bench_async_db.py [--candidates 200] [--workers 8] [--net-ms 50]
+
+Runs against a throwaway SQLite file and, if BENCH_POSTGRES_URL is set, Postgres.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def simulated_network_call(net_ms):
+    time.sleep(net_ms / 1000)
+
+async def sync_candidate(db, symbol, net_ms):
+    await asyncio.to_thread(simulated_network_call, net_ms)
+    await asyncio.to_thread(db.get_fundamental, symbol)
+    await asyncio.to_thread(db.get_config, "market_bias")
+    await asyncio.to_thread(db.get_balance)
+    await asyncio.to_thread(db.log_analysis, symbol, 1.5, 0.9, 20.0, 'BUY', 'REJECTED', 'bench', 10.0)
+
+async def async_candidate(adb, symbol, net_ms):
+    await asyncio.to_thread(simulated_network_call, net_ms)
+    await adb.get_fundamental(symbol)
+    await adb.get_config("market_bias")
+    await adb.get_balance()
+    await adb.log_analysis(symbol, 1.5, 0.9, 20.0, 'BUY', 'REJECTED', 'bench', 10.0)
+
+async def run_path(label, fn, module, n, workers, net_ms):
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=workers))
+    symbols = [f"BENCH{i}" for i in range(n)]
+
+    # Warm-up (engine/pool creation)
+    await fn(module, "WARMUP", 0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[fn(module, s, net_ms) for s in symbols])
+    elapsed = time.perf_counter() - start
+    print(f"{label:>6}: {n / elapsed:>8,.1f} candidates/sec ({elapsed:.2f}s)")
+    return n / elapsed
+
+async def bench(n, workers, net_ms):
+    import database as db
+    import database_async as adb
+    db.migrate()
+    try:
+        sync_rate = await run_path("sync", sync_candidate, db, n, workers, net_ms)
+        async_rate = await run_path("async", async_candidate, adb, n, workers, net_ms)
+        print(f"speedup: {async_rate / sync_rate:.2f}x")
+    finally:
+        await adb.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--candidates', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--net-ms', type=float, default=50)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.url:
+        # Child run: database.py binds DATABASE_URL at import time
+        os.environ['DATABASE_URL'] = args.url
+        asyncio.run(bench(args.candidates, args.workers, args.net_ms))
+        sys.exit(0)
+
+    backends = [("SQLite", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")]
+    if os.getenv("BENCH_POSTGRES_URL"):
+        backends.append(("PostgreSQL", os.getenv("BENCH_POSTGRES_URL")))
+    else:
+        print("(BENCH_POSTGRES_URL not set: skipping PostgreSQL)")
+
+    for name, url in backends:
+        print(f"\n--- {name}: {args.candidates} candidates, {args.workers} pool threads, {args.net_ms:.0f}ms network ---")
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--url', url,
+                        '--candidates', str(args.candidates), '--workers', str(args.workers),
+                        '--net-ms', str(args.net_ms)], check=True)
@@ -0,0 +1,88 @@
+"""
+monitor_portfolio cost vs number of held positions: the old per-position loop
+(one TechnicalAnalyst + 365-day download each, rules in Python) vs one bulk
+download with indicators and exit rules vectorized across positions.
+
+yf.download is replaced by a stub that sleeps --latency-ms per call (plus
+--per-ticker-ms per symbol) and returns synthetic bars, so no network is used.
+
+Usage:
+    python benchmarks/bench_monitor.py [--positions 1 5 20 50] [--latency-ms 300] [--per-ticker-ms 5]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import technical_analyst
+from technical_analyst import TechnicalAnalyst, fetch_closes, signals_wide
+from core.exit_rules import evaluate_exits
+
+def fake_download_factory(latency_ms, per_ticker_ms, n_days=250):
+    rng = np.random.default_rng(0)
+    index = pd.bdate_range(end=datetime.now(), periods=n_days)
+
+    def bars(n):
+        close = 100 * np.exp(np.cumsum(rng.normal(0.0005, 0.02, (n_days, n)), axis=0))
+        return close
+
+    def download(tickers, **kwargs):
+        tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+        time.sleep((latency_ms + per_ticker_ms * len(tickers)) / 1000)
+        close = bars(len(tickers))
+        fields = {'Open': close, 'High': close * 1.01, 'Low': close * 0.99, 'Close': close, 'Volume': np.full_like(close, 1e6)}
+        if kwargs.get('group_by') == 'ticker':
+            frames = {(t, f): v[:, i] for i, t in enumerate(tickers) for f, v in fields.items()}
+        else:
+            frames = {(f, t): v[:, i] for i, t in enumerate(tickers) for f, v in fields.items()}
+        return pd.DataFrame(frames, index=index)
+    return download
+
+def make_positions(n):
+    entry = (datetime.now() - timedelta(days=2)).isoformat()
+    return {f"SYM{i}": {'shares': 10.0, 'avg_price': 100.0, 'fee_rate': 0.015, 'cost_basis': 1015.0, 'entry_date': entry}
+            for i in range(n)}
+
+async def per_position(positions):
+    # Pre-change monitor_portfolio: sequential analyze() + rules per symbol
+    sells = []
+    for symbol, pos in positions.items():
+        result = await TechnicalAnalyst(symbol).analyze()
+        curr_price = result['latest_price']
+        proceeds = (pos['shares'] * curr_price) * (1 - pos['fee_rate'])
+        pnl_percent = (proceeds - pos['cost_basis']) / pos['cost_basis'] * 100
+        days_held = (datetime.now() - datetime.fromisoformat(pos['entry_date'])).days
+        if pnl_percent >= 5.0 or (days_held >= 5 and pnl_percent > -2.0) or (days_held < 5 and curr_price < pos['avg_price'] * 0.96):
+            sells.append(symbol)
+    return sells
+
+async def batched(positions):
+    signals = signals_wide(await fetch_closes(list(positions)))
+    exits = evaluate_exits(positions, signals['latest_price'], signals['signal'], signals['rsi'])
+    return list(exits.index[exits['action'] == 'SELL'])
+
+def timed(fn, positions):
+    start = time.perf_counter()
+    asyncio.run(fn(positions))
+    return (time.perf_counter() - start) * 1000
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--positions', type=int, nargs='+', default=[1, 5, 20, 50])
+    parser.add_argument('--latency-ms', type=float, default=300)
+    parser.add_argument('--per-ticker-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    with patch.object(technical_analyst.yf, 'download', fake_download_factory(args.latency_ms, args.per_ticker_ms)):
+        print(f"{'positions':>9} {'per-position ms':>16} {'batched ms':>11} {'speedup':>8}")
+        for n in args.positions:
+            positions = make_positions(n)
+            old, new = timed(per_position, positions), timed(batched, positions)
+            print(f"{n:>9} {old:>16.0f} {new:>11.0f} {old / new:>7.1f}x")
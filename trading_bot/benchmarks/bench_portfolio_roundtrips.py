@@ -0,0 +1,104 @@
+"""
+DB round trips per orchestrator cycle: reload-before-every-operation vs the
+in-memory authoritative PaperTrader.
+
+One simulated cycle = monitor_portfolio over the held positions (some of which
+are sold), a handful of buys from the scan, and the heartbeat summary.
+
+Usage:
+    python benchmarks/bench_portfolio_roundtrips.py [--positions 5] [--sells 2] [--buys 3] [--cycles 20]
+
+Runs against a throwaway SQLite file (statement counts are backend-independent).
+"""
+import os
+import sys
+import argparse
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the benchmark away from the real database on import
+_tmp_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+
+from sqlalchemy import event, delete
+import database as db
+from paper_trader import PaperTrader
+
+class LegacyTrader(PaperTrader):
+    """Previous behaviour: re-read balance + positions before every operation."""
+
+    def _legacy_reload(self):
+        self.balance = db.get_balance()
+        self.positions = db.get_positions()
+        self.version = None  # no optimistic check
+
+    def buy(self, symbol, price):
+        self._legacy_reload()
+        return super().buy(symbol, price)
+
+    def sell(self, symbol, price):
+        self._legacy_reload()
+        return super().sell(symbol, price)
+
+    def get_summary(self):
+        self._legacy_reload()
+        return {'cash': self.balance, 'open_positions': len(self.positions), 'realized_trades': db.get_trade_count()}
+
+class Counter:
+    def __init__(self, engine):
+        self.statements = 0
+        self.connections = 0
+        event.listen(engine, "before_cursor_execute", self._on_statement)
+        event.listen(engine, "engine_connect", self._on_connect)
+
+    def _on_statement(self, *args):
+        self.statements += 1
+
+    def _on_connect(self, *args):
+        self.connections += 1
+
+def reset_portfolio(n_positions):
+    with db.engine.begin() as conn:
+        conn.execute(delete(db.trades))
+    db.reset_portfolio(1_000_000.0)
+    seeder = PaperTrader()
+    for i in range(n_positions):
+        seeder.buy(f"HELD{i}.TO", 100.0)
+
+def run_cycle(trader, cycle, n_sells, n_buys):
+    # monitor_portfolio: prices come from yfinance; only sells touch the DB
+    for symbol in list(trader.positions)[:n_sells]:
+        trader.sell(symbol, 105.0)
+    # scan_batch -> execute_trade_logic
+    for i in range(n_buys):
+        trader.buy(f"NEW{cycle}_{i}.TO", 50.0)
+    # heartbeat
+    trader.get_summary()
+
+def measure(trader_cls, args, counter):
+    reset_portfolio(args.positions)
+    trader = trader_cls()
+    start_statements, start_connections = counter.statements, counter.connections
+    for cycle in range(args.cycles):
+        run_cycle(trader, cycle, args.sells, args.buys)
+    return ((counter.statements - start_statements) / args.cycles,
+            (counter.connections - start_connections) / args.cycles)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--positions', type=int, default=5)
+    parser.add_argument('--sells', type=int, default=2)
+    parser.add_argument('--buys', type=int, default=3)
+    parser.add_argument('--cycles', type=int, default=20)
+    args = parser.parse_args()
+
+    db.migrate()
+    counter = Counter(db.engine)
+    print(f"--- per cycle: {args.sells} sells, {args.buys} buys, 1 summary ({args.positions} positions held) ---")
+    before = measure(LegacyTrader, args, counter)
+    after = measure(PaperTrader, args, counter)
+    print(f"{'':>10} {'statements':>11} {'connections':>12}")
+    print(f"{'reload':>10} {before[0]:>11.1f} {before[1]:>12.1f}")
+    print(f"{'in-memory':>10} {after[0]:>11.1f} {after[1]:>12.1f}")
+    print(f"round trips saved: {before[0] - after[0]:.1f} statements/cycle ({(1 - after[0] / before[0]) * 100:.0f}%)")
@@ -0,0 +1,76 @@
+"""
+RiskEngine cost: review time per buy intent, and keeping the return
+covariance current (one new day, one revised intraday bar, one new candidate)
+with the incremental updates vs recomputing the pairwise correlation matrix
+from the window with pandas.
+
+Usage:
+    python benchmarks/bench_risk.py [--symbols 20 100 300] [--intents 50] [--window 60]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.risk_engine import RiskEngine, RollingCovariance
+
+def synthetic_closes(n_symbols, n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    factors = rng.normal(0, 0.015, (n_days, 8))
+    loadings = rng.uniform(0, 1, (8, n_symbols))
+    returns = factors @ loadings / 4 + rng.normal(0, 0.01, (n_days, n_symbols))
+    index = pd.bdate_range("2024-01-01", periods=n_days)
+    return pd.DataFrame(100 * np.cumprod(1 + returns, axis=0), index=index, columns=[f"SYM{i}" for i in range(n_symbols)])
+
+def timed(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench(n_symbols, n_intents, window):
+    closes = synthetic_closes(n_symbols + 1, window + 3)
+    held, candidate = closes.columns[:n_symbols // 2], closes.columns[n_symbols // 2:n_symbols]
+    base = closes.iloc[:-2, :n_symbols]
+
+    engine = RiskEngine(window=window)
+    engine.observe(base)
+    exposures = {s: 10.0 for s in held}
+    intents = [{'symbol': candidate[i % len(candidate)], 'price': 10.0} for i in range(n_intents)]
+    review = timed(lambda: engine.review(intents, 1e6, exposures)) / n_intents
+
+    def incremental(cov, frame):
+        return lambda: cov.update(frame)
+    new_day = closes.iloc[-3:-1, :n_symbols]
+    cov = RollingCovariance(window)
+    cov.update(base)
+    t_day = timed(incremental(cov, new_day), repeat=1)
+    revised = new_day.copy()
+    revised.iloc[-1] *= 1.002
+    t_revise = timed(incremental(cov, revised), repeat=1)
+    t_symbol = timed(incremental(cov, closes.iloc[:-1, [n_symbols]]), repeat=1)
+
+    returns = closes.iloc[:-1].pct_change().iloc[-window:]
+    t_full = timed(lambda: returns.corr(min_periods=20))
+    return review, t_day, t_revise, t_symbol, t_full
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, nargs='+', default=[20, 100, 300])
+    parser.add_argument('--intents', type=int, default=50)
+    parser.add_argument('--window', type=int, default=60)
+    args = parser.parse_args()
+
+    print(f"{'symbols':>8} {'review/intent':>14} {'new day':>10} {'revised bar':>12} {'new symbol':>11} {'full corr':>10}")
+    for n in args.symbols:
+        review, t_day, t_revise, t_symbol, t_full = bench(n, args.intents, args.window)
+        print(f"{n:>8} {review * 1e6:>12.0f}us {t_day * 1e3:>8.2f}ms {t_revise * 1e3:>10.2f}ms {t_symbol * 1e3:>9.2f}ms {t_full * 1e3:>8.2f}ms")
+
+if __name__ == "__main__":
+    main()
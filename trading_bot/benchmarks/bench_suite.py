@@ -0,0 +1,301 @@
+"""
+Hot-path benchmark suite on synthetic data, for N tickers per run:
+
+  scan          scan_batch volume screening over N tickers (BATCH_SIZE per download)
+  indicators    TechnicalAnalyst.calculate_indicators / analyze per ticker, and
+                the batched signals_wide over all N
+  sentiment     SentimentAnalyzer.analyze (FinBERT) on 5 headlines per ticker
+  persistence   log_analysis (per row and batched) and PaperTrader fills, on
+                SQLite and, if BENCH_POSTGRES_URL is set, Postgres
+  monitor       monitor_portfolio over N/100 held positions (10..50)
+
+yf.download is served from pre-built frames, so no network is used and only
+the bot's own work is timed. Per-ticker paths run on at most --per-ticker
+tickers (--sentiment-tickers for FinBERT) and are reported per ticker.
+A bench whose dependencies are missing is recorded as skipped.
+
+Results go to benchmarks/results/<commit>.json (or --out). With --compare
+BASELINE.json, timings more than --threshold slower (or throughputs that
+much lower) are listed and the exit status is 1.
+
+Usage:
+    python benchmarks/bench_suite.py [--tickers 500 1000 5000] [--only scan indicators ...]
+                                     [--out results.json] [--compare baseline.json] [--threshold 0.2]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+
+# Keep the benchmark away from the real database on import
+_tmp_dir = tempfile.mkdtemp()
+SQLITE_URL = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+os.environ['DATABASE_URL'] = SQLITE_URL
+
+import yfinance as yf
+import database as db
+import database_async as adb
+from core.config import BATCH_SIZE
+
+BENCHES = ['scan', 'indicators', 'sentiment', 'persistence', 'monitor']
+
+# --- Synthetic data ---
+def synthetic_bars(symbols, n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(end=datetime.now().date(), periods=n_days)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0005, 0.02, (n_days, len(symbols))), axis=0))
+    volume = rng.lognormal(13, 0.3, (n_days, len(symbols)))
+    volume[-1] *= np.where(rng.random(len(symbols)) < 0.05, 4.0, 1.0)  # ~5% volume spikes today
+    return pd.DataFrame(close, index=index, columns=symbols), pd.DataFrame(volume, index=index, columns=symbols)
+
+def ticker_frame(closes, volumes, tickers):
+    """yf.download(tickers, group_by='ticker') layout: (ticker, field) columns."""
+    fields = {}
+    for t in tickers:
+        c = closes[t]
+        fields.update({(t, 'Open'): c, (t, 'High'): c * 1.01, (t, 'Low'): c * 0.99, (t, 'Close'): c, (t, 'Volume'): volumes[t]})
+    return pd.DataFrame(fields)
+
+def single_frame(closes, volumes, ticker):
+    c = closes[ticker]
+    return pd.DataFrame({'Open': c, 'High': c * 1.01, 'Low': c * 0.99, 'Close': c, 'Volume': volumes[ticker]})
+
+def symbols(n):
+    return [f"S{i}" + (".TO" if i % 5 == 0 else "") for i in range(n)]
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - start) * 1000, result
+
+def use_backend(url):
+    """Points database.py at url (fresh engine, migrated)."""
+    if db._engine is not None:
+        db._engine.dispose()
+    db.DB_URL = url
+    db._engine = None
+    db.migrate()
+
+# --- Benches: each returns {metric: value} for n tickers ---
+def bench_scan(n, args):
+    from core.market_scanner import MarketScanner
+
+    tickers = symbols(n)
+    closes, volumes = synthetic_bars(tickers, 5)
+    batches = [tickers[i:i + BATCH_SIZE] for i in range(0, n, BATCH_SIZE)]
+    frames = {tuple(b): ticker_frame(closes, volumes, b) for b in batches}
+    movers = []
+
+    async def candidate(self, symbol, *a):
+        movers.append(symbol)
+
+    async def no_fundamentals(self, symbols):
+        return {}
+
+    async def no_orders():
+        return []
+
+    scanner = MarketScanner.__new__(MarketScanner)
+    scanner.trade_executor = SimpleNamespace(trader=SimpleNamespace(positions={}), execute_pending_orders=no_orders,
+                                             analysis_writer=SimpleNamespace(submit=lambda **kw: None))
+
+    async def scan_all():
+        for batch in batches:
+            await scanner.scan_batch(batch)
+
+    with patch.object(yf, 'download', lambda tickers, **kw: frames[tuple(tickers)]), \
+         patch.object(MarketScanner, '_traced_candidate', candidate), \
+         patch.object(MarketScanner, 'get_fundamentals_many', no_fundamentals):
+        ms, _ = timed(lambda: asyncio.run(scan_all()))
+    return {'ms': round(ms, 1), 'tickers_per_sec': round(n / ms * 1000), 'movers': len(movers)}
+
+def bench_indicators(n, args):
+    from technical_analyst import TechnicalAnalyst, signals_wide
+
+    tickers = symbols(n)
+    closes, volumes = synthetic_bars(tickers, 365)
+    sample = tickers[:min(n, args.per_ticker)]
+    frames = {t: single_frame(closes, volumes, t) for t in sample}
+
+    calc_ms, _ = timed(lambda: [TechnicalAnalyst(t).calculate_indicators(frames[t].copy()) for t in sample])
+
+    async def analyze_all():
+        return await asyncio.gather(*[TechnicalAnalyst(t).analyze() for t in sample])
+
+    with patch.object(yf, 'download', lambda ticker, **kw: frames[ticker].copy()):
+        analyze_ms, results = timed(lambda: asyncio.run(analyze_all()))
+    wide_ms, _ = timed(lambda: signals_wide(closes))
+    return {
+        'calculate_indicators_us_per_ticker': round(calc_ms / len(sample) * 1000),
+        'analyze_us_per_ticker': round(analyze_ms / len(sample) * 1000),
+        'analyze_projected_ms': round(analyze_ms / len(sample) * n, 1),
+        'signals_wide_ms': round(wide_ms, 1),
+        'sampled_tickers': len(sample),
+        'buy_signals': sum(r['signal'] == 'BUY' for r in results)
+    }
+
+def bench_sentiment(n, args):
+    from core.sentiment import SentimentAnalyzer
+
+    analyzer = SentimentAnalyzer()
+    if analyzer._classifier is None:
+        return {'skipped': "FinBERT pipeline unavailable"}
+    sample = symbols(min(n, args.sentiment_tickers))
+    headlines = {s: [f"{s} beats earnings estimates", f"{s} shares rally on volume", f"Analysts upgrade {s}",
+                     f"{s} announces buyback", f"{s} faces regulatory probe"] for s in sample}
+    analyzer.analyze(headlines[sample[0]])  # warm-up (first call loads kernels)
+    ms, _ = timed(lambda: [analyzer.analyze(headlines[s]) for s in sample])
+    return {'ms_per_ticker': round(ms / len(sample), 2), 'projected_ms': round(ms / len(sample) * n, 1), 'sampled_tickers': len(sample)}
+
+def bench_persistence(n, args, url=SQLITE_URL):
+    from paper_trader import PaperTrader
+
+    use_backend(url)
+    tickers = symbols(n)
+    single = tickers[:min(n, args.per_ticker)]
+    rows = [db.analysis_row(t, 2.5, 0.95, 20.0, 'BUY', 'REJECTED', 'benchmark', 10.0) for t in tickers]
+
+    log_ms, _ = timed(lambda: [db.log_analysis(t, 2.5, 0.95, 20.0, 'BUY', 'REJECTED', 'benchmark', 10.0) for t in single])
+    many_ms, _ = timed(lambda: db.log_analysis_many(rows))
+
+    # Orders are capped at $100 so every one fills (sizing takes 20% of the cash left otherwise)
+    db.reset_portfolio(1e9)
+    trader = PaperTrader()
+    buy_ms, _ = timed(lambda: [trader.buy_many([(t, 10.0, 100.0)]) for t in single])  # one transaction per fill
+    sell_ms, _ = timed(lambda: [trader.sell(t, 10.5) for t in single])
+    buy_many_ms, receipts = timed(lambda: trader.buy_many([(t, 10.0, 100.0) for t in tickers]))
+    sell_many_ms, _ = timed(lambda: trader.sell_many([(t, 10.5) for t in tickers]))
+    return {
+        'log_analysis_rows_per_sec': round(len(single) / log_ms * 1000),
+        'log_analysis_many_rows_per_sec': round(n / many_ms * 1000),
+        'buy_ms_per_fill': round(buy_ms / len(single), 3),
+        'sell_ms_per_fill': round(sell_ms / len(single), 3),
+        'buy_many_ms': round(buy_many_ms, 1),
+        'sell_many_ms': round(sell_many_ms, 1),
+        'batch_fills': len(receipts or [])
+    }
+
+def bench_monitor(n, args):
+    from core.trade_executor import TradeExecutor
+
+    use_backend(SQLITE_URL)
+    held = symbols(min(max(n // 100, 10), 50))
+    closes, volumes = synthetic_bars(held, 365, seed=1)
+    frame = ticker_frame(closes, volumes, held)
+
+    db.reset_portfolio(1e9)
+    executor = TradeExecutor()
+    executor.notifier.enabled = False
+    executor.trader.buy_many([(t, 100.0) for t in held])
+
+    async def monitor():
+        try:
+            start = time.perf_counter()
+            await executor.monitor_portfolio()
+            return (time.perf_counter() - start) * 1000
+        finally:
+            await adb.dispose()
+
+    with patch.object(yf, 'download', lambda tickers, **kw: frame):
+        ms = asyncio.run(monitor())
+    return {'ms': round(ms, 1), 'positions': len(held), 'sold': len(held) - len(executor.trader.positions)}
+
+# --- Runner ---
+def git_commit():
+    try:
+        sha = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=BENCH_DIR, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True, cwd=BENCH_DIR).stdout.strip()
+        return sha + ('-dirty' if dirty else '')
+    except Exception:
+        return 'unknown'
+
+def run(args):
+    results = {}
+    for name in args.only:
+        variants = [(name, lambda n, a, fn=globals()[f"bench_{name}"]: fn(n, a))]
+        if name == 'persistence':
+            variants = [('persistence.sqlite', lambda n, a: bench_persistence(n, a, SQLITE_URL))]
+            if os.getenv('BENCH_POSTGRES_URL'):
+                variants.append(('persistence.postgres', lambda n, a: bench_persistence(n, a, os.environ['BENCH_POSTGRES_URL'])))
+        for label, fn in variants:
+            results[label] = {}
+            for n in args.tickers:
+                try:
+                    results[label][str(n)] = fn(n, args)
+                except ImportError as e:
+                    results[label][str(n)] = {'skipped': f"missing dependency: {e}"}
+                print(f"{label:<22} {n:>6}: {results[label][str(n)]}")
+    return results
+
+def regressions(baseline, current, threshold):
+    """[(bench, n, metric, old, new)] for timings up / throughputs down by more than threshold."""
+    found = []
+    for bench, sizes in current.items():
+        for n, metrics in sizes.items():
+            old_metrics = baseline.get(bench, {}).get(n, {})
+            for metric, new in metrics.items():
+                old = old_metrics.get(metric)
+                if not isinstance(new, (int, float)) or not isinstance(old, (int, float)) or old <= 0:
+                    continue
+                if '_ms' in metric or '_us' in metric or metric == 'ms':
+                    worse = new > old * (1 + threshold)
+                elif metric.endswith('_per_sec'):
+                    worse = new < old * (1 - threshold)
+                else:
+                    continue
+                if worse:
+                    found.append((bench, n, metric, old, new))
+    return found
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickers', type=int, nargs='+', default=[500, 1000, 5000])
+    parser.add_argument('--only', nargs='+', choices=BENCHES, default=BENCHES)
+    parser.add_argument('--per-ticker', type=int, default=500, help="tickers sampled by per-ticker benches")
+    parser.add_argument('--sentiment-tickers', type=int, default=50)
+    parser.add_argument('--out', default=None)
+    parser.add_argument('--compare', default=None, help="baseline results JSON")
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args()
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'params': {'tickers': args.tickers, 'per_ticker': args.per_ticker, 'sentiment_tickers': args.sentiment_tickers},
+        'results': run(args)
+    }
+    out = args.out or os.path.join(BENCH_DIR, 'results', f"{commit}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        found = regressions(baseline['results'], report['results'], args.threshold)
+        print(f"\nvs {baseline['commit']}: {len(found)} regression(s) over {args.threshold:.0%}")
+        for bench, n, metric, old, new in found:
+            print(f"  {bench} [{n}] {metric}: {old} -> {new}")
+        if found:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Parameter sweep throughput vs worker count, and what shared memory saves
+over pickling the backtest inputs into every task.
+
+Usage:
+    python benchmarks/bench_sweep.py [--symbols 500] [--years 5] [--combos 32] [--workers 1 2 4 8]
+"""
+import os
+import sys
+import time
+import pickle
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.backtester import prepare
+from core.sweep import DEFAULT_GRID, random_search, run_sweep
+from benchmarks.bench_backtest import synthetic_bars
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--years', type=float, default=5)
+    parser.add_argument('--combos', type=int, default=32)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    closes, volumes = synthetic_bars(args.symbols, int(args.years * 252))
+    inputs = prepare(closes, volumes)
+    combos = random_search(DEFAULT_GRID, args.combos)
+
+    start = time.perf_counter()
+    payload = pickle.dumps(inputs, protocol=pickle.HIGHEST_PROTOCOL)
+    pickle.loads(payload)
+    pickle_s = time.perf_counter() - start
+    print(f"--- {args.symbols} symbols x {len(closes)} days, {len(combos)} combinations, {os.cpu_count()} CPUs ---")
+    print(f"inputs: {len(payload) / 1e6:.0f} MB; pickling per task would cost ~{pickle_s * 1000:.0f}ms x {len(combos)} tasks")
+
+    base = None
+    print(f"{'workers':>7} {'seconds':>8} {'combos/s':>9} {'speedup':>8}")
+    for workers in args.workers:
+        start = time.perf_counter()
+        run_sweep(inputs, combos, workers=workers, initial_capital=10000.0)
+        elapsed = time.perf_counter() - start
+        base = base or elapsed
+        print(f"{workers:>7} {elapsed:>8.2f} {len(combos) / elapsed:>9.1f} {base / elapsed:>7.1f}x")
@@ -0,0 +1,107 @@
+"""
+Full orchestrator cycles against recorded external I/O (core/replay.py).
+
+record: runs --cycles live cycles (Yahoo, Google News, Wikipedia, Groq/OpenAI,
+Telegram) and archives every response, the ET clock, the starting portfolio
+and the cached P/E of every symbol scanned.
+replay: restores that state into a throwaway SQLite DB and runs the same
+cycles offline, each call answered from the archive after its recorded
+latency (times --scale) or a fixed --latency-ms. Prints the cycle times and
+the per-stage span timings. FinBERT still runs for real (its weights must be
+in the local Hugging Face cache).
+
+Usage:
+    python benchmarks/replay_cycle.py record data/replay/cycle.pkl.gz [--cycles 1]
+    python benchmarks/replay_cycle.py replay data/replay/cycle.pkl.gz [--scale 1.0 | --latency-ms 0] [--repeat 3]
+"""
+import os
+import sys
+import asyncio
+import argparse
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('mode', choices=['record', 'replay'])
+    parser.add_argument('archive')
+    parser.add_argument('--cycles', type=int, default=1, help="cycles to record")
+    parser.add_argument('--repeat', type=int, default=1, help="replays of the whole recording")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiplier on recorded latencies")
+    parser.add_argument('--latency-ms', type=float, default=None, help="fixed latency per call instead")
+    return parser.parse_args()
+
+args = parse_args()
+if args.mode == 'replay':
+    # Replays never touch the real DB
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'replay.db')}"
+
+import database as db
+import database_async as adb
+import main_orchestrator
+from main_orchestrator import Orchestrator
+from core.replay import Recorder, Replayer
+from core.tracing import tracer
+
+def scanned_symbols(session):
+    symbols = set()
+    for key in session.calls:
+        if key[0] == 'yf.download':
+            symbols.update(key[1])
+    return sorted(symbols)
+
+def restore(meta):
+    state = meta['portfolio']
+    db.reset_portfolio(state['balance'])
+    for symbol, position in state['positions'].items():
+        db.add_position(symbol, position)
+    db.set_fundamentals_many(meta['fundamentals'])
+
+async def run_cycles(orchestrator, cycles):
+    durations = []
+    try:
+        await orchestrator.load_reference_data()
+        for _ in range(cycles):
+            await orchestrator.run_cycle()
+            durations.append(tracer.last_trace['ms'])
+        await orchestrator.trade_executor.notifier.stop()
+    finally:
+        orchestrator.trade_executor.analysis_writer.stop()
+        await adb.dispose()
+    return durations
+
+def record(path, cycles):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with Recorder(path) as session:
+        session.intercept(main_orchestrator, 'now_et', 'clock', key=lambda a, kw: ())
+        db.migrate()
+        session.meta['portfolio'] = db.get_portfolio_state()
+        session.meta['cycles'] = cycles
+        orchestrator = Orchestrator()
+        durations = asyncio.run(run_cycles(orchestrator, cycles))
+        session.meta['fundamentals'] = db.get_fundamentals_many(scanned_symbols(session))
+    print(f"Recorded {cycles} cycle(s) in {[f'{ms / 1000:.1f}s' for ms in durations]}: {session.stats()}")
+
+def replay(path, repeat, scale, latency_ms):
+    latency = None if latency_ms is None else latency_ms / 1000
+    db.migrate()
+    for run in range(repeat):
+        with Replayer(path, latency=latency, scale=scale) as session:
+            session.intercept(main_orchestrator, 'now_et', 'clock', key=lambda a, kw: ())
+            restore(session.meta)
+            orchestrator = Orchestrator()
+            durations = asyncio.run(run_cycles(orchestrator, session.meta['cycles']))
+        print(f"Replay {run + 1}: cycles {[f'{ms / 1000:.2f}s' for ms in durations]} {session.stats()}")
+        for key, n in sorted(session.misses.items(), key=lambda kv: -kv[1])[:10]:
+            print(f"  miss x{n}: {key}")
+
+    print(f"\n{'stage':<32} {'count':>6} {'total':>10} {'p50':>9} {'p95':>9} {'max':>9}")
+    for name, s in tracer.stats().items():
+        print(f"{name:<32} {s['count']:>6} {s['total_ms']:>8.0f}ms {s['p50_ms']:>7.1f}ms {s['p95_ms']:>7.1f}ms {s['max_ms']:>7.1f}ms")
+
+if __name__ == "__main__":
+    if args.mode == 'record':
+        record(args.archive, args.cycles)
+    else:
+        replay(args.archive, args.repeat, args.scale, args.latency_ms)
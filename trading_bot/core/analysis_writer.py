@@ -0,0 +1,131 @@
+import atexit
+import queue
+import threading
+import time
+import database as db
+from core.logger import setup_logger
+
+logger = setup_logger("AnalysisWriter", "logs/analysis_writer.log")
+
+_STOP = object()
+
+class AnalysisLogWriter:
+    """
+    Background writer for analysis_log.
+    submit() never blocks the event loop: records go into a bounded queue and a
+    daemon thread flushes them with one executemany per batch once either
+    batch_size records are waiting or flush_interval seconds have passed.
+    When the queue is full, new records are dropped and counted.
+    """
+
+    def __init__(self, batch_size=200, flush_interval=2.0, max_queue=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="AnalysisLogWriter", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        logger.info(f"Analysis writer started (batch={self.batch_size}, interval={self.flush_interval}s)")
+
+    def stop(self, timeout=10.0):
+        """Flushes everything still queued and stops the thread."""
+        thread = self._thread
+        if not thread or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        self._thread = None
+        logger.info(f"Analysis writer stopped. {self.stats()}")
+
+    def submit(self, symbol, volume_ratio, sentiment_score, pe_ratio, technical_signal, action_taken, reason, price):
+        """Same signature as db.log_analysis, but returns immediately."""
+        if not self._thread:
+            self.start()
+
+        row = db.analysis_row(symbol, volume_ratio, sentiment_score, pe_ratio, technical_signal, action_taken, reason, price)
+        try:
+            self._queue.put_nowait(row)
+            self.enqueued += 1
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self, timeout=10.0):
+        """Blocks until every record submitted so far has been written."""
+        if not self._thread:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize(),
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'flushes': self.flushes,
+            'last_flush_ms': round(self.last_flush_ms, 2),
+            'avg_flush_ms': round(self._total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+            'max_flush_ms': round(self.max_flush_ms, 2)
+        }
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._write(batch)
+                return
+            if isinstance(item, threading.Event):
+                self._write(batch)
+                batch = []
+                item.set()
+                continue
+            if item is not None:
+                batch.append(item)
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._write(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _write(self, batch):
+        if not batch:
+            return
+        start = time.perf_counter()
+        ok = db.log_analysis_many(batch)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        self.flushes += 1
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+        if ok:
+            self.written += len(batch)
+        else:
+            self.failed += len(batch)
+            logger.error(f"Failed to flush {len(batch)} analysis rows")
@@ -0,0 +1,194 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from technical_analyst import RSI_LOW, RSI_HIGH, RSI_OVERBOUGHT, indicator_history, score_history
+from core.position_sizing import INITIAL_CAPITAL, TRADE_ALLOCATION, MIN_ALLOCATION, fee_rate_for, size_buy
+from core.exit_rules import (
+    HOLD, TAKE_PROFIT, TIME_STOP, STOP_LOSS, TECHNICAL, TAKE_PROFIT_PCT, STOP_LOSS_PCT, MAX_HOLD_DAYS,
+    TIME_STOP_MIN_PNL_PCT, net_pnl, exit_codes
+)
+from core.config import DEFAULT_VOL_MULT
+from core.logger import setup_logger
+
+logger = setup_logger("Backtester", "logs/backtester.log")
+
+# Live scan_batch compares today's volume with the mean of the last 5 daily bars (incl. today)
+VOLUME_WINDOW = 5
+EXIT_REASONS = {TAKE_PROFIT: 'take_profit', TIME_STOP: 'time_stop', STOP_LOSS: 'stop_loss', TECHNICAL: 'technical'}
+
+def _rolling_mean_per_column(values, window, min_periods):
+    """Rolling mean over each column's own (non-NaN) bars; NaN where the column has no bar."""
+    valid = ~np.isnan(values)
+    order = np.argsort(~valid, axis=0, kind='stable')
+    compact = np.take_along_axis(values, order, axis=0)
+    means = pd.DataFrame(compact).rolling(window, min_periods=min_periods).mean().to_numpy()
+    out = np.empty_like(means)
+    np.put_along_axis(out, order, means, axis=0)
+    return np.where(valid, out, np.nan)
+
+def prepare(closes: pd.DataFrame, volumes: pd.DataFrame) -> dict:
+    """
+    Everything the simulation needs that does not depend on its parameters:
+    daily indicators (TechnicalAnalyst.analyze inputs), volume ratios (scan_batch
+    gate) and per-symbol fee rates (PaperTrader). All values are numpy arrays
+    (dates x symbols where 2-D), so they can be placed in shared memory.
+    """
+    volumes = volumes.reindex_like(closes)
+    close = closes.to_numpy(dtype=float)
+    volume = volumes.to_numpy(dtype=float)
+    avg_volume = _rolling_mean_per_column(volume, VOLUME_WINDOW, 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        volume_ratio = np.where(avg_volume > 0, volume / avg_volume, 0.0)
+    volume_ratio = np.nan_to_num(volume_ratio, nan=0.0)
+    history = indicator_history(closes)
+    inputs = {
+        'dates': closes.index.to_numpy(dtype='datetime64[D]'),
+        'symbols': np.array(closes.columns, dtype=str),
+        'close': close,
+        'close_ffill': closes.ffill().to_numpy(dtype=float),
+        'volume_ratio': volume_ratio,
+        'fee_rate': np.array([fee_rate_for(s) for s in closes.columns], dtype=float)
+    }
+    for when in ('curr', 'prev'):
+        for name, values in history[when].items():
+            inputs[f'{when}_{name}'] = values
+    return inputs
+
+def scores(inputs: dict, **thresholds):
+    """Daily analyze() score (dates x symbols) for the given RSI thresholds."""
+    history = {when: {name[len(when) + 1:]: values for name, values in inputs.items() if name.startswith(when + '_')}
+               for when in ('curr', 'prev')}
+    return score_history(history, **thresholds)
+
+def buy_signals(inputs: dict, **thresholds):
+    """Daily analyze() BUY mask (dates x symbols) for the given RSI thresholds."""
+    return (scores(inputs, **thresholds) >= 2) & ~np.isnan(inputs['close'])
+
+def simulate(inputs: dict, initial_capital=INITIAL_CAPITAL, allocation_pct=TRADE_ALLOCATION, vol_mult=DEFAULT_VOL_MULT,
+             rsi_low=RSI_LOW, rsi_high=RSI_HIGH, rsi_overbought=RSI_OVERBOUGHT,
+             take_profit_pct=TAKE_PROFIT_PCT, stop_loss_pct=STOP_LOSS_PCT, max_hold_days=MAX_HOLD_DAYS,
+             time_stop_min_pnl_pct=TIME_STOP_MIN_PNL_PCT) -> dict:
+    """
+    Replays the live loop once per trading day, at the close: monitor_portfolio
+    exits first (+5% take profit, 5-day time stop, -4% stop loss; see
+    core/exit_rules.py), then scan_batch entries (volume spike AND a BUY
+    signal) sized like PaperTrader.buy, funded best first like the live
+    OrderAllocator: by score, then volume ratio (its confidence follows from
+    the score; sentiment is not known point-in-time), ties in universe order.
+    Sentiment and P/E gates need point-in-time news/fundamentals and are
+    assumed to pass. Every threshold defaults to the live value.
+
+    Returns {'equity': Series (cash + open positions at their net sale value),
+    'trades': DataFrame of closed trades, 'positions': symbols still held at
+    the end, 'stats': dict}.
+    """
+    dates, symbols = inputs['dates'], inputs['symbols']
+    close, close_ffill, fee = inputs['close'], inputs['close_ffill'], inputs['fee_rate']
+    score = scores(inputs, rsi_low=rsi_low, rsi_high=rsi_high, rsi_overbought=rsi_overbought)
+    volume_ratio = inputs['volume_ratio']
+    entries = (score >= 2) & ~np.isnan(close) & (volume_ratio > vol_mult)
+    exit_params = dict(take_profit_pct=take_profit_pct, stop_loss_pct=stop_loss_pct,
+                       max_hold_days=max_hold_days, time_stop_min_pnl_pct=time_stop_min_pnl_pct)
+    n_days, n_symbols = close.shape
+
+    cash = float(initial_capital)
+    held = np.zeros(n_symbols, dtype=bool)
+    shares = np.zeros(n_symbols)
+    avg_price = np.zeros(n_symbols)
+    cost_basis = np.zeros(n_symbols)
+    entry_day = np.zeros(n_symbols, dtype='datetime64[D]')
+    equity = np.empty(n_days)
+    traded = 0.0  # buy cost + sell proceeds, for turnover
+    trades = []
+
+    for t in range(n_days):
+        price = close[t]
+
+        # 1. monitor_portfolio: exit rules across every held position with a bar today
+        idx = np.flatnonzero(held & ~np.isnan(price))
+        if idx.size:
+            pnl, pnl_percent = net_pnl(shares[idx], price[idx], fee[idx], cost_basis[idx])
+            days_held = (dates[t] - entry_day[idx]).astype(int)
+            codes = exit_codes(price[idx], avg_price[idx], pnl_percent, days_held, np.zeros(idx.size, dtype=bool), **exit_params)
+            for k in np.flatnonzero(codes != HOLD):
+                j = idx[k]
+                proceeds = shares[j] * price[j] * (1 - fee[j])
+                cash += proceeds
+                traded += proceeds
+                held[j] = False
+                trades.append((symbols[j], entry_day[j], dates[t], avg_price[j], price[j], shares[j], fee[j],
+                               pnl[k], pnl_percent[k], EXIT_REASONS[codes[k]]))
+
+        # 2. scan_batch: volume spike + BUY signal, not already held; best first (lexsort is stable)
+        candidates = np.flatnonzero(entries[t] & ~held)
+        candidates = candidates[np.lexsort((-volume_ratio[t, candidates], -score[t, candidates]))]
+        for j in candidates:
+            sized = size_buy(cash, price[j], fee[j], allocation_pct)
+            if sized is None:
+                if cash * allocation_pct < MIN_ALLOCATION:
+                    break  # Insufficient funds for anything else today
+                continue
+            shares[j], _, cost_basis[j] = sized
+            cash -= cost_basis[j]
+            traded += cost_basis[j]
+            avg_price[j] = price[j]
+            entry_day[j] = dates[t]
+            held[j] = True
+
+        equity[t] = cash + np.sum(shares[held] * close_ffill[t, held] * (1 - fee[held]))
+
+    trades = pd.DataFrame(trades, columns=['symbol', 'entry_date', 'exit_date', 'entry_price', 'exit_price',
+                                           'shares', 'fee_rate', 'pnl', 'pnl_percent', 'reason'])
+    equity = pd.Series(equity, index=pd.DatetimeIndex(dates), name='equity')
+    return {'equity': equity, 'trades': trades, 'positions': symbols[held].tolist(),
+            'stats': _stats(equity, trades, initial_capital, int(held.sum()), traded)}
+
+def _stats(equity, trades, initial_capital, open_positions, traded):
+    if equity.empty:
+        return {'final_equity': float(initial_capital), 'trades': 0}
+    returns = equity.pct_change().dropna()
+    years = max((equity.index[-1] - equity.index[0]).days / 365.25, 1 / 365.25)
+    drawdown = equity / equity.cummax() - 1
+    final = float(equity.iloc[-1])
+    return {
+        'final_equity': round(final, 2),
+        'total_return_pct': round((final / initial_capital - 1) * 100, 2),
+        'cagr_pct': round(((final / initial_capital) ** (1 / years) - 1) * 100, 2) if final > 0 else -100.0,
+        'max_drawdown_pct': round(float(drawdown.min()) * 100, 2),
+        'sharpe': round(float(returns.mean() / returns.std() * np.sqrt(252)), 2) if returns.std() > 0 else 0.0,
+        # Traded value (buys + sells) per year, as a multiple of the average equity
+        'turnover': round(float(traded / equity.mean() / years), 2) if equity.mean() > 0 else 0.0,
+        'trades': len(trades),
+        'win_rate_pct': round(float((trades['pnl'] > 0).mean()) * 100, 1) if len(trades) else 0.0,
+        'avg_pnl_pct': round(float(trades['pnl_percent'].mean()), 2) if len(trades) else 0.0,
+        'exits': trades['reason'].value_counts().to_dict(),
+        'open_positions': open_positions
+    }
+
+def run_backtest(closes: pd.DataFrame, volumes: pd.DataFrame, **params) -> dict:
+    """prepare() + simulate(); params are simulate()'s keyword arguments."""
+    return simulate(prepare(closes, volumes), **params)
+
+if __name__ == "__main__":
+    from core.bar_store import BARS_PATH, load_bars
+
+    parser = argparse.ArgumentParser(description="Backtest the 5-day swing strategy on the bar store")
+    parser.add_argument('--path', default=BARS_PATH)
+    parser.add_argument('--start')
+    parser.add_argument('--end')
+    parser.add_argument('--capital', type=float, default=INITIAL_CAPITAL)
+    parser.add_argument('--vol-mult', type=float, default=DEFAULT_VOL_MULT)
+    parser.add_argument('--trades-csv', help="Write closed trades here")
+    args = parser.parse_args()
+
+    closes, volumes = load_bars(args.path, start=args.start, end=args.end)
+    start = time.perf_counter()
+    result = run_backtest(closes, volumes, initial_capital=args.capital, vol_mult=args.vol_mult)
+    elapsed = time.perf_counter() - start
+    logger.info(f"Backtest: {closes.shape[1]} symbols x {closes.shape[0]} days in {elapsed:.2f}s")
+    for key, value in result['stats'].items():
+        print(f"{key:>18}: {value}")
+    print(f"({closes.shape[1]} symbols x {closes.shape[0]} days in {elapsed:.2f}s)")
+    if args.trades_csv:
+        result['trades'].to_csv(args.trades_csv, index=False)
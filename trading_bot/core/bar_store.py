@@ -0,0 +1,73 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+import yfinance as yf
+from core.config import TICKERS
+from core.logger import setup_logger
+
+logger = setup_logger("BarStore", "logs/bar_store.log")
+
+# Daily closes + volumes for the backtest universe, one compressed .npz file
+BARS_PATH = os.getenv("BARS_PATH", "data/bars/daily.npz")
+DOWNLOAD_CHUNK = 100
+
+def download_bars(tickers, period="5y", chunk=DOWNLOAD_CHUNK):
+    """Daily closes and volumes (dates x tickers DataFrames), chunked yf.download calls."""
+    closes, volumes = [], []
+    for i in range(0, len(tickers), chunk):
+        batch = tickers[i:i + chunk]
+        try:
+            data = yf.download(batch, period=period, interval="1d", group_by='ticker', progress=False, threads=True, auto_adjust=True)
+        except Exception as e:
+            logger.error(f"Download failed for {batch[0]}..{batch[-1]}: {e}")
+            continue
+        if data.empty:
+            continue
+        if isinstance(data.columns, pd.MultiIndex):
+            closes.append(data.xs('Close', axis=1, level=1))
+            volumes.append(data.xs('Volume', axis=1, level=1))
+        else:
+            closes.append(data[['Close']].set_axis(batch[:1], axis=1))
+            volumes.append(data[['Volume']].set_axis(batch[:1], axis=1))
+        logger.info(f"Downloaded {min(i + chunk, len(tickers))}/{len(tickers)} tickers")
+    if not closes:
+        return pd.DataFrame(), pd.DataFrame()
+    close = pd.concat(closes, axis=1).sort_index()
+    volume = pd.concat(volumes, axis=1).reindex(close.index)
+    # Drop tickers that returned nothing at all
+    keep = close.columns[close.notna().any()]
+    return close[keep], volume[keep]
+
+def save_bars(closes, volumes, path=BARS_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    np.savez_compressed(
+        path,
+        dates=closes.index.to_numpy(dtype='datetime64[D]'),
+        symbols=np.array(closes.columns, dtype=str),
+        close=closes.to_numpy(dtype=float),
+        volume=volumes.reindex_like(closes).to_numpy(dtype=float)
+    )
+
+def load_bars(path=BARS_PATH, tickers=None, start=None, end=None):
+    """(closes, volumes) DataFrames from the store, optionally limited to tickers / a date range."""
+    with np.load(path) as data:
+        index = pd.DatetimeIndex(data['dates'])
+        closes = pd.DataFrame(data['close'], index=index, columns=data['symbols'])
+        volumes = pd.DataFrame(data['volume'], index=index, columns=data['symbols'])
+    if tickers is not None:
+        tickers = [t for t in tickers if t in closes.columns]
+        closes, volumes = closes[tickers], volumes[tickers]
+    return closes.loc[start:end], volumes.loc[start:end]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download daily bars for the S&P 500 + TICKERS universe")
+    parser.add_argument('--period', default="5y")
+    parser.add_argument('--path', default=BARS_PATH)
+    args = parser.parse_args()
+
+    from core.market_scanner import MarketScanner
+    universe = list(dict.fromkeys(MarketScanner.get_sp500_tickers() + TICKERS))
+    closes, volumes = download_bars(universe, period=args.period)
+    save_bars(closes, volumes, args.path)
+    print(f"Saved {closes.shape[1]} tickers x {closes.shape[0]} days to {args.path}")
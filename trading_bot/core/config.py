@@ -8,6 +8,8 @@ load_dotenv()
 INDEX_URL = 'https://en.wikipedia.org/wiki/List_of_S%26P_500_companies'
 TICKERS = ['SHOP.TO', 'HUT.TO', 'BITF.TO', 'HIVE.TO', 'NVDA', 'COIN']
 CRYPTO_TICKERS = ['HUT.TO', 'BITF.TO', 'HIVE.TO', 'COIN', 'BTC-USD', 'ETH-USD']
+# Equities that trade as crypto proxies: one sector with CRYPTO_TICKERS for the risk limits
+CRYPTO_PROXIES = ['COIN', 'MSTR', 'MARA', 'RIOT', 'HUT.TO', 'BITF.TO', 'HIVE.TO']
 
 DEFAULT_SENTIMENT = 0.90
 DEFAULT_VOL_MULT = 1.2
@@ -17,4 +19,28 @@ STRICT_VOL_MULT = 3.0
 BATCH_SIZE = 100 
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 CHAT_ID = os.getenv('CHAT_ID')
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
+# Alerts are spaced this far apart (Telegram allows ~1 msg/sec per chat), and
+# everything queued within TELEGRAM_COALESCE_SECONDS of an alert goes out as one digest
+TELEGRAM_MIN_INTERVAL_SECONDS = 1.0
+TELEGRAM_COALESCE_SECONDS = 2.0
 CHECK_INTERVAL_SECONDS = 60 
+# One orchestrator cycle (scan + monitor) is expected to finish within this; /metrics exposes overruns
+CYCLE_BUDGET_SECONDS = 300
+# Prometheus /metrics endpoint of the orchestrator (port 0 disables it)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+# Held positions are re-quoted and checked against stops/targets this often (StopWatch)
+STOP_WATCH_INTERVAL_SECONDS = 15
+
+# Fundamentals (P/E) refresh: concurrent yfinance .info calls, request rate cap,
+# and how old a symbol's last attempt must be before the off-hours job retries it
+FUNDAMENTALS_FETCH_CONCURRENCY = 8
+FUNDAMENTALS_RATE_PER_SEC = 2.0
+FUNDAMENTALS_REFRESH_AFTER_HOURS = 20
+
+# Per-cycle span traces are appended here as JSON lines (unset: log the summary only)
+TRACE_FILE = os.getenv('TRACE_FILE')
+
+# Raw analysis_log rows older than this are rolled up into daily aggregates and archived
+ANALYSIS_RETENTION_DAYS = 30
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+# Strategy Targets (5-Day Sprint)
+TAKE_PROFIT_PCT = 5.0       # Universal Rule: Target +5% net (Speed is key)
+STOP_LOSS_PCT = 4.0         # SL: -4% below entry for Swing
+MAX_HOLD_DAYS = 5           # Time Stop (The 5-Day Rule)
+TIME_STOP_MIN_PNL_PCT = -2.0  # ...only cuts stagnant positions, not deep losers
+
+# exit_codes() values, in rule priority order
+HOLD, TAKE_PROFIT, TIME_STOP, STOP_LOSS, TECHNICAL = range(5)
+
+def net_pnl(shares, price, fee_rate, cost_basis):
+    """Hypothetical net P&L (and %) if sold now; the sell fee matches the buy fee."""
+    pnl = shares * price * (1 - fee_rate) - cost_basis
+    return pnl, pnl / cost_basis * 100
+
+def exit_codes(price, avg_price, pnl_percent, days_held, technical_sell,
+               take_profit_pct=TAKE_PROFIT_PCT, stop_loss_pct=STOP_LOSS_PCT,
+               max_hold_days=MAX_HOLD_DAYS, time_stop_min_pnl_pct=TIME_STOP_MIN_PNL_PCT):
+    """
+    The exit rules on plain arrays (one element per position). First match wins,
+    same order as the original per-position loop:
+      1. take profit:  net P&L >= +5%
+      2. time stop:    held >= 5 days -> sell if net P&L > -2%, otherwise hold
+      3. stop loss:    price < 96% of entry
+      4. technical:    technical_sell
+    Thresholds default to the live ones (overridden by backtests/sweeps).
+    Returns an int array of HOLD / TAKE_PROFIT / TIME_STOP / STOP_LOSS / TECHNICAL.
+    """
+    take_profit = pnl_percent >= take_profit_pct
+    timed_out = ~take_profit & (days_held >= max_hold_days)
+    time_stop = timed_out & (pnl_percent > time_stop_min_pnl_pct)
+    open_window = ~take_profit & ~timed_out
+    stop_loss = open_window & (price < avg_price * (1 - stop_loss_pct / 100))
+    technical = open_window & ~stop_loss & technical_sell
+    return np.select([take_profit, time_stop, stop_loss, technical], [TAKE_PROFIT, TIME_STOP, STOP_LOSS, TECHNICAL], HOLD)
+
+def evaluate_exits(positions, prices, signals=None, rsi=None, now=None):
+    """
+    Net P&L and every exit rule (see exit_codes) for all held positions at once.
+
+    positions: {symbol: position dict as kept by PaperTrader}
+    prices:    {symbol: latest price} (Series or dict); symbols without a price are skipped
+    signals / rsi: optional {symbol: technical signal / RSI} for the technical exit
+
+    Returns a DataFrame indexed by symbol with price, pnl, pnl_percent,
+    days_held, action ('SELL' / 'HOLD') and reason.
+    """
+    prices = pd.Series(prices, dtype=float)
+    symbols = [s for s in positions if s in prices.index and not np.isnan(prices[s])]
+    columns = ['price', 'pnl', 'pnl_percent', 'days_held', 'action', 'reason']
+    if not symbols:
+        return pd.DataFrame(columns=columns)
+
+    pos = [positions[s] for s in symbols]
+    price = prices[symbols].to_numpy()
+    shares = np.array([p['shares'] for p in pos], dtype=float)
+    avg_price = np.array([p['avg_price'] for p in pos], dtype=float)
+    fee_rate = np.array([p['fee_rate'] for p in pos], dtype=float)
+    cost_basis = np.array([p['cost_basis'] for p in pos], dtype=float)
+    entry = np.array([p['entry_date'] for p in pos], dtype='datetime64[us]')
+    now = np.datetime64(now or datetime.now(), 'us')
+
+    pnl, pnl_percent = net_pnl(shares, price, fee_rate, cost_basis)
+    price_drop_pct = (price - avg_price) / avg_price * 100
+    days_held = (now - entry) // np.timedelta64(1, 'D')
+
+    signal = pd.Series(signals if signals is not None else {}, dtype=object).reindex(symbols).to_numpy()
+    rsi_values = pd.Series(rsi if rsi is not None else {}, dtype=float).reindex(symbols).fillna(0.0).to_numpy()
+    codes = exit_codes(price, avg_price, pnl_percent, days_held, signal == 'SELL')
+
+    reason = np.full(len(symbols), '', dtype=object)
+    for i in np.flatnonzero(codes):
+        if codes[i] == TAKE_PROFIT:
+            reason[i] = f"🎯 Profit Target Hit (+{pnl_percent[i]:.1f}% Net)"
+        elif codes[i] == TIME_STOP:
+            reason[i] = f"⏳ 5-Day Sprint End (PnL: {pnl_percent[i]:.1f}%)"
+        elif codes[i] == STOP_LOSS:
+            reason[i] = f"🛑 Stop Loss Hit (Dropped {price_drop_pct[i]:.1f}%)"
+        else:
+            reason[i] = f"📉 Technical Breakdown (RSI: {rsi_values[i]:.1f})"
+
+    return pd.DataFrame({
+        'price': price,
+        'pnl': pnl,
+        'pnl_percent': pnl_percent,
+        'days_held': days_held,
+        'action': np.where(codes != HOLD, 'SELL', 'HOLD'),
+        'reason': reason
+    }, index=symbols)
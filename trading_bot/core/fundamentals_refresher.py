@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+import yfinance as yf
+import database_async as adb
+from core.config import (
+    CRYPTO_TICKERS, FUNDAMENTALS_FETCH_CONCURRENCY, FUNDAMENTALS_RATE_PER_SEC,
+    FUNDAMENTALS_REFRESH_AFTER_HOURS
+)
+from core.logger import setup_logger
+
+logger = setup_logger("FundamentalsRefresher", "logs/fundamentals_refresher.log")
+
+def fetch_pe(symbol):
+    """Forward (or trailing) P/E straight from yfinance. Slow; raises on API errors."""
+    info = yf.Ticker(symbol).info
+    return info.get('forwardPE') or info.get('trailingPE')
+
+def is_crypto(symbol):
+    return symbol in CRYPTO_TICKERS or '-USD' in symbol
+
+class FundamentalsRefresher:
+    """
+    Keeps cached P/E ratios warm so the intraday scan never calls Ticker.info.
+
+    Outside trading hours it walks the whole universe, stalest first, skipping
+    symbols attempted within refresh_after_hours; results are committed every
+    write_every symbols, so an interrupted run resumes where it stopped.
+    During the day it only fetches symbols the scanner reported as missing
+    (request()), in the background.
+    """
+
+    def __init__(self, rate_per_sec=FUNDAMENTALS_RATE_PER_SEC, concurrency=FUNDAMENTALS_FETCH_CONCURRENCY,
+                 refresh_after_hours=FUNDAMENTALS_REFRESH_AFTER_HOURS, write_every=50, fetch=fetch_pe):
+        self.interval = 1.0 / rate_per_sec
+        self.concurrency = concurrency
+        self.refresh_after_hours = refresh_after_hours
+        self.write_every = write_every
+        self.fetch = fetch
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def request(self, symbols):
+        """Queues cache misses for a background fetch. Thread-safe, never blocks."""
+        symbols = [s for s in symbols if not is_crypto(s)]
+        if symbols:
+            with self._pending_lock:
+                self._pending.update(symbols)
+
+    async def _throttle(self):
+        # Spaces request starts by self.interval across all workers
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def refresh(self, symbols):
+        """
+        Fetches P/E for every symbol not attempted within refresh_after_hours.
+        Returns {'due', 'ok', 'no_data', 'error', 'seconds'}.
+        """
+        start = time.monotonic()
+        symbols = [s for s in dict.fromkeys(symbols) if not is_crypto(s)]
+        due = await adb.get_fundamentals_due(symbols, self.refresh_after_hours)
+        stats = {'due': len(due), 'ok': 0, 'no_data': 0, 'error': 0}
+        if not due:
+            stats['seconds'] = 0.0
+            return stats
+
+        queue = asyncio.Queue()
+        for symbol in due:
+            queue.put_nowait(symbol)
+        found, failed = {}, {}
+
+        async def flush():
+            batch, failures = dict(found), dict(failed)
+            found.clear()
+            failed.clear()
+            await adb.set_fundamentals_many(batch)
+            await adb.record_fundamental_failures(failures)
+
+        async def worker():
+            while True:
+                try:
+                    symbol = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await self._throttle()
+                try:
+                    pe = await asyncio.to_thread(self.fetch, symbol)
+                    status = 'ok' if pe is not None else 'no_data'
+                except Exception as e:
+                    logger.debug(f"P/E fetch failed for {symbol}: {e}")
+                    pe, status = None, 'error'
+                stats[status] += 1
+                if pe is not None:
+                    found[symbol] = pe
+                else:
+                    failed[symbol] = status
+                if len(found) + len(failed) >= self.write_every:
+                    await flush()
+
+        await asyncio.gather(*[worker() for _ in range(min(self.concurrency, len(due)))])
+        await flush()
+        stats['seconds'] = round(time.monotonic() - start, 1)
+        return stats
+
+    async def drain_requests(self):
+        """Fetches everything queued by request() since the last drain."""
+        with self._pending_lock:
+            symbols, self._pending = list(self._pending), set()
+        if not symbols:
+            return None
+        # Symbols with no P/E at all (ETFs, loss-makers) were attempted recently and are skipped
+        return await self.refresh(symbols)
+
+    async def run(self, get_universe, is_trading_hours, universe_interval=600, poll_interval=30):
+        """
+        Scheduler loop. get_universe: async callable returning the symbol list;
+        is_trading_hours: callable gating the full-universe refresh, which is
+        checked every universe_interval seconds. Requested misses are picked up
+        every poll_interval seconds.
+        """
+        last_universe_check = 0.0
+        while True:
+            try:
+                if not is_trading_hours() and time.monotonic() - last_universe_check >= universe_interval:
+                    last_universe_check = time.monotonic()
+                    stats = await self.refresh(await get_universe())
+                    if stats['due']:
+                        logger.info(f"🌙 Fundamentals refresh: {stats}. Freshness: {await adb.get_fundamentals_freshness()}")
+                stats = await self.drain_requests()
+                if stats and stats['due']:
+                    logger.info(f"Fetched requested fundamentals: {stats}")
+            except Exception as e:
+                logger.error(f"Fundamentals refresh failed: {e}")
+            await asyncio.sleep(poll_interval)
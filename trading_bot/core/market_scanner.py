@@ -1,39 +1,61 @@
 
 import logging
 import asyncio
+from io import StringIO
 import yfinance as yf
 import pandas as pd
 import requests
 import database as db
+import database_async as adb
 from technical_analyst import TechnicalAnalyst
 from core.config import INDEX_URL, DEFAULT_SENTIMENT, DEFAULT_VOL_MULT, STRICT_SENTIMENT, STRICT_VOL_MULT, CRYPTO_TICKERS
 from core.sentiment import SentimentAnalyzer
 from core.trade_executor import TradeExecutor
 from core.news_fetcher import NewsFetcher
+from core.fundamentals_refresher import FundamentalsRefresher, is_crypto
+from core.tracing import span, traced
+from core.metrics import metrics
 from core.logger import setup_logger
 
 logger = setup_logger("MarketScanner", "logs/market_scanner.log")
 
+# TechnicalAnalyst signals that may be bought (the backtester enters on the same: score >= 2)
+BUY_SIGNALS = ('BUY', 'STRONG_BUY')
+
 class MarketScanner:
     def __init__(self, trade_executor: TradeExecutor):
         self.trade_executor = trade_executor
         self.sentiment_analyzer = SentimentAnalyzer()
+        self.fundamentals_refresher = FundamentalsRefresher()
+
+    @staticmethod
+    def _fetch_sp500_table():
+        """The S&P 500 constituents table (Symbol, GICS Sector, ...) from INDEX_URL."""
+        # TODO: Convert to async with aiohttp?
+        headers = {"User-Agent": "Mozilla/5.0"}
+        r = requests.get(INDEX_URL, headers=headers)
+        r.raise_for_status()
+        df = pd.read_html(StringIO(r.text))[0]  # pandas 3 no longer takes literal HTML
+        df['Symbol'] = [t.replace('.', '-') for t in df['Symbol']]
+        return df
 
-    def get_sp500_tickers(self):
+    @staticmethod
+    def get_sp500_tickers():
         try:
-            # TODO: Convert to async with aiohttp?
-            headers = {"User-Agent": "Mozilla/5.0"}
-            r = requests.get(INDEX_URL, headers=headers)
-            r.raise_for_status()
-            tables = pd.read_html(r.text)
-            df = tables[0]
-            tickers = df['Symbol'].tolist()
-            return [t.replace('.', '-') for t in tickers]
+            return MarketScanner._fetch_sp500_table()['Symbol'].tolist()
         except Exception as e:
             logger.error(f"Failed to fetch S&P 500: {e}")
             return []
 
-
+    @staticmethod
+    def get_sp500_sectors():
+        """{ticker: GICS sector} for the S&P 500 (risk engine sector limits)."""
+        try:
+            df = MarketScanner._fetch_sp500_table()
+            return dict(zip(df['Symbol'], df['GICS Sector']))
+        except Exception as e:
+            logger.error(f"Failed to fetch S&P 500 sectors: {e}")
+            return {}
 
     async def get_movers(self, tickers):
         """
@@ -90,37 +112,64 @@ class MarketScanner:
 
 
 
+    @traced("scanner.news")
     def get_symbol_news(self, symbol):
         return NewsFetcher.get_news(symbol)
 
+    @traced("scanner.fundamentals")
     def get_fundamentals(self, symbol):
-        # 1. Check Cache
+        # Cache only: P/E is refreshed off-hours by FundamentalsRefresher, and a
+        # miss is fetched in the background rather than blocking the scan
         cached_pe = db.get_fundamental(symbol)
-        if cached_pe is not None:
-            return cached_pe
+        if cached_pe is None:
+            self.fundamentals_refresher.request([symbol])
+        return cached_pe
 
-        # 2. Fetch API
-        try:
-            ticker = yf.Ticker(symbol)
-            info = ticker.info
-            pe = info.get('forwardPE') or info.get('trailingPE')
-            
-            # 3. Save Cache
-            if pe is not None:
-                db.set_fundamental(symbol, pe)
-                
-            return pe
-        except Exception:
-            return None
+    @traced("scanner.fundamentals_batch")
+    async def get_fundamentals_many(self, symbols):
+        """
+        Batch version of get_fundamentals: one IN query for cached P/E values.
+        Returns {symbol: pe_ratio or None}; misses are queued for the refresher.
+        """
+        result = dict.fromkeys(symbols)
+        if not symbols:
+            return result
+        result.update(await adb.get_fundamentals_many(symbols))
+
+        misses = [s for s, pe in result.items() if pe is None]
+        if misses:
+            self.fundamentals_refresher.request(misses)
+            logger.info(f"Fundamentals: {len(symbols) - len(misses)} cached, {len(misses)} missing (queued for refresh).")
+        return result
+
+    @staticmethod
+    def is_crypto(symbol):
+        return is_crypto(symbol)
 
-    async def process_candidate(self, symbol, curr_vol, avg_vol, sent_thresh, market_bias):
+    @staticmethod
+    def _gate(gate, passed):
+        metrics.inc("gate_candidates_total", gate=gate, result="pass" if passed else "reject")
+
+    @staticmethod
+    @traced("scanner.fundamentals")
+    async def _prefetched_pe(fundamentals, symbol):
+        return (await fundamentals).get(symbol)
+
+    async def process_candidate(self, symbol, curr_vol, avg_vol, sent_thresh, market_bias, fundamentals=None):
+        """
+        `fundamentals` is an optional awaitable (shared by the whole batch) that
+        resolves to {symbol: pe_ratio}; without it the P/E is looked up alone.
+        """
         try:
             # V2 ARCHITECTURE: Parallel Analysis (Async)
             # We launch ALL checks simultaneously to reduce latency
             
             # 1. Define Tasks
             news_task = asyncio.to_thread(self.get_symbol_news, symbol)
-            fund_task = asyncio.to_thread(self.get_fundamentals, symbol)
+            if fundamentals is not None:
+                fund_task = self._prefetched_pe(fundamentals, symbol)
+            else:
+                fund_task = asyncio.to_thread(self.get_fundamentals, symbol)
             
             # Initialize Technical Analyst
             stock_analyst = TechnicalAnalyst(symbol)
@@ -133,7 +182,8 @@ class MarketScanner:
             
             # 3. Calculate Scores
             volume_ratio = curr_vol / avg_vol if avg_vol > 0 else 0
-            sentiment_score = self.sentiment_analyzer.analyze(headlines)
+            with span("scanner.sentiment", symbol=symbol):
+                sentiment_score = self.sentiment_analyzer.analyze(headlines)
             
             meta = {
                 'curr_vol': curr_vol,
@@ -148,12 +198,13 @@ class MarketScanner:
             # 4. "Gatekeeper" Logic (Aggregated Decision)
             
             # Gate 1: Sentiment
+            self._gate('sentiment', sentiment_score >= sent_thresh)
             if sentiment_score < sent_thresh:
                 await self.trade_executor.log_rejection(symbol, None, f'Low sentiment ({sentiment_score:.2f} < {sent_thresh})', meta)
                 return 
 
             # Gate 2: Fundamentals (Relaxed for Swing & Crypto)
-            is_crypto = symbol in CRYPTO_TICKERS or '-USD' in symbol
+            is_crypto = self.is_crypto(symbol)
 
             if not is_crypto:
                 # P/E limit raised to 150 to catch Tech high-flyers (NVDA, TSLA)
@@ -162,23 +213,27 @@ class MarketScanner:
                     is_momentum = (ta_result['signal'] == 'STRONG_BUY') or (volume_ratio > 3.0)
                     
                     if not is_momentum:
+                        self._gate('valuation', False)
                         await self.trade_executor.log_rejection(symbol, None, f'Extreme Valuation (P/E {pe_ratio:.1f} > 150) & No Momentum', meta)
                         return
                     else:
                          logger.info(f"🚀 MOMENTUM EXCEPTION: {symbol} passed with P/E {pe_ratio} due to Strong Technicals/Volume.")
             
+            self._gate('valuation', True)
+
             # Gate 3: Technicals
-            if ta_result['signal'] == 'SELL':
+            # Only enter on a BUY (trend + momentum); HOLD covers downtrends and the overbought kill switch
+            is_buy = ta_result['signal'] in BUY_SIGNALS
+            self._gate('technical', is_buy)
+            if not is_buy:
                  # Even with great news, do not catch a falling knife
-                 await self.trade_executor.log_rejection(symbol, 'SELL', 'Technical signal is SELL (Downtrend/Overbought)', {**meta, 'price': ta_result.get('latest_price')})
+                 await self.trade_executor.log_rejection(symbol, ta_result['signal'], f"Technical signal is {ta_result['signal']} (No trend/momentum or overbought)", {**meta, 'price': ta_result.get('latest_price')})
                  return 
             
-            # Gate 4: Sector Correlation (Basic Implementation)
-            # If Crypto stock, check if Bitcoin is crashing
-            # This is a placeholder for refined logic
-            if symbol in ['COIN', 'MSTR', 'MARA', 'RIOT', 'HUT.TO', 'BITF.TO']:
-                # TODO: formatting check for sector health
-                pass
+            # Gate 4: Portfolio risk (exposure, sector, correlation with holdings)
+            # depends on what else gets funded, so the RiskEngine checks it when
+            # the allocator funds the batch; it reuses the closes analysed here
+            meta['closes'] = stock_analyst.closes
 
             logger.info(f"✅ CANDIDATE PASSED: {symbol} (Sent: {sentiment_score:.2f}, Vol: {volume_ratio:.1f}x)")
             
@@ -190,6 +245,10 @@ class MarketScanner:
             logger.error(f"Error processing {symbol}: {e}")
             return None
 
+    async def _traced_candidate(self, symbol, *args):
+        with span("scanner.candidate", symbol=symbol):
+            return await self.process_candidate(symbol, *args)
+
     async def scan_batch(self, tickers, market_bias="NEUTRAL"):
         if not tickers: return
         
@@ -203,7 +262,13 @@ class MarketScanner:
 
         logger.info(f"Scanning Watchlist ({len(tickers)})...")
         try:
-            data = await asyncio.to_thread(yf.download, tickers, period="5d", interval="1d", group_by='ticker', progress=False, threads=True)
+            with span("scanner.download", tickers=len(tickers)):
+                try:
+                    data = await asyncio.to_thread(yf.download, tickers, period="5d", interval="1d", group_by='ticker', progress=False, threads=True)
+                except Exception:
+                    metrics.inc("yfinance_errors_total", call="scan_batch")
+                    raise
+            metrics.inc("symbols_scanned_total", len(tickers))
             
             candidates = []
             for symbol in tickers:
@@ -224,11 +289,13 @@ class MarketScanner:
                 except Exception: continue
 
             logger.info(f"Batch: {len(candidates)} movers.")
+            metrics.inc("gate_candidates_total", len(candidates), gate="volume", result="pass")
+            metrics.inc("gate_candidates_total", len(tickers) - len(candidates), gate="volume", result="reject")
             
             # LOGGING FIX: Record heartbeats even if 0 movers
             if not candidates:
                  # Log a "SCAN" event so Decision Log isn't empty
-                 await asyncio.to_thread(db.log_analysis,
+                 self.trade_executor.analysis_writer.submit(
                     symbol="MARKET",
                     volume_ratio=0.0,
                     sentiment_score=0.0,
@@ -244,15 +311,21 @@ class MarketScanner:
                 positions = self.trade_executor.trader.positions
                 valid_candidates = [c for c in candidates if c[0] not in positions]
                 
+                # One prefetch for the batch; candidates start news/TA while it runs
+                fundamentals = asyncio.ensure_future(self.get_fundamentals_many([c[0] for c in valid_candidates]))
+
                 tasks = []
                 for symbol, curr_vol, avg_vol in valid_candidates:
-                    tasks.append(self.process_candidate(symbol, curr_vol, avg_vol, sent_thresh, market_bias))
+                    tasks.append(self._traced_candidate(symbol, curr_vol, avg_vol, sent_thresh, market_bias, fundamentals))
                 
                 if tasks:
-                    results = await asyncio.gather(*tasks)
+                    # Analysis runs fully in parallel; passing candidates only queue an order intent
+                    await asyncio.gather(*tasks)
+                    # ...then one allocator pass ranks them, reserves funds and fills them in one commit
+                    results = await self.trade_executor.execute_pending_orders()
                     
                     # Process Results for Notification Batching
-                    skipped = [r for r in results if r and r.get('status') == 'SKIPPED']
+                    skipped = [r for r in results if r and r.get('status') == 'SIGNAL_SENT']
                     
                     if skipped:
                         # Send Consolidated Summary
@@ -0,0 +1,151 @@
+import asyncio
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from core.config import METRICS_HOST, METRICS_PORT
+from core.tracing import tracer
+from core.logger import setup_logger
+
+logger = setup_logger("Metrics", "logs/metrics.log")
+
+PREFIX = "trading_bot"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HELP = {
+    'span_duration_seconds': "Duration of traced stages (see core/tracing.py), by span name.",
+    'symbols_scanned_total': "Tickers covered by scan_batch volume screens.",
+    'gate_candidates_total': "Candidates passing/rejected at each scanner gate.",
+    'yfinance_errors_total': "yfinance calls that raised, by call site.",
+    'event_loop_lag_seconds': "How late the last event-loop probe woke up.",
+    'cycle_budget_seconds': "Time one orchestrator cycle is expected to fit in.",
+    'cycle_running_seconds': "Age of the cycle in progress (0 between cycles).",
+    'cycle_overruns_total': "Cycles that took longer than the budget.",
+}
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+def _number(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "NaN"
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metrics:
+    """
+    Process-wide metrics in Prometheus' text format.
+
+    Counters (name ending in _total) and gauges are kept here; span
+    durations come from the tracer's histograms, and collectors registered
+    with register() report point-in-time gauges (queue depths, pool use) as
+    (name, labels, value) when scraped. Thread-safe: scan code updates
+    counters on the event loop and in worker threads while the HTTP server
+    renders from its own thread.
+    """
+
+    def __init__(self, prefix=PREFIX, tracer=tracer):
+        self.prefix = prefix
+        self.tracer = tracer
+        self.values = {}  # (name, sorted label items) -> value
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def get(self, name, **labels):
+        return self.values.get((name, tuple(sorted(labels.items()))), 0)
+
+    def register(self, collector):
+        """collector() -> iterable of (name, labels dict, value), called on every scrape."""
+        self.collectors.append(collector)
+
+    def _samples(self):
+        with self._lock:
+            samples = [(name, dict(labels), value) for (name, labels), value in self.values.items()]
+        for collector in self.collectors:
+            try:
+                samples.extend(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+        return samples
+
+    def render(self):
+        families = {}
+        for name, labels, value in self._samples():
+            families.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name in sorted(families):
+            full = f"{self.prefix}_{name}"
+            if name in HELP:
+                lines.append(f"# HELP {full} {HELP[name]}")
+            lines.append(f"# TYPE {full} {'counter' if name.endswith('_total') else 'gauge'}")
+            for labels, value in families[name]:
+                lines.append(f"{full}{_labels(labels)} {_number(value)}")
+
+        full = f"{self.prefix}_span_duration_seconds"
+        lines.append(f"# HELP {full} {HELP['span_duration_seconds']}")
+        lines.append(f"# TYPE {full} histogram")
+        for span_name, (bounds, counts, total, count) in sorted(self.tracer.histograms_copy().items()):
+            cumulative = 0
+            for bound, n in zip([*bounds, math.inf], counts):
+                cumulative += n
+                lines.append(f"{full}_bucket{_labels({'span': span_name, 'le': _number(bound)})} {cumulative}")
+            lines.append(f"{full}_sum{_labels({'span': span_name})} {_number(total)}")
+            lines.append(f"{full}_count{_labels({'span': span_name})} {count}")
+        return "\n".join(lines) + "\n"
+
+    def start_server(self, host=METRICS_HOST, port=METRICS_PORT):
+        """Serves GET /metrics from a daemon thread. Returns the server (None if disabled or it failed)."""
+        if not port:
+            return None
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            logger.error(f"Metrics endpoint not started on {host}:{port}: {e}")
+            return None
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="MetricsServer", daemon=True).start()
+        logger.info(f"📈 Metrics on http://{host}:{server.server_port}/metrics")
+        return server
+
+    async def watch_event_loop(self, interval=1.0):
+        """Samples event-loop lag: how much later than asked a sleep(interval) wakes up."""
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(interval)
+            lag = max(0.0, time.monotonic() - start - interval)
+            self.set("event_loop_lag_seconds", lag)
+            self.tracer.observe("event_loop.lag", lag)
+
+# Process-wide registry shared by every module
+metrics = Metrics()
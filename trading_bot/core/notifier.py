@@ -0,0 +1,251 @@
+import asyncio
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from core.config import (
+    TELEGRAM_TOKEN, CHAT_ID, TELEGRAM_API_URL, TELEGRAM_MIN_INTERVAL_SECONDS, TELEGRAM_COALESCE_SECONDS
+)
+from core.logger import setup_logger
+
+logger = setup_logger("Notifier", "logs/notifier.log")
+
+MAX_MESSAGE_CHARS = 4096  # Telegram's limit per sendMessage
+DIGEST_SEPARATOR = "\n\n---\n\n"
+MARKDOWN_SPECIAL = "_*`["
+
+# Outcomes of _deliver()
+SENT, REJECTED, FAILED = "sent", "rejected", "failed"
+
+def escape_markdown(text):
+    """Escapes external text (headlines, etc.) for Telegram's legacy Markdown."""
+    return "".join(f"\\{c}" if c in MARKDOWN_SPECIAL else c for c in str(text))
+
+class TelegramNotifier:
+    """
+    Non-blocking Telegram alerts.
+
+    send() returns immediately: messages go into a bounded queue drained by a
+    single worker task on the running event loop. The worker posts through one
+    pooled requests.Session (off the loop, in a thread), spaces messages by
+    min_interval (Telegram allows about one per second per chat), honours
+    429 retry_after and retries network/5xx errors with exponential backoff.
+    With coalesce_window set, everything queued within that many seconds of
+    the first message (e.g. the alerts of one scan batch) goes out as one
+    digest, split only where Telegram's size limit requires it. A digest
+    Telegram rejects (400: usually Markdown it can't parse) is resent one
+    alert at a time, and an alert rejected on its own is sent once more as
+    plain text, so one malformed alert can't take the rest down with it.
+    When the queue is full, new messages are dropped and counted.
+    """
+
+    def __init__(self, token=TELEGRAM_TOKEN, chat_id=CHAT_ID, api_url=TELEGRAM_API_URL,
+                 min_interval=TELEGRAM_MIN_INTERVAL_SECONDS, coalesce_window=TELEGRAM_COALESCE_SECONDS,
+                 max_queue=500, max_retries=3, backoff=1.0, timeout=10):
+        self.url = f"{api_url.rstrip('/')}/bot{token}/sendMessage"
+        self.enabled = bool(token and chat_id)
+        self.chat_id = chat_id
+        self.min_interval = min_interval
+        self.coalesce_window = coalesce_window
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self._queue = None
+        self._task = None
+        self._loop = None
+        self._next_slot = 0.0
+
+        self.enqueued = 0
+        self.sent = 0
+        self.digests = 0
+        self.retries = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def _ensure_worker(self, loop):
+        # One worker per event loop; a new loop (restart, tests) gets a fresh queue
+        if self._loop is not loop or self._task is None or self._task.done():
+            if self._queue is not None and self._loop is not loop and not self._queue.empty():
+                logger.warning(f"Dropping {self._queue.qsize()} alerts queued on a closed event loop")
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = loop.create_task(self._run(), name="TelegramNotifier")
+
+    def send(self, message):
+        """Queues an alert. Never blocks the event loop; returns False if it was skipped or dropped."""
+        if not self.enabled:
+            logger.warning("Telegram token or Chat ID missing. Alert skipped.")
+            return False
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Called outside the event loop (scripts): nothing to stall, post right away
+            return self._deliver_blocking(message)
+
+        self._ensure_worker(loop)
+        try:
+            self._queue.put_nowait(message)
+            self.enqueued += 1
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def flush(self):
+        """Waits until everything queued so far has been delivered (or given up on)."""
+        if self._queue is not None and self._loop is asyncio.get_running_loop():
+            await self._queue.join()
+
+    async def stop(self):
+        """Flushes the queue, then stops the worker."""
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        logger.info(f"Notifier stopped. {self.stats()}")
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'enqueued': self.enqueued,
+            'sent': self.sent,
+            'digests': self.digests,
+            'retries': self.retries,
+            'dropped': self.dropped,
+            'failed': self.failed
+        }
+
+    def _drain(self):
+        messages = []
+        while not self._queue.empty():
+            messages.append(self._queue.get_nowait())
+        return messages
+
+    @staticmethod
+    def batches(messages, limit=MAX_MESSAGE_CHARS):
+        """Groups messages, in order, into as few batches as fit the size limit once joined."""
+        batches, current, size = [], [], 0
+        for message in messages:
+            added = len(message) + (len(DIGEST_SEPARATOR) if current else 0)
+            if current and size + added > limit:
+                batches.append(current)
+                current, size = [], 0
+                added = len(message)
+            current.append(message)
+            size += added
+        if current:
+            batches.append(current)
+        return batches
+
+    @classmethod
+    def digest(cls, messages, limit=MAX_MESSAGE_CHARS):
+        """Joins messages into as few texts as fit the size limit, in order."""
+        return [DIGEST_SEPARATOR.join(batch) for batch in cls.batches(messages, limit)]
+
+    async def _throttle(self):
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.min_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _run(self):
+        while True:
+            messages = [await self._queue.get()]
+            try:
+                if self.coalesce_window:
+                    await asyncio.sleep(self.coalesce_window)
+                    messages += self._drain()
+                    batches = self.batches(messages)
+                    if len(batches) < len(messages):
+                        self.digests += 1
+                else:
+                    batches = [[message] for message in messages]
+                for batch in batches:
+                    await self._send(batch)
+            except Exception as e:
+                logger.error(f"Notifier worker error: {e}")
+            finally:
+                for _ in messages:
+                    self._queue.task_done()
+
+    async def _send(self, batch):
+        """Delivers one digest; if Telegram rejects it, falls back to each alert on its own."""
+        await self._throttle()
+        outcome = await self._deliver(DIGEST_SEPARATOR.join(batch))
+        if outcome != REJECTED:
+            return
+        if len(batch) > 1:
+            logger.warning(f"Digest of {len(batch)} alerts rejected; sending them one by one")
+            for message in batch:
+                await self._send([message])
+            return
+        await self._throttle()
+        if await self._deliver(batch[0], markdown=False) == REJECTED:
+            self.failed += 1
+            logger.error(f"Alert dropped, rejected even as plain text: {batch[0][:200]!r}")
+
+    def _post(self, text, markdown=True):
+        payload = {"chat_id": self.chat_id, "text": text}
+        if markdown:
+            payload["parse_mode"] = "Markdown"
+        return self.session.post(self.url, json=payload, timeout=self.timeout)
+
+    @staticmethod
+    def _retry_after(response):
+        try:
+            return response.json().get('parameters', {}).get('retry_after')
+        except ValueError:
+            return None
+
+    async def _deliver(self, text, markdown=True):
+        """
+        Posts one text, retrying 429/5xx/network errors. Returns SENT, REJECTED
+        (any other 4xx: resending the same text won't help; the caller decides)
+        or FAILED once retries run out.
+        """
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                response = await asyncio.to_thread(self._post, text, markdown)
+            except requests.RequestException as e:
+                error = str(e)
+            else:
+                if response.ok:
+                    self.sent += 1
+                    return SENT
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+                if response.status_code == 429:
+                    retry_after = self._retry_after(response)
+                elif response.status_code < 500:
+                    logger.warning(f"Alert rejected ({error})")
+                    return REJECTED
+            if attempt == self.max_retries:
+                break
+            self.retries += 1
+            delay = retry_after if retry_after is not None else self.backoff * 2 ** attempt
+            logger.warning(f"Alert failed ({error}); retry {attempt + 1}/{self.max_retries} in {delay}s")
+            await asyncio.sleep(delay)
+            # Keep the spacing after a rate-limit pause too
+            self._next_slot = max(self._next_slot, time.monotonic() + self.min_interval)
+        self.failed += 1
+        logger.error(f"Failed to send alert: {error}")
+        return FAILED
+
+    def _deliver_blocking(self, text):
+        try:
+            response = self._post(text)
+            if 400 <= response.status_code < 500 and response.status_code != 429:
+                response = self._post(text, markdown=False)
+            if response.ok:
+                self.sent += 1
+                return True
+            logger.error(f"Failed to send alert: HTTP {response.status_code}")
+        except Exception as e:
+            logger.error(f"Failed to send alert: {e}")
+        self.failed += 1
+        return False
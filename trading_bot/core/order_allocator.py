@@ -0,0 +1,86 @@
+import asyncio
+from datetime import datetime
+from core.risk_engine import REJECT
+from core.logger import setup_logger
+
+logger = setup_logger("OrderAllocator", "logs/order_allocator.log")
+
+CONFIDENCE_RANK = {'High': 2, 'Medium': 1, 'Low': 0}
+
+def order_intent(symbol, ta_result, meta):
+    """A candidate's request to buy `symbol` at the analysed price."""
+    return {
+        'symbol': symbol,
+        'price': ta_result['latest_price'],
+        'score': ta_result.get('score', 0),
+        'confidence': ta_result.get('confidence', 'Low'),
+        'ta_result': ta_result,
+        'meta': meta,
+        'submitted_at': datetime.now()
+    }
+
+def _priority(intent):
+    meta = intent['meta']
+    return (intent['score'], CONFIDENCE_RANK.get(intent['confidence'], 0),
+            meta.get('sentiment_score', 0), meta.get('volume_ratio', 0))
+
+class OrderAllocator:
+    """
+    Single consumer of the buy intents emitted by concurrently analysed
+    candidates. execute() ranks everything queued since the last call (best
+    technical score, then confidence, sentiment and volume spike), passes them
+    through the risk engine (if any), reserves funds in that order from the
+    trader's cash and commits all fills in one transaction, so the outcome no
+    longer depends on which analysis finished first.
+    """
+
+    def __init__(self, trader, risk_engine=None):
+        self.trader = trader
+        self.risk_engine = risk_engine
+        self.queue = asyncio.Queue()
+        self._lock = asyncio.Lock()
+
+    def submit(self, intent):
+        self.queue.put_nowait(intent)
+
+    def _drain(self):
+        intents = []
+        while not self.queue.empty():
+            intents.append(self.queue.get_nowait())
+        return intents
+
+    @staticmethod
+    def rank(intents):
+        """Best-first, one intent per symbol (the best one)."""
+        best = {}
+        for intent in sorted(intents, key=_priority, reverse=True):
+            best.setdefault(intent['symbol'], intent)
+        return list(best.values())
+
+    def review(self, intents):
+        """Attaches the risk decision to each intent (intent['risk']); returns the orders to fund."""
+        if self.risk_engine is None:
+            return [(i['symbol'], i['price']) for i in intents]
+        self.risk_engine.observe({i['symbol']: i['meta'].get('closes') for i in intents})
+        orders = []
+        for intent, decision in self.risk_engine.review(intents, self.trader.balance, self.trader.position_values()):
+            intent['risk'] = decision
+            if decision['action'] != REJECT:
+                orders.append((intent['symbol'], intent['price'], decision['max_cost']))
+        return orders
+
+    async def execute(self):
+        """Returns [(intent, receipt or None)] in priority order for everything queued."""
+        async with self._lock:
+            intents = self.rank(self._drain())
+            if not intents:
+                return []
+            orders = self.review(intents)
+            receipts = await self.trader.buy_many_async(orders)
+            if receipts is None:
+                # Portfolio changed underneath us: the trader resynced, plan once more
+                logger.warning(f"Batch of {len(orders)} buys rejected (portfolio changed); retrying.")
+                receipts = await self.trader.buy_many_async(orders) or []
+            by_symbol = {r['symbol']: r for r in receipts}
+            logger.info(f"Allocated {len(by_symbol)}/{len(intents)} buy intents in one batch.")
+            return [(intent, by_symbol.get(intent['symbol'])) for intent in intents]
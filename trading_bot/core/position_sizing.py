@@ -0,0 +1,38 @@
+# PaperTrader's fee model and position sizing, free of DB imports so the
+# backtester (and its worker processes) can use them directly.
+INITIAL_CAPITAL = 360.0 
+TRADE_ALLOCATION = 0.20 
+MIN_ALLOCATION = 50.0
+
+def fee_rate_for(symbol):
+    """
+    Wealthsimple Logic:
+    - TSX Stocks (.TO): 0.0 (Free)
+    - US Stocks (Others): 0.015 (1.5% FX Fee)
+    """
+    if symbol.endswith('.TO'):
+        return 0.0
+    return 0.015
+
+def size_buy(balance, price, fee_rate, allocation_pct=TRADE_ALLOCATION, max_allocation=None):
+    """
+    Shares, cost per share (incl. fee) and total cost of a new position, or
+    None if too small. max_allocation caps the spend (risk engine resize).
+    """
+    # Allocation Logic
+    allocation = balance * allocation_pct
+    if max_allocation is not None:
+        allocation = min(allocation, max_allocation)
+    if allocation < MIN_ALLOCATION:
+        return None
+
+    # Cost per share = Price * (1 + Fee)
+    cost_per_share = price * (1 + fee_rate)
+
+    # FRACTIONAL SHARES SUPPORT (Crypto/High-Priced Stocks)
+    raw_shares = allocation / cost_per_share
+    shares = round(raw_shares, 4) # 4 decimal places
+
+    if shares <= 0:
+        return None
+    return shares, cost_per_share, shares * cost_per_share
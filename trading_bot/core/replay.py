@@ -0,0 +1,233 @@
+import gzip
+import pickle
+import threading
+import time
+from types import SimpleNamespace
+import requests
+import yfinance as yf
+from core.logger import setup_logger
+
+logger = setup_logger("Replay", "logs/replay.log")
+
+ARCHIVE_VERSION = 1
+
+class ReplayMiss(LookupError):
+    """A call the archive has no response for."""
+
+class ReplayError(Exception):
+    """Replays an exception the live call raised while recording."""
+
+def _completion(response):
+    # LLM responses are archived as the two fields the bot reads
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=response.choices[0].message.content))],
+        usage=SimpleNamespace(total_tokens=getattr(getattr(response, 'usage', None), 'total_tokens', 0))
+    )
+
+class _Ticker:
+    """yf.Ticker stand-in: info, news and history() go through the session."""
+
+    def __init__(self, session, real_ticker, symbol, *args, **kwargs):
+        self._session = session
+        self._symbol = symbol
+        self._real = None
+        self._make_real = lambda: real_ticker(symbol, *args, **kwargs)
+
+    def _live(self):
+        if self._real is None:
+            self._real = self._make_real()
+        return self._real
+
+    @property
+    def info(self):
+        return self._session.call(('yf.info', self._symbol), lambda: self._live().info)
+
+    @property
+    def news(self):
+        return self._session.call(('yf.news', self._symbol), lambda: self._live().news)
+
+    def history(self, *args, **kwargs):
+        key = ('yf.history', self._symbol, args, tuple(sorted(kwargs.items())))
+        return self._session.call(key, lambda: self._live().history(*args, **kwargs))
+
+class _LLMClient:
+    """Groq/OpenAI client stand-in: chat.completions.create() goes through the session."""
+
+    def __init__(self, session, provider, real_client, *args, **kwargs):
+        self._session = session
+        self._provider = provider
+        self._real = None
+        self._make_real = lambda: real_client(*args, **kwargs)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        # Keyed by model only: completions replay in call order even if prompts drift (dates, P&L)
+        def live():
+            if self._real is None:
+                self._real = self._make_real()
+            return self._real.chat.completions.create(**kwargs)
+        return self._session.call(('llm', self._provider, kwargs.get('model')), live, archive=_completion)
+
+class Session:
+    """
+    Record or replay every external call of a cycle.
+
+    While the session is active (`with Recorder(path):` / `with Replayer(path):`)
+    the bot's I/O seams are patched: yf.download, yf.Ticker (info, news,
+    history), requests.get (Wikipedia S&P 500 table, Google News RSS),
+    requests.Session.post (Telegram) and the Groq/OpenAI clients. Anything
+    else can be added with intercept(). Each call is keyed (call site and
+    arguments); a recorder archives every response (or exception) per key
+    in call order with its duration, a replayer serves them back in the same
+    order, repeating the last one once a key runs out. Responses are kept
+    pickled, so every replay gets a fresh copy the bot may mutate.
+
+    Archives are gzipped pickles: only replay archives you recorded yourself.
+    """
+
+    recording = False
+
+    def __init__(self, path):
+        self.path = path
+        self.calls = {}
+        self.meta = {}
+        self._patches = []
+        self._lock = threading.Lock()
+
+    # --- Patching ---
+    def _patch(self, owner, name, replacement):
+        self._patches.append((owner, name, getattr(owner, name)))
+        setattr(owner, name, replacement)
+
+    def intercept(self, owner, name, kind=None, key=None):
+        """Routes owner.name(*args, **kwargs) through the session. key(args, kwargs) -> hashable part of the key."""
+        original = getattr(owner, name)
+        kind = kind or f"{getattr(owner, '__name__', type(owner).__name__)}.{name}"
+        key = key or (lambda args, kwargs: (args, tuple(sorted(kwargs.items()))))
+
+        def wrapper(*args, **kwargs):
+            return self.call((kind, *key(args, kwargs)), lambda: original(*args, **kwargs))
+        self._patch(owner, name, wrapper)
+
+    def __enter__(self):
+        self.intercept(yf, 'download', 'yf.download', key=lambda args, kwargs: (
+            tuple(args[0]) if args and isinstance(args[0], list) else args[:1],
+            tuple(sorted((k, v) for k, v in kwargs.items() if k not in ('progress', 'threads')))
+        ))
+        real_ticker = yf.Ticker
+        self._patch(yf, 'Ticker', lambda symbol, *a, **kw: _Ticker(self, real_ticker, symbol, *a, **kw))
+        self.intercept(requests, 'get', 'http.get', key=lambda args, kwargs: (args[0] if args else kwargs.get('url'),))
+        self.intercept(requests.Session, 'post', 'http.post', key=lambda args, kwargs: (args[1] if len(args) > 1 else kwargs.get('url'),))
+        self._patch_llm_clients()
+        return self
+
+    def _patch_llm_clients(self):
+        targets = []
+        try:
+            import groq
+            targets.append((groq, 'Groq', 'groq'))
+        except ImportError:
+            pass
+        try:
+            import openai
+            targets.append((openai, 'OpenAI', 'openai'))
+        except ImportError:
+            pass
+        try:
+            import core.llm_brain as llm_brain
+            targets += [(llm_brain, 'Groq', 'groq'), (llm_brain, 'OpenAI', 'openai')]
+        except ImportError:
+            pass
+        for owner, name, provider in targets:
+            real_client = getattr(owner, name)
+            self._patch(owner, name, lambda *a, _real=real_client, _provider=provider, **kw: _LLMClient(self, _provider, _real, *a, **kw))
+
+    def __exit__(self, *exc):
+        while self._patches:
+            owner, name, original = self._patches.pop()
+            setattr(owner, name, original)
+        return False
+
+    def stats(self):
+        with self._lock:
+            return {'keys': len(self.calls), 'responses': sum(len(v) for v in self.calls.values())}
+
+class Recorder(Session):
+    """Lets every call through and archives its response; saved to path on exit."""
+
+    recording = True
+
+    def call(self, key, live, archive=None):
+        start = time.perf_counter()
+        try:
+            result = live()
+        except Exception as e:
+            entry = (time.perf_counter() - start, 'error', f"{type(e).__name__}: {e}")
+            with self._lock:
+                self.calls.setdefault(key, []).append(entry)
+            raise
+        try:
+            payload = pickle.dumps(archive(result) if archive else result, protocol=pickle.HIGHEST_PROTOCOL)
+            entry = (time.perf_counter() - start, 'ok', payload)
+        except Exception as e:
+            logger.warning(f"Response for {key[0]} not archivable: {e}")
+            entry = (time.perf_counter() - start, 'error', f"Unarchivable response: {e}")
+        with self._lock:
+            self.calls.setdefault(key, []).append(entry)
+        return result
+
+    def save(self):
+        with self._lock:
+            archive = {'version': ARCHIVE_VERSION, 'meta': self.meta, 'calls': self.calls}
+        with gzip.open(self.path, 'wb') as f:
+            pickle.dump(archive, f, protocol=pickle.HIGHEST_PROTOCOL)
+        logger.info(f"📼 Recorded {self.stats()} to {self.path}")
+
+    def __exit__(self, *exc):
+        super().__exit__(*exc)
+        self.save()
+        return False
+
+class Replayer(Session):
+    """
+    Serves archived responses instead of calling out. latency=None sleeps
+    each call's recorded duration times `scale`; a number sleeps that many
+    seconds per call instead (0 for pure CPU timing). Calls run where the
+    bot makes them (mostly worker threads), so the sleep stalls exactly what
+    the live call would have.
+    """
+
+    def __init__(self, path, latency=None, scale=1.0):
+        super().__init__(path)
+        self.latency = latency
+        self.scale = scale
+        self.misses = {}
+        self._cursor = {}
+        with gzip.open(path, 'rb') as f:
+            archive = pickle.load(f)
+        if archive.get('version') != ARCHIVE_VERSION:
+            raise ValueError(f"Unsupported replay archive version: {archive.get('version')}")
+        self.calls = archive['calls']
+        self.meta = archive['meta']
+
+    def call(self, key, live, archive=None):
+        with self._lock:
+            entries = self.calls.get(key)
+            if not entries:
+                self.misses[key] = self.misses.get(key, 0) + 1
+                raise ReplayMiss(f"No recorded response for {key}")
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+            seconds, status, payload = entries[min(index, len(entries) - 1)]
+        delay = seconds * self.scale if self.latency is None else self.latency
+        if delay > 0:
+            time.sleep(delay)
+        if status == 'error':
+            raise ReplayError(payload)
+        return pickle.loads(payload)
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats['misses'] = sum(self.misses.values())
+        return stats
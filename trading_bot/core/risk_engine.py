@@ -0,0 +1,317 @@
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from core.config import CRYPTO_TICKERS, CRYPTO_PROXIES
+from core.position_sizing import TRADE_ALLOCATION, MIN_ALLOCATION
+from core.logger import setup_logger
+
+logger = setup_logger("RiskEngine", "logs/risk_engine.log")
+
+# Daily returns kept for the covariance, and the fewest shared days a pair needs
+RISK_WINDOW_DAYS = 60
+MIN_OVERLAP_DAYS = 20
+
+# Portfolio limits, as a fraction of equity (cash + positions at market)
+MAX_GROSS_EXPOSURE_PCT = 0.90
+MAX_SECTOR_PCT = 0.40
+# A candidate plus every position correlated with it above MAX_CORRELATION
+MAX_CORRELATION = 0.75
+MAX_CORRELATED_PCT = 0.40
+
+# Exact rebuild of the running sums after this many row/column updates (float drift)
+REBUILD_EVERY = 500
+# Tracked symbols that are not held and were not observed for this long are dropped
+STALE_AFTER = timedelta(days=1)
+
+APPROVE, RESIZE, REJECT = 'APPROVE', 'RESIZE', 'REJECT'
+
+def _returns(closes: pd.DataFrame):
+    """
+    (days, symbols, returns) of daily closes, each return taken against the
+    previous bar that symbol actually has (exchange holidays differ); NaN
+    where it has no bar that day.
+    """
+    index = pd.DatetimeIndex(closes.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    index = index.normalize()
+    if index.has_duplicates or not index.is_monotonic_increasing:
+        closes = closes.set_axis(index).groupby(level=0).last()
+        index = closes.index
+    values = closes.to_numpy(dtype=float)
+    valid = np.isfinite(values)
+    last = np.maximum.accumulate(np.where(valid, np.arange(len(values))[:, None], -1), axis=0)
+    prev = np.vstack([np.full((1, values.shape[1]), -1), last[:-1]])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.where(valid & (prev >= 0), values / np.take_along_axis(values, np.maximum(prev, 0), axis=0) - 1, np.nan)
+    return index.to_numpy(dtype='datetime64[ns]'), list(closes.columns), returns
+
+class RollingCovariance:
+    """
+    Pairwise covariance/correlation of daily returns over the last `window`
+    dates, kept as running sums per pair of symbols (over the days both have
+    a return): N (count), S (sum of i), Q (sum of i squared), P (sum of i*j).
+    A new or revised day is a rank-1 update of the sums and a new symbol a
+    single row/column, so nothing is recomputed from the full history.
+    """
+
+    def __init__(self, window=RISK_WINDOW_DAYS):
+        self.window = window
+        self.symbols = []
+        self.index = {}
+        self.dates = []
+        self.returns = np.empty((0, 0))  # dates x symbols, NaN = no return that day
+        self.N, self.S, self.Q, self.P = [np.zeros((0, 0)) for _ in range(4)]
+        self.updates = 0
+
+    def __contains__(self, symbol):
+        return symbol in self.index
+
+    @staticmethod
+    def _factors(rows):
+        # Each sum is a sum over days of outer(a, b): N (v, v), S (z, v), Q (z^2, v), P (z, z)
+        valid = np.isfinite(rows).astype(float)
+        values = np.where(valid > 0, rows, 0.0)
+        return (valid, valid), (values, valid), (values * values, valid), (values, values)
+
+    def _terms(self, rows):
+        return [a.T @ b for a, b in self._factors(rows)]
+
+    def _apply(self, rows, sign):
+        for m, (a, b) in zip((self.N, self.S, self.Q, self.P), self._factors(np.atleast_2d(rows))):
+            m += sign * (a.T @ b)
+        self.updates += 1
+
+    def _revise(self, old, new, changed):
+        """Swaps one day's returns old -> new where only columns `changed` differ: O(k*n) instead of O(n^2)."""
+        rest = np.flatnonzero(~changed)
+        cols = np.flatnonzero(changed)
+        for m, (a_old, b_old), (a_new, b_new) in zip((self.N, self.S, self.Q, self.P), self._factors(old), self._factors(new)):
+            m[cols, :] += np.outer(a_new[cols], b_new) - np.outer(a_old[cols], b_old)
+            m[np.ix_(rest, cols)] += np.outer(a_new[rest], b_new[cols] - b_old[cols])
+        self.updates += 1
+
+    def rebuild(self):
+        n = len(self.symbols)
+        self.N, self.S, self.Q, self.P = self._terms(self.returns) if self.dates else [np.zeros((n, n)) for _ in range(4)]
+        self.updates = 0
+
+    def add_symbols(self, symbols):
+        new = [s for s in symbols if s not in self.index]
+        if not new:
+            return
+        for symbol in new:
+            self.index[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        k = len(new)
+        self.returns = np.hstack([self.returns, np.full((len(self.dates), k), np.nan)])
+        self.N, self.S, self.Q, self.P = (np.pad(m, ((0, k), (0, k))) for m in (self.N, self.S, self.Q, self.P))
+
+    def remove_symbols(self, symbols):
+        drop = sorted(self.index[s] for s in symbols if s in self.index)
+        if not drop:
+            return
+        self.returns = np.delete(self.returns, drop, axis=1)
+        self.N, self.S, self.Q, self.P = (np.delete(np.delete(m, drop, axis=0), drop, axis=1) for m in (self.N, self.S, self.Q, self.P))
+        self.symbols = [s for i, s in enumerate(self.symbols) if i not in set(drop)]
+        self.index = {s: i for i, s in enumerate(self.symbols)}
+
+    def set_column(self, j, column):
+        """First history of column j (no returns in the window yet), aligned to self.dates: one row + column of the sums."""
+        column = np.asarray(column, dtype=float)
+        if not np.isfinite(column).any():
+            return
+        self.returns[:, j] = column
+        valid = np.isfinite(self.returns).astype(float)
+        values = np.where(valid > 0, self.returns, 0.0)
+        v, z = valid[:, j], values[:, j]
+        self.N[j, :] = self.N[:, j] = v @ valid
+        self.S[j, :], self.S[:, j] = z @ valid, values.T @ v
+        self.Q[j, :], self.Q[:, j] = (z * z) @ valid, (values * values).T @ v
+        self.P[j, :] = self.P[:, j] = z @ values
+        self.updates += 1
+
+    def revise_day(self, t, cols, values):
+        """New returns for columns `cols` on the window's t-th date."""
+        old = self.returns[t]
+        row = old.copy()
+        row[cols] = values
+        changed = ~((old == row) | (np.isnan(old) & np.isnan(row)))
+        if not changed.any():
+            return
+        if changed.sum() * 2 > len(row):
+            # Most of the row moved (a fresh intraday bar for everything held)
+            self._apply(old, -1)
+            self._apply(row, +1)
+        else:
+            self._revise(old, row, changed)
+        self.returns[t] = row
+
+    def add_day(self, day, cols, values):
+        """A date not in the window yet: inserted in order, dropping the oldest once the window is full."""
+        if self.dates and day < self.dates[0] and len(self.dates) >= self.window:
+            return
+        row = np.full(len(self.symbols), np.nan)
+        row[cols] = values
+        t = int(np.searchsorted(np.array(self.dates, dtype='datetime64[ns]'), day))
+        self.dates.insert(t, day)
+        self.returns = np.insert(self.returns, t, row, axis=0)
+        self._apply(row, +1)
+        if len(self.dates) > self.window:
+            self._apply(self.returns[0], -1)
+            self.dates.pop(0)
+            self.returns = self.returns[1:]
+
+    def update(self, closes: pd.DataFrame):
+        """Merges daily closes (dates x symbols) into the window."""
+        days, symbols, values = _returns(closes)
+        has = np.isfinite(values)
+        keep = has.any(axis=1)
+        days, values, has = days[keep], values[keep], has[keep]
+        if not len(days):
+            return
+        fresh = np.array([s not in self.index for s in symbols])
+        self.add_symbols(symbols)
+        cols = np.array([self.index[s] for s in symbols])
+
+        window = np.array(self.dates, dtype='datetime64[ns]')
+        pos = np.searchsorted(window, days)
+        known = (pos < len(window)) & (window[np.minimum(pos, len(window) - 1)] == days) if len(window) else np.zeros(len(days), dtype=bool)
+        if len(window):
+            # Known days of brand-new symbols in one step; everything else day by day
+            at = dict(zip(days.tolist(), range(len(days))))
+            for k in np.flatnonzero(fresh):
+                self.set_column(cols[k], [values[at[d], k] if d in at else np.nan for d in window.tolist()])
+            for t in np.flatnonzero(known):
+                m = has[t] & ~fresh
+                if m.any():
+                    self.revise_day(pos[t], cols[m], values[t, m])
+        for t in np.flatnonzero(~known)[-self.window:]:
+            self.add_day(days[t], cols[has[t]], values[t, has[t]])
+        if self.updates >= REBUILD_EVERY:
+            self.rebuild()
+
+    def correlation(self, symbol, others):
+        """Correlation of symbol's returns with each of others (NaN if unknown or < MIN_OVERLAP_DAYS shared)."""
+        if symbol not in self.index:
+            return np.full(len(others), np.nan)
+        i = self.index[symbol]
+        js = np.array([self.index.get(o, -1) for o in others], dtype=int)
+        out = np.full(len(others), np.nan)
+        known = js >= 0
+        if not known.any():
+            return out
+        j = js[known]
+        n = self.N[i, j]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = self.P[i, j] - self.S[i, j] * self.S[j, i] / n
+            var_i = self.Q[i, j] - self.S[i, j] ** 2 / n
+            var_j = self.Q[j, i] - self.S[j, i] ** 2 / n
+            corr = cov / np.sqrt(var_i * var_j)
+        out[known] = np.where((n >= MIN_OVERLAP_DAYS) & (var_i > 0) & (var_j > 0), np.clip(corr, -1.0, 1.0), np.nan)
+        return out
+
+class RiskEngine:
+    """
+    Portfolio-level gate for buy intents, run by the OrderAllocator on each
+    ranked batch before anything is funded. Every intent is approved, resized
+    (capped to the room left) or rejected against the gross exposure, sector
+    and correlated-exposure limits, counting what is held plus what was
+    approved ahead of it in the same batch.
+    Returns come from bars the bot already downloads (position monitoring and
+    each candidate's technical analysis).
+    """
+
+    def __init__(self, sectors=None, window=RISK_WINDOW_DAYS):
+        self.covariance = RollingCovariance(window)
+        self.sectors = dict(sectors or {})  # symbol -> sector (e.g. GICS from the S&P 500 table)
+        self.last_seen = {}
+
+    def sector_of(self, symbol):
+        if symbol in CRYPTO_TICKERS or symbol in CRYPTO_PROXIES or '-USD' in symbol:
+            return 'Crypto'
+        return self.sectors.get(symbol)
+
+    def observe(self, closes):
+        """closes: dates x symbols DataFrame, or {symbol: Series} of daily closes."""
+        if isinstance(closes, dict):
+            closes = pd.DataFrame({s: c for s, c in closes.items() if c is not None and len(c)})
+        if closes is None or closes.empty:
+            return
+        self.covariance.update(closes)
+        now = datetime.now()
+        self.last_seen.update(dict.fromkeys(closes.columns, now))
+
+    def prune(self, held):
+        """Drops tracked symbols that are neither held nor recently observed."""
+        cutoff = datetime.now() - STALE_AFTER
+        stale = [s for s in self.covariance.symbols if s not in held and self.last_seen.get(s, cutoff) <= cutoff]
+        self.covariance.remove_symbols(stale)
+        for symbol in stale:
+            self.last_seen.pop(symbol, None)
+
+    def review(self, intents, balance, exposures):
+        """
+        intents: ranked best first; balance: cash; exposures: {symbol: market value}.
+        Each intent's size is estimated like PaperTrader._plan_buys (20% of the
+        cash not yet reserved). Returns [(intent, decision)] with decision
+        {'action': APPROVE/RESIZE/REJECT, 'max_cost': cap or None, 'reason'}.
+        """
+        start = time.perf_counter()
+        exposures = {s: v for s, v in exposures.items() if v > 0}
+        equity = balance + sum(exposures.values())
+        symbols = list(exposures)
+        values = np.array([exposures[s] for s in symbols], dtype=float)
+        sector_totals = {}
+        for symbol, value in exposures.items():
+            sector = self.sector_of(symbol)
+            if sector:
+                sector_totals[sector] = sector_totals.get(sector, 0.0) + value
+
+        available = balance
+        decisions = []
+        for intent in intents:
+            symbol = intent['symbol']
+            wanted = available * TRADE_ALLOCATION
+            if wanted < MIN_ALLOCATION:
+                # Funding, not risk: the trader reports these as insufficient funds
+                decisions.append((intent, {'action': APPROVE, 'max_cost': None, 'reason': None}))
+                continue
+
+            sector = self.sector_of(symbol)
+            corr = self.covariance.correlation(symbol, symbols)
+            correlated = corr >= MAX_CORRELATION
+            rooms = {
+                'gross exposure': MAX_GROSS_EXPOSURE_PCT * equity - values.sum(),
+                f"{sector} sector": MAX_SECTOR_PCT * equity - sector_totals.get(sector, 0.0) if sector else np.inf,
+                'correlated exposure': MAX_CORRELATED_PCT * equity - values[correlated].sum()
+            }
+            limit, room = min(rooms.items(), key=lambda item: item[1])
+
+            if room >= wanted:
+                decision = {'action': APPROVE, 'max_cost': None, 'reason': None}
+                cost = wanted
+            elif room >= MIN_ALLOCATION:
+                decision = {'action': RESIZE, 'max_cost': room, 'reason': f"{limit} limit: ${wanted:.2f} -> ${room:.2f}"}
+                cost = room
+            else:
+                reason = f"{limit} limit reached"
+                if limit == 'correlated exposure':
+                    peers = [s for s, c in zip(symbols, correlated) if c]
+                    reason += f" ({', '.join(peers)})"
+                decisions.append((intent, {'action': REJECT, 'max_cost': None, 'reason': reason}))
+                continue
+
+            decisions.append((intent, decision))
+            available -= cost
+            symbols.append(symbol)
+            values = np.append(values, cost)
+            if sector:
+                sector_totals[sector] = sector_totals.get(sector, 0.0) + cost
+
+        if intents:
+            elapsed = (time.perf_counter() - start) * 1e6
+            counts = {a: sum(1 for _, d in decisions if d['action'] == a) for a in (APPROVE, RESIZE, REJECT)}
+            logger.info(f"Reviewed {len(intents)} intents in {elapsed:.0f}us ({elapsed / len(intents):.0f}us each): {counts}")
+        return decisions
@@ -0,0 +1,58 @@
+import asyncio
+import time
+from technical_analyst import fetch_closes
+from core.exit_rules import evaluate_exits
+from core.config import STOP_WATCH_INTERVAL_SECONDS
+from core.tracing import traced
+from core.logger import setup_logger
+
+logger = setup_logger("StopWatch", "logs/stop_watch.log")
+
+class StopWatch:
+    """
+    Fast exit loop for held positions only. Every `interval` seconds it takes
+    one batched quote for the symbols held and applies the price rules (take
+    profit, stop loss, time stop) right away, independent of the main loop's
+    conference/scan cadence. The technical exit needs daily indicators and
+    stays with monitor_portfolio. Sales go through
+    TradeExecutor.execute_exits, whose per-symbol claims keep the two loops
+    from selling the same position twice.
+    """
+
+    def __init__(self, trade_executor, interval=STOP_WATCH_INTERVAL_SECONDS):
+        self.trade_executor = trade_executor
+        self.interval = interval
+
+    @staticmethod
+    async def fetch_quotes(symbols):
+        """{symbol: latest price} from one download of today's bar (its close is the live price intraday)."""
+        closes = await fetch_closes(symbols, period="1d")
+        if closes.empty:
+            return {}
+        return closes.ffill().iloc[-1].dropna().to_dict()
+
+    @traced("stop_watch.check")
+    async def check(self):
+        """One pass: quote what is held, sell whatever hit a stop/target. Returns the receipts."""
+        positions = dict(self.trade_executor.trader.positions)
+        if not positions:
+            return []
+        start = time.perf_counter()
+        prices = await self.fetch_quotes(list(positions))
+        # Positions sold (or bought) while the quote was in flight are dropped/ignored
+        positions = {s: p for s, p in self.trade_executor.trader.positions.items() if s in positions}
+        exits = evaluate_exits(positions, prices)
+        receipts = await self.trade_executor.execute_exits(exits, source="stop-watch")
+        if receipts:
+            logger.info(f"⏱️ Stop-watch sold {len(receipts)}/{len(positions)} positions in {(time.perf_counter() - start) * 1000:.0f}ms")
+        return receipts
+
+    async def run(self, is_trading_hours):
+        """Scheduler loop; idle outside trading hours (quotes don't move)."""
+        while True:
+            try:
+                if is_trading_hours():
+                    await self.check()
+            except Exception as e:
+                logger.error(f"Stop-watch check failed: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,143 @@
+import os
+import time
+import uuid
+import argparse
+import itertools
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from core.backtester import prepare, simulate
+from core.logger import setup_logger
+
+logger = setup_logger("Sweep", "logs/sweep.log")
+
+# simulate() keyword arguments worth sweeping. Sentiment and the P/E cap have
+# no point-in-time history in the bar store, so the backtest cannot vary them.
+DEFAULT_GRID = {
+    'vol_mult': [1.2, 1.5, 2.0, 3.0],
+    'rsi_low': [35, 40, 45],
+    'rsi_high': [65, 70, 75],
+    'take_profit_pct': [3.0, 5.0, 8.0],
+    'stop_loss_pct': [3.0, 4.0, 6.0],
+    'max_hold_days': [3, 5, 10]
+}
+# Ascending rank order per metric; turnover: lower is better
+RANK_BY = {'total_return_pct': False, 'max_drawdown_pct': False, 'turnover': True}
+
+def grid(space):
+    """Every combination of {param: [values]}."""
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[n] for n in names))]
+
+def random_search(space, n, seed=0):
+    """n distinct random combinations of {param: [values]} (all of them if the grid is smaller)."""
+    combos = grid(space)
+    if n >= len(combos):
+        return combos
+    picks = np.random.default_rng(seed).choice(len(combos), size=n, replace=False)
+    return [combos[i] for i in sorted(picks)]
+
+class SharedArrays:
+    """
+    Publishes a dict of numpy arrays in shared memory once; workers attach to
+    the blocks by name (spec) instead of receiving a pickled copy per task.
+    """
+
+    def __init__(self, arrays):
+        self.blocks = []
+        self.spec = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+            self.blocks.append(shm)
+            self.spec[name] = (shm.name, array.shape, array.dtype.str)
+
+    def close(self):
+        for shm in self.blocks:
+            shm.close()
+            shm.unlink()
+        self.blocks = []
+
+    @staticmethod
+    def attach(spec):
+        """Read-only views on the published arrays (plus the handles keeping them mapped)."""
+        handles, arrays = [], {}
+        for name, (shm_name, shape, dtype) in spec.items():
+            # Pool workers share the parent's resource tracker, so attaching does not
+            # hand them ownership: the parent's close() alone unlinks the block
+            shm = shared_memory.SharedMemory(name=shm_name)
+            array = np.ndarray(shape, np.dtype(dtype), buffer=shm.buf)
+            array.flags.writeable = False
+            handles.append(shm)
+            arrays[name] = array
+        return handles, arrays
+
+# Per-worker state, set once by the pool initializer
+_worker_handles = []
+_worker_inputs = None
+_worker_base = {}
+
+def _init_worker(spec, base_params):
+    global _worker_handles, _worker_inputs, _worker_base
+    _worker_handles, _worker_inputs = SharedArrays.attach(spec)
+    _worker_base = base_params
+
+def _run_one(params):
+    stats = simulate(_worker_inputs, **_worker_base, **params)['stats']
+    return {'params': params, **{k: v for k, v in stats.items() if k != 'exits'}}
+
+def rank_results(results):
+    """DataFrame of results ranked by the mean of their return, drawdown and turnover ranks."""
+    frame = pd.DataFrame(results)
+    if frame.empty:
+        return frame
+    ranks = [frame[col].rank(ascending=asc, method='min') for col, asc in RANK_BY.items()]
+    frame['score'] = sum(ranks) / len(ranks)
+    frame = frame.sort_values(['score', 'total_return_pct'], ascending=[True, False]).reset_index(drop=True)
+    frame['rank'] = np.arange(1, len(frame) + 1)
+    return frame
+
+def run_sweep(inputs, combos, workers=None, chunksize=None, **base_params):
+    """
+    Evaluates simulate(inputs, **base_params, **combo) for every combo over a
+    process pool. inputs (from backtester.prepare) go to shared memory once.
+    Returns the ranked results (see rank_results).
+    """
+    workers = workers or os.cpu_count() or 1
+    chunksize = chunksize or max(1, len(combos) // (workers * 4))
+    shared = SharedArrays(inputs)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shared.spec, base_params)) as pool:
+            results = list(pool.map(_run_one, combos, chunksize=chunksize))
+    finally:
+        shared.close()
+    return rank_results(results)
+
+if __name__ == "__main__":
+    import database as db
+    from core.bar_store import BARS_PATH, load_bars
+
+    parser = argparse.ArgumentParser(description="Sweep strategy thresholds over the backtester")
+    parser.add_argument('--path', default=BARS_PATH)
+    parser.add_argument('--start')
+    parser.add_argument('--end')
+    parser.add_argument('--capital', type=float, default=10000.0)
+    parser.add_argument('--random', type=int, help="Sample this many combinations instead of the full grid")
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    combos = random_search(DEFAULT_GRID, args.random) if args.random else grid(DEFAULT_GRID)
+    closes, volumes = load_bars(args.path, start=args.start, end=args.end)
+    start = time.perf_counter()
+    ranked = run_sweep(prepare(closes, volumes), combos, workers=args.workers, initial_capital=args.capital)
+    elapsed = time.perf_counter() - start
+
+    run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    db.migrate()
+    db.save_sweep_results(run_id, ranked.to_dict('records'))
+    logger.info(f"Sweep {run_id}: {len(combos)} combinations on {closes.shape[1]} symbols x {closes.shape[0]} days in {elapsed:.1f}s")
+    print(f"Run {run_id}: {len(combos)} combinations in {elapsed:.1f}s")
+    print(ranked.head(args.top)[['rank', 'params', 'total_return_pct', 'max_drawdown_pct', 'turnover', 'sharpe', 'trades']].to_string(index=False))
@@ -0,0 +1,196 @@
+import asyncio
+import bisect
+import contextvars
+import functools
+import itertools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from core.config import TRACE_FILE
+from core.logger import setup_logger
+
+logger = setup_logger("Tracing", "logs/tracing.log")
+
+# Upper bounds (seconds) of the duration histogram buckets; the last bucket is +Inf
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+class Histogram:
+    """Fixed-bucket duration histogram (count, sum, max and per-bucket counts)."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Estimate, interpolated linearly inside the bucket holding the q-th observation."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / n)
+            seen += n
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'total_ms': round(self.sum * 1000, 1),
+            'avg_ms': round(self.sum / self.count * 1000, 2) if self.count else 0.0,
+            'p50_ms': round(self.quantile(0.5) * 1000, 2),
+            'p95_ms': round(self.quantile(0.95) * 1000, 2),
+            'max_ms': round(self.max * 1000, 2)
+        }
+
+class _Trace:
+    def __init__(self, name):
+        self.name = name
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.spans = []
+
+class Tracer:
+    """
+    Lightweight spans for finding where a cycle spends its time.
+
+    `with tracer.span("scanner.news", symbol=s):` (or @traced) times a block
+    and records the duration into that name's histogram. Inside
+    `with tracer.cycle():` every span, including those of concurrently
+    gathered tasks and of asyncio.to_thread workers (both inherit the
+    context), is also kept in the cycle's trace with its parent. The trace is
+    logged as a per-stage summary, kept as last_trace, and appended as one
+    JSON line to trace_file when one is configured.
+    """
+
+    def __init__(self, trace_file=TRACE_FILE):
+        self.trace_file = trace_file
+        self.histograms = {}
+        self.last_trace = None
+        self.cycle_started = None  # monotonic start of the cycle in progress, if any
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._current = contextvars.ContextVar("trace_span", default=(None, None))
+
+    def observe(self, name, seconds):
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram()
+            hist.observe(seconds)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        trace, parent = self._current.get()
+        span_id = next(self._ids)
+        token = self._current.set((trace, span_id))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self._current.reset(token)
+            self.observe(name, end - start)
+            if trace is not None:
+                trace.spans.append({
+                    'id': span_id, 'parent': parent, 'name': name,
+                    'start_ms': round((start - trace.start) * 1000, 2),
+                    'ms': round((end - start) * 1000, 2), **attrs
+                })
+
+    def traced(self, name=None):
+        """Decorator form of span() for plain and async functions."""
+        def wrap(fn):
+            span_name = name or fn.__qualname__
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(span_name):
+                        return await fn(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return wrap
+
+    @contextmanager
+    def cycle(self, name="cycle"):
+        """Collects every span opened inside the block into one trace."""
+        trace = _Trace(name)
+        token = self._current.set((trace, None))
+        self.cycle_started = time.monotonic()
+        try:
+            with self.span(name):
+                yield trace
+        finally:
+            self._current.reset(token)
+            self.cycle_started = None
+            self.last_trace = self.export(trace)
+            logger.info(self.summary(self.last_trace))
+            self._write(self.last_trace)
+
+    @staticmethod
+    def export(trace):
+        spans = sorted(trace.spans, key=lambda s: s['start_ms'])
+        root = next((s for s in spans if s['parent'] is None), None)
+        return {'name': trace.name, 'started_at': trace.started_at.isoformat(),
+                'ms': root['ms'] if root else 0.0, 'spans': spans}
+
+    @staticmethod
+    def summary(exported, top=8):
+        """'cycle 8123ms | scan_batch 6100ms (x3) | monitor 900ms | ...' over the root's direct children."""
+        spans = exported['spans']
+        root = next((s['id'] for s in spans if s['parent'] is None), None)
+        totals = {}
+        for s in spans:
+            if s['parent'] == root and root is not None:
+                total, n = totals.get(s['name'], (0.0, 0))
+                totals[s['name']] = (total + s['ms'], n + 1)
+        stages = sorted(totals.items(), key=lambda kv: kv[1][0], reverse=True)[:top]
+        parts = [f"{name} {total:.0f}ms" + (f" (x{n})" if n > 1 else "") for name, (total, n) in stages]
+        return " | ".join([f"⏱️ {exported['name']} {exported['ms']:.0f}ms", *parts])
+
+    def _write(self, exported):
+        if not self.trace_file:
+            return
+        try:
+            with open(self.trace_file, "a") as f:
+                f.write(json.dumps(exported, default=str) + "\n")
+        except Exception as e:
+            logger.error(f"Failed to write trace: {e}")
+
+    def stats(self):
+        """{span name: histogram snapshot}, slowest total first."""
+        with self._lock:
+            snapshots = {name: hist.snapshot() for name, hist in self.histograms.items()}
+        return dict(sorted(snapshots.items(), key=lambda kv: kv[1]['total_ms'], reverse=True))
+
+    def histograms_copy(self):
+        """{span name: (bucket bounds, counts per bucket, sum, count)}, consistent per histogram."""
+        with self._lock:
+            return {name: (h.buckets, list(h.counts), h.sum, h.count) for name, h in self.histograms.items()}
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+
+# Process-wide tracer shared by every module
+tracer = Tracer()
+span = tracer.span
+traced = tracer.traced
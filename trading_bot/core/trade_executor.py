@@ -1,52 +1,71 @@
 
-import logging
-import asyncio
-import database as db
+import time
+import database_async as adb
 from paper_trader import PaperTrader
-from technical_analyst import TechnicalAnalyst
-from core.config import TELEGRAM_TOKEN, CHAT_ID
+from technical_analyst import fetch_closes, signals_wide
+from core.exit_rules import evaluate_exits
+from core.analysis_writer import AnalysisLogWriter
+from core.order_allocator import OrderAllocator, order_intent
+from core.risk_engine import RiskEngine, REJECT, RESIZE
+from core.notifier import TelegramNotifier, escape_markdown
+from core.tracing import traced
+from core.metrics import metrics
 from core.logger import setup_logger
-import requests
 
 logger = setup_logger("TradeExecutor", "logs/trade_executor.log")
 
 class TradeExecutor:
     def __init__(self):
         self.trader = PaperTrader()
+        self.analysis_writer = AnalysisLogWriter()
+        self.risk_engine = RiskEngine()
+        self.order_allocator = OrderAllocator(self.trader, self.risk_engine)
+        self._selling = set()  # symbols with a sale in flight (see execute_exits)
+        self.notifier = TelegramNotifier()
 
     def send_telegram_alert(self, message):
-        try:
-            if not TELEGRAM_TOKEN or not CHAT_ID:
-                logger.warning("Telegram token or Chat ID missing. Alert skipped.")
-                return
-                
-            url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-            payload = {"chat_id": CHAT_ID, "text": message, "parse_mode": "Markdown"}
-            requests.post(url, json=payload, timeout=10)
-        except Exception as e:
-            logger.error(f"Failed to send alert: {e}")
+        """Queues the alert on the notifier; never blocks the event loop."""
+        return self.notifier.send(message)
 
     async def execute_trade_logic(self, symbol, analysis_result, meta_data):
         """
-        Executes buy logic based on analysis result.
+        Queues a buy intent for a candidate that passed every gate; the fill
+        happens in execute_pending_orders() once the whole batch is analysed.
         meta_data should contain: volume_ratio, sentiment_score, pe_ratio, headlines
+        and closes (the daily closes the analysis used; feeds the risk engine)
         """
+        ta_result = analysis_result
+
+        # Log: Passed all checks - attempting buy
+        self.analysis_writer.submit(symbol, meta_data.get('volume_ratio', 0), meta_data.get('sentiment_score', 0), meta_data.get('pe_ratio', 0),
+                                    ta_result['signal'], 'BUY_SIGNAL', f"All checks passed. Confidence: {ta_result['confidence']}", ta_result['latest_price'])
+        self.order_allocator.submit(order_intent(symbol, ta_result, meta_data))
+        return {'status': 'QUEUED', 'symbol': symbol}
+
+    @traced("executor.allocate")
+    async def execute_pending_orders(self):
+        """Funds and fills all queued intents as one batch (best first); reports each outcome."""
+        outcomes = await self.order_allocator.execute()
+        results = []
+        for intent, receipt in outcomes:
+            risk = intent.get('risk') or {}
+            metrics.inc("gate_candidates_total", gate="risk", result="reject" if risk.get('action') == REJECT else "pass")
+            if risk.get('action') == REJECT:
+                await self.log_rejection(intent['symbol'], 'RISK', f"Risk: {risk['reason']}", {**intent['meta'], 'price': intent['price']})
+                results.append({'status': 'REJECTED', 'symbol': intent['symbol']})
+                continue
+            results.append(self._report_buy(intent['symbol'], intent['ta_result'], intent['meta'], receipt, risk))
+        return results
+
+    def _report_buy(self, symbol, ta_result, meta_data, receipt, risk=None):
         curr_vol = meta_data.get('curr_vol', 0)
         avg_vol = meta_data.get('avg_vol', 0)
         volume_ratio = meta_data.get('volume_ratio', 0)
         sentiment_score = meta_data.get('sentiment_score', 0)
         pe_ratio = meta_data.get('pe_ratio', 0)
         headlines = meta_data.get('headlines', [])
-        market_bias = meta_data.get('market_bias', 'NEUTRAL')
-        
-        ta_result = analysis_result
         latest_price = ta_result['latest_price']
 
-        # Log: Passed all checks - attempting buy
-        db.log_analysis(symbol, volume_ratio, sentiment_score, pe_ratio, ta_result['signal'], 'BUY_SIGNAL', f"All checks passed. Confidence: {ta_result['confidence']}", latest_price)
-        
-        receipt = self.trader.buy(symbol, latest_price)
-        
         paper_msg = ""
         if receipt:
             fee_pct = receipt['fee_rate'] * 100
@@ -56,12 +75,16 @@ class TradeExecutor:
                 f"Fee: {fee_pct}%\n"
                 f"**Break-Even:** ${receipt['break_even']:.2f}"
             )
+            executed = f"Executed {receipt['shares']} shares"
+            if risk and risk.get('action') == RESIZE:
+                paper_msg += f"\n**Resized:** {risk['reason']}"
+                executed += f" (resized by {risk['reason']})"
             # Log: Successfully bought
-            db.log_analysis(symbol, volume_ratio, sentiment_score, pe_ratio, ta_result['signal'], 'BOUGHT', f"Executed {receipt['shares']} shares", latest_price)
+            self.analysis_writer.submit(symbol, volume_ratio, sentiment_score, pe_ratio, ta_result['signal'], 'BOUGHT', executed, latest_price)
         else:
             paper_msg = "\n(Skipped: Insufficient Funds)"
             # Log: Wanted to buy but couldn't
-            db.log_analysis(symbol, volume_ratio, sentiment_score, pe_ratio, ta_result['signal'], 'INSUFFICIENT_FUNDS', 'Not enough capital', latest_price)
+            self.analysis_writer.submit(symbol, volume_ratio, sentiment_score, pe_ratio, ta_result['signal'], 'INSUFFICIENT_FUNDS', 'Not enough capital', latest_price)
         
         pe_str = f"{pe_ratio:.2f}" if pe_ratio else "N/A"
         
@@ -82,7 +105,7 @@ class TradeExecutor:
             f"**Sentiment:** {sentiment_score:.2f}\n"
             f"**Vol Spike:** {int(curr_vol):,} (Avg: {int(avg_vol):,})\n"
             f"{status_msg}\n"
-            f"**News:**\n" + "\n".join([f"- {h}" for h in headlines])
+            f"**News:**\n" + "\n".join([f"- {escape_markdown(h)}" for h in headlines])
         )
         
         logger.info(log_msg)
@@ -100,89 +123,80 @@ class TradeExecutor:
         price = meta_data.get('price', None)
         
         logger.info(f"Skipping {symbol}: {reason_desc}")
-        db.log_analysis(symbol, volume_ratio, sentiment_score, pe_ratio, reason_code, 'REJECTED', reason_desc, price)
+        self.analysis_writer.submit(symbol, volume_ratio, sentiment_score, pe_ratio, reason_code, 'REJECTED', reason_desc, price)
 
     async def monitor_portfolio(self):
-        positions = list(self.trader.positions.keys())
+        positions = dict(self.trader.positions)
+        self.risk_engine.prune(positions)
         if not positions:
+            await self.record_equity()
             return
 
         logger.info(f"💼 Monitoring {len(positions)} held positions...")
-        
-        for symbol in positions:
-            try:
-                # 1. Get Current Price
-                analyst = TechnicalAnalyst(symbol)
-                result = await analyst.analyze()
-                curr_price = result['latest_price']
-                
-                # 2. Portfolio Match
-                pos = self.trader.positions[symbol]
-                avg_price = pos['avg_price']
-                entry_fee = pos['fee_rate'] # 0.0 or 0.015
-                
-                # 3. Calculate Hypothetical Net P&L (if sold now)
-                # Sell Fee matches Buy Fee logic
-                sell_fee = entry_fee 
-                proceeds = (pos['shares'] * curr_price) * (1 - sell_fee)
-                cost_basis = pos['cost_basis']
-                pnl = proceeds - cost_basis
-                pnl_percent_net = (pnl / cost_basis) * 100
-                
-                # 4. Strategy Targets (5-Day Sprint)
-                # Universal Rule: Target +5% (Speed is key)
-                tp_target = 5.0 
-                
-                # SL: Widen to -4.0% for Swing
-                sl_price = avg_price * 0.96 
-                price_drop_pct = ((curr_price - avg_price) / avg_price) * 100
-                
-                # Time Stop (The 5-Day Rule)
-                from datetime import datetime
-                entry_date = datetime.fromisoformat(pos['entry_date'])
-                days_held = (datetime.now() - entry_date).days
-                
-                action = None
-                reason = ""
-                
-                if pnl_percent_net >= tp_target:
-                    action = 'SELL'
-                    reason = f"🎯 Profit Target Hit (+{pnl_percent_net:.1f}% Net)"
-                elif days_held >= 5:
-                    # Time Stop: Force Sell if 5 days passed
-                    if pnl_percent_net > -2.0:
-                        action = 'SELL'
-                        reason = f"⏳ 5-Day Sprint End (PnL: {pnl_percent_net:.1f}%)"
-                    else:
-                        # Holding a loser > -2%? Maybe cut it.
-                        # For now, let SL handle deep losers, but Time Stop cuts stagnant ones.
-                        pass
-                elif curr_price < sl_price:
-                    action = 'SELL'
-                    reason = f"🛑 Stop Loss Hit (Dropped {price_drop_pct:.1f}%)"
-                elif result['signal'] == 'SELL':
-                    # Only sell on technical signal if we are at least break-even?
-                    # Or trust the kill switch. Assuming Kill Switch (-10) means danger.
-                    action = 'SELL'
-                    reason = f"📉 Technical Breakdown (RSI: {result.get('rsi', 0):.1f})"
-
-                if action == 'SELL':
-                    logger.info(f"Selling {symbol}: {reason}")
-                    receipt = self.trader.sell(symbol, curr_price)
-                    if receipt:
-                        pnl_emoji = "🤑" if receipt['pnl'] > 0 else "📉"
-                        fee_lbl = "0%" if is_cad else "1.5% x2"
-                        msg = (
-                            f"{pnl_emoji} *SELL EXEC: {symbol}*\n"
-                            f"**Reason:** {reason}\n"
-                            f"**Price:** ${receipt['exit_price']:.2f}\n"
-                            f"**Net P&L:** ${receipt['pnl']:.2f} ({receipt['pnl_percent']:.2f}%)\n"
-                            f"**Fee Structure:** {fee_lbl}\n"
-                            f"**Total Equity:** ${self.trader.balance:.2f}"
-                        )
-                        self.send_telegram_alert(msg)
-                else:
-                    logger.info(f"✅ Holding {symbol} | Net P&L: {pnl_percent_net:.2f}% | Price: {curr_price:.2f}")
-                    
-            except Exception as e:
-                logger.error(f"Error monitoring {symbol}: {e}")
+        start = time.perf_counter()
+        try:
+            # 1. One download + indicator pass for every held symbol
+            closes = await fetch_closes(list(positions))
+            signals = signals_wide(closes)
+            self.risk_engine.observe(closes)
+
+            # 2. Net P&L and exit rules, vectorized across positions
+            exits = evaluate_exits(positions, signals['latest_price'], signals['signal'], signals['rsi'])
+        except Exception as e:
+            logger.error(f"Error monitoring portfolio: {e}")
+            await self.record_equity()
+            return
+
+        for symbol in positions.keys() - set(exits.index):
+            logger.error(f"Error monitoring {symbol}: no price data")
+
+        held = exits[exits['action'] != 'SELL']
+        for symbol, row in held.iterrows():
+            logger.info(f"✅ Holding {symbol} | Net P&L: {row['pnl_percent']:.2f}% | Price: {row['price']:.2f}")
+
+        # 3. All exits in one transaction
+        receipts = await self.execute_exits(exits)
+
+        await self.record_equity(signals['latest_price'])
+        logger.info(f"💼 Monitored {len(positions)} positions in {(time.perf_counter() - start) * 1000:.0f}ms ({len(receipts)} sold)")
+
+    @traced("executor.exits")
+    async def execute_exits(self, exits, source="monitor"):
+        """
+        Sells the SELL rows of an evaluate_exits() frame in one transaction and
+        alerts on each fill. Shared by monitor_portfolio and the StopWatch: a
+        symbol is claimed before its sale and released after, so whichever loop
+        gets there first sells it and the other skips it.
+        """
+        to_sell = exits[(exits['action'] == 'SELL') & exits.index.isin(list(self.trader.positions))]
+        to_sell = to_sell[~to_sell.index.isin(list(self._selling))]
+        if to_sell.empty:
+            return []
+        claimed = set(to_sell.index)
+        self._selling |= claimed
+        try:
+            for symbol, row in to_sell.iterrows():
+                logger.info(f"Selling {symbol} ({source}): {row['reason']}")
+            receipts = await self.trader.sell_many_async(list(zip(to_sell.index, to_sell['price'])))
+        finally:
+            self._selling -= claimed
+
+        for receipt in receipts:
+            reason = to_sell.loc[receipt['symbol'], 'reason']
+            pnl_emoji = "🤑" if receipt['pnl'] > 0 else "📉"
+            fee_lbl = "0%" if receipt['fee_rate'] == 0 else "1.5% x2"
+            msg = (
+                f"{pnl_emoji} *SELL EXEC: {receipt['symbol']}*\n"
+                f"**Reason:** {reason}\n"
+                f"**Price:** ${receipt['exit_price']:.2f}\n"
+                f"**Net P&L:** ${receipt['pnl']:.2f} ({receipt['pnl_percent']:.2f}%)\n"
+                f"**Fee Structure:** {fee_lbl}\n"
+                f"**Total Equity:** ${self.trader.balance:.2f}"
+            )
+            self.send_telegram_alert(msg)
+        return receipts
+
+    @traced("executor.record_equity")
+    async def record_equity(self, prices=None):
+        """Appends this cycle's equity sample, marked at the prices monitoring already fetched."""
+        await adb.record_equity(self.trader.mark_to_market(prices))
@@ -7,6 +7,7 @@ import os
 # Ensure we can import core components
 sys.path.append(os.getcwd())
 
+import database as db
 from core.market_scanner import MarketScanner
 from core.trade_executor import TradeExecutor
 import core.market_scanner
@@ -24,6 +25,7 @@ async def run_verification():
     logger.info("🚀 Starting Full Logic Verification (High Balance Simulation)")
     
     # 1. Initialize Components
+    db.migrate()
     executor = TradeExecutor()
     scanner = MarketScanner(executor)
     
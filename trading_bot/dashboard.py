@@ -45,11 +45,15 @@ with col4:
 
 st.markdown("---")
 
+# Rows per page for the log/trade tables (bounded regardless of table size)
+PAGE_SIZE = 500
+ANALYSIS_COLUMNS = ['symbol', 'action_taken', 'reason', 'sentiment_score', 'pe_ratio', 'price']
+
 def load_data():
     balance = db.get_balance()
     positions = db.get_positions()
-    trades = db.get_all_trades()
-    return balance, positions, trades
+    trade_summary = db.get_trade_summary()
+    return balance, positions, trade_summary
 
 @st.cache_data(ttl=86400) # Cache for 24h
 def get_ticker_map():
@@ -188,7 +192,7 @@ def get_sniper_status():
 st.title("🦅 Trading Bot Live Command")
 
 # Load Data
-balance, positions, trades = load_data()
+balance, positions, trade_summary = load_data()
 
 # --- METRICS CALCULATION ---
 invested_capital = 0.0
@@ -205,16 +209,9 @@ if positions:
         portfolio_dist.append({'Symbol': sym, 'Value': val})
 
 total_equity = balance + invested_capital
-total_pnl = 0.0
-win_rate = 0.0
-trade_count = len(trades)
-
-if trades:
-    df_trades = pd.DataFrame(trades)
-    total_pnl = df_trades['pnl'].sum()
-    wins = df_trades[df_trades['pnl'] > 0]
-    if len(df_trades) > 0:
-        win_rate = (len(wins) / len(df_trades)) * 100
+total_pnl = trade_summary['total_pnl']
+trade_count = trade_summary['count']
+win_rate = (trade_summary['wins'] / trade_count) * 100 if trade_count else 0.0
 
 # Top Row Metrics
 col1, col2, col3, col4 = st.columns(4)
@@ -229,6 +226,13 @@ with col4:
     color = "normal"
     st.metric("Realized P&L", f"${total_pnl:,.2f}", delta=f"{total_pnl:,.2f}")
 
+# Equity curve: per-cycle mark-to-market samples (hourly/daily beyond 48h)
+equity_curve = db.get_equity_history(since=datetime.now() - timedelta(days=90), fmt='pandas')
+if equity_curve is not None and not equity_curve.empty:
+    fig = px.area(equity_curve, x='ts', y='equity', title="Equity (Mark-to-Market)")
+    fig.update_layout(margin=dict(t=30, b=0, l=0, r=0), height=250, xaxis_title=None, yaxis_title=None)
+    st.plotly_chart(fig, use_container_width=True)
+
 st.divider()
 
 # Create tabs - Reordered for better UX
@@ -293,42 +297,39 @@ with tab1:
 with tab2:
     st.subheader("🤖 Bot Brain Analysis")
     
-    # Get analysis data
-    analysis_data = db.get_recent_analysis(limit=5000)
-    
-    if analysis_data:
-        df_analysis = pd.DataFrame(analysis_data)
-        df_analysis['timestamp'] = pd.to_datetime(df_analysis['timestamp'])
-        
-        # KEY CHANGE: Default Filters
-        # Only show interesting events by default
-        default_actions = ['BOUGHT', 'SOLD', 'BUY_SIGNAL', 'SELL_SIGNAL']
-        available_actions = df_analysis['action_taken'].unique().tolist()
-        
-        # Ensure defaults exist in available
-        defaults = [x for x in default_actions if x in available_actions]
-        # If regular 'BUY' / 'SELL' exist in DB from old logs, include them
-        defaults.extend([x for x in ['BUY', 'SELL'] if x in available_actions])
-        
-        col_filter1, col_filter2 = st.columns(2)
-        with col_filter1:
-            action_filter = st.multiselect(
-                "Filter Log Events",
-                options=available_actions,
-                default=defaults if defaults else available_actions
-            )
-        with col_filter2:
-             st.caption("ℹ️ 'INSUFFICIENT_FUNDS' and 'REJECTED' are hidden by default to reduce noise.")
+    # KEY CHANGE: Default Filters
+    # Only show interesting events by default
+    default_actions = ['BOUGHT', 'SOLD', 'BUY_SIGNAL', 'SELL_SIGNAL']
+    # Actions seen in the last 24h come from the hourly counters, not a scan of the log
+    available_actions = sorted(a for a in ((db.get_analysis_stats() or {}).get('actions') or {}) if a)
+
+    # Ensure defaults exist in available
+    defaults = [x for x in default_actions if x in available_actions]
+    # If regular 'BUY' / 'SELL' exist in DB from old logs, include them
+    defaults.extend([x for x in ['BUY', 'SELL'] if x in available_actions])
+
+    col_filter1, col_filter2 = st.columns(2)
+    with col_filter1:
+        action_filter = st.multiselect(
+            "Filter Log Events",
+            options=available_actions,
+            default=defaults if defaults else available_actions
+        )
+    with col_filter2:
+         st.caption("ℹ️ 'INSUFFICIENT_FUNDS' and 'REJECTED' are hidden by default to reduce noise.")
 
-        filtered_df = df_analysis[df_analysis['action_taken'].isin(action_filter)]
-        filtered_df = filtered_df.sort_values('timestamp', ascending=False)
+    # Filter, projection and limit are applied in SQL
+    filtered_df = db.get_analysis_page(limit=PAGE_SIZE, columns=ANALYSIS_COLUMNS, actions=action_filter, fmt='pandas')
+
+    if filtered_df is not None and not filtered_df.empty:
+        filtered_df['timestamp'] = pd.to_datetime(filtered_df['timestamp'])
         
         # Add Names
         ticker_map = get_ticker_map()
         filtered_df['name'] = filtered_df['symbol'].map(ticker_map).fillna(filtered_df['symbol'])
         
         # Formatting for Table
-        display_df = filtered_df[['timestamp', 'symbol', 'name', 'action_taken', 'reason', 'sentiment_score', 'pe_ratio', 'price']].head(500).copy()
+        display_df = filtered_df[['timestamp', 'symbol', 'name', 'action_taken', 'reason', 'sentiment_score', 'pe_ratio', 'price']].copy()
         display_df['timestamp'] = display_df['timestamp'].dt.strftime('%H:%M:%S')
         display_df['sentiment_score'] = pd.to_numeric(display_df['sentiment_score'], errors='coerce').round(2)
         display_df['pe_ratio'] = pd.to_numeric(display_df['pe_ratio'], errors='coerce').round(1)
@@ -351,10 +352,24 @@ with tab2:
 
 with tab3:
     st.subheader("📜 Trade History")
-    if trades:
-        df_trades = pd.DataFrame(trades)
+    # Keyset cursor: (date, id) of the last row on the previous page
+    cursors = st.session_state.setdefault('trade_cursors', [])
+    before_ts, before_id = cursors[-1] if cursors else (None, None)
+    df_trades = db.get_trades_page(limit=PAGE_SIZE, before_ts=before_ts, before_id=before_id, fmt='pandas')
+
+    if df_trades is not None and not df_trades.empty:
         df_trades['date'] = pd.to_datetime(df_trades['date'])
-        df_trades = df_trades.sort_values(by='date', ascending=False)
+
+        col_prev, col_next, _ = st.columns([1, 1, 6])
+        with col_prev:
+            if cursors and st.button("◀ Newer"):
+                cursors.pop()
+                st.rerun()
+        with col_next:
+            if len(df_trades) == PAGE_SIZE and st.button("Older ▶"):
+                last = df_trades.iloc[-1]
+                cursors.append((last['date'].to_pydatetime(), int(last['id'])))
+                st.rerun()
         
         # PnL Chart
         fig = px.bar(df_trades, x='date', y='pnl', title="Realized PnL per Trade", color='pnl', color_continuous_scale=['red', 'green'])
@@ -1,34 +1,129 @@
 import os
+import gzip
+import time
 import logging
 import json
-from datetime import datetime, timedelta
-from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Float, DateTime, Text, select, insert, update, delete, func
+import threading
+import select as select_module
+from datetime import datetime, timedelta, date
+from sqlalchemy import create_engine, MetaData, Table, Column, Index, Integer, String, Float, Date, DateTime, Text, select, insert, update, delete, func, text, inspect, and_, or_, case
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from core.tracing import traced
 
 # Config
 logger = logging.getLogger("Database")
 # Default to SQLite for local dev if ENV not set, but Docker will provide Postgres URL
 DB_URL = os.getenv("DATABASE_URL", "sqlite:///data/trading_bot.db") 
+# Rows per multi-VALUES statement (keeps SQLite under its bound-parameter limit)
+UPSERT_CHUNK_SIZE = 500
+# Cached P/E values older than this are treated as missing; the off-hours
+# refresher (core/fundamentals_refresher.py) keeps the universe well inside it
+FUNDAMENTALS_MAX_AGE_HOURS = int(os.getenv("FUNDAMENTALS_MAX_AGE_HOURS", "48"))
+
+# Connection pool (ignored for in-memory SQLite, which keeps one connection per thread)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT", "30"))
 
 # SQLAlchemy Setup
-try:
-    engine = create_engine(DB_URL, pool_pre_ping=True)
-    metadata = MetaData()
-except Exception as e:
-    logger.error(f"Failed to create DB engine: {e}")
-    engine = None
-    metadata = None
+# The engine is created on first use (see get_engine) and the schema is only
+# touched by migrate(), so importing this module does no I/O.
+metadata = MetaData()
+_engine = None
+_engine_lock = threading.Lock()
+_pool_stats = {'checkouts': 0, 'total_wait_ms': 0.0, 'max_wait_ms': 0.0, 'timeouts': 0}
+
+class _TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            _pool_stats['timeouts'] += 1
+            raise
+        finally:
+            wait_ms = (time.perf_counter() - start) * 1000
+            _pool_stats['checkouts'] += 1
+            _pool_stats['total_wait_ms'] += wait_ms
+            _pool_stats['max_wait_ms'] = max(_pool_stats['max_wait_ms'], wait_ms)
+
+def engine_options(url, pool_class=None):
+    """Pool keyword arguments for create_engine / create_async_engine."""
+    options = {'pool_pre_ping': True}
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return options
+    options.update(
+        pool_size=POOL_SIZE,
+        max_overflow=POOL_MAX_OVERFLOW,
+        pool_recycle=POOL_RECYCLE_SECONDS,
+        pool_timeout=POOL_TIMEOUT_SECONDS
+    )
+    if pool_class is not None:
+        options['poolclass'] = pool_class
+    return options
+
+def get_engine():
+    """Returns the shared engine, creating it on first call (None if that fails)."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                try:
+                    _engine = create_engine(DB_URL, **engine_options(DB_URL, _TimedQueuePool))
+                except Exception as e:
+                    logger.error(f"Failed to create DB engine: {e}")
+                    return None
+    return _engine
+
+def get_pool_stats():
+    """Connection pool usage: checked-out/idle connections, overflow and checkout wait times."""
+    stats = {
+        'pool': type(_engine.pool).__name__ if _engine is not None else None,
+        'checkouts': _pool_stats['checkouts'],
+        'avg_wait_ms': round(_pool_stats['total_wait_ms'] / _pool_stats['checkouts'], 3) if _pool_stats['checkouts'] else 0.0,
+        'max_wait_ms': round(_pool_stats['max_wait_ms'], 3),
+        'timeouts': _pool_stats['timeouts']
+    }
+    if _engine is not None and isinstance(_engine.pool, QueuePool):
+        pool = _engine.pool
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(0, pool.overflow()),
+            max_overflow=POOL_MAX_OVERFLOW
+        )
+    return stats
+
+def __getattr__(name):
+    # Keeps `db.engine` / `from database import engine` working without creating it at import
+    if name == 'engine':
+        return get_engine()
+    raise AttributeError(f"module 'database' has no attribute '{name}'")
 
 # --- Table Definitions ---
 fundamentals = Table('fundamentals', metadata,
     Column('symbol', String, primary_key=True),
     Column('pe_ratio', Float),
-    Column('last_updated', DateTime)
+    Column('last_updated', DateTime),   # when pe_ratio was last fetched successfully
+    Column('last_attempt', DateTime),   # last fetch attempt, successful or not
+    Column('fetch_status', String),     # ok / no_data / error
+    Column('error_count', Integer)      # consecutive failed attempts
 )
 
 portfolio = Table('portfolio', metadata,
     Column('id', Integer, primary_key=True),
-    Column('balance', Float)
+    Column('balance', Float),
+    Column('version', Integer)  # bumped by every portfolio/position/trade write
 )
 
 positions = Table('positions', metadata,
@@ -65,6 +160,38 @@ analysis_log = Table('analysis_log', metadata,
     Column('price', Float)
 )
 
+analysis_log_daily = Table('analysis_log_daily', metadata,
+    Column('day', Date, primary_key=True),
+    Column('symbol', String, primary_key=True),
+    Column('action_taken', String, primary_key=True),
+    Column('count', Integer),
+    Column('sum_volume_ratio', Float),
+    Column('sum_sentiment_score', Float),
+    Column('min_price', Float),
+    Column('max_price', Float)
+)
+
+# Single-row counter bumped by every config/cache write (L1 invalidation)
+kv_version = Table('kv_version', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('version', Integer)
+)
+
+# Rolling counters maintained on every analysis_log write (see log_analysis_many)
+analysis_stats_hourly = Table('analysis_stats_hourly', metadata,
+    Column('bucket', DateTime, primary_key=True),
+    Column('action_taken', String, primary_key=True),
+    Column('symbol', String, primary_key=True),
+    Column('count', Integer)
+)
+
+# Indexes for the time-range and per-symbol queries used by the dashboard and stats.
+# (timestamp, id) / (date, id) match the keyset pagination order exactly.
+Index('ix_analysis_log_timestamp_id', analysis_log.c.timestamp, analysis_log.c.id)
+Index('ix_analysis_log_symbol_timestamp', analysis_log.c.symbol, analysis_log.c.timestamp)
+Index('ix_trades_date_id', trades.c.date, trades.c.id)
+Index('ix_trades_symbol', trades.c.symbol)
+
 system_config = Table('system_config', metadata,
     Column('key', String, primary_key=True),
     Column('value', Text),
@@ -77,111 +204,602 @@ response_cache = Table('response_cache', metadata,
     Column('expires_at', DateTime)
 )
 
-# --- Init ---
-def init_db():
-    if not engine: return
+# Append-only record of every cash/position change; portfolio + positions are
+# its materialized projection. Replay rules (see _apply_ledger):
+#   DEPOSIT  amount is added to the balance (top-ups, manual adjustments)
+#   FILL     amount is the gross trade value (+ sell / - buy); detail is the
+#            opened position for a BUY, NULL (closed) for a SELL
+#   FEE      amount is the (negative) fee charged on the fill with the same trade_id
+#   POSITION manual position write: detail, or NULL to remove it
+#   RESET    balance := amount and all positions are closed
+ledger = Table('ledger', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),  # the ledger offset
+    Column('ts', DateTime),
+    Column('kind', String),
+    Column('symbol', String),
+    Column('action', String),
+    Column('shares', Float),
+    Column('price', Float),
+    Column('fee_rate', Float),
+    Column('amount', Float),
+    Column('trade_id', Integer),
+    Column('detail', Text)  # JSON position
+)
+
+# Portfolio state after applying every ledger entry up to and including ledger_id
+portfolio_snapshots = Table('portfolio_snapshots', metadata,
+    Column('ledger_id', Integer, primary_key=True),
+    Column('ts', DateTime),         # ts of that ledger entry
+    Column('balance', Float),
+    Column('positions', Text),      # JSON {symbol: position}
+    Column('created_at', DateTime)
+)
+
+Index('ix_ledger_ts_id', ledger.c.ts, ledger.c.id)
+Index('ix_ledger_symbol', ledger.c.symbol)
+
+# One row per parameter set evaluated by a sweep run (core/sweep.py)
+sweep_results = Table('sweep_results', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('run_id', String),
+    Column('created_at', DateTime),
+    Column('params', Text),             # JSON
+    Column('total_return_pct', Float),
+    Column('max_drawdown_pct', Float),
+    Column('turnover', Float),
+    Column('sharpe', Float),
+    Column('trades', Integer),
+    Column('win_rate_pct', Float),
+    Column('rank', Integer)             # 1 = best of its run
+)
+
+Index('ix_sweep_results_run_rank', sweep_results.c.run_id, sweep_results.c.rank)
+
+# Mark-to-market equity, one sample per orchestrator cycle (downsampled with age)
+equity_history = Table('equity_history', metadata,
+    Column('ts', DateTime, primary_key=True),
+    Column('equity', Float),    # cash + exposure
+    Column('cash', Float),
+    Column('exposure', Float)   # market value of open positions
+)
+
+# --- Upserts ---
+def _upsert(conn, table, rows, increment=()):
+    """
+    Native upsert keyed on the table's primary key.
+    PostgreSQL and SQLite use INSERT ... ON CONFLICT DO UPDATE with one
+    multi-VALUES statement per chunk; other dialects fall back to
+    delete-then-insert inside the caller's transaction.
+    Columns listed in `increment` are added to the stored value instead of
+    replacing it (counters); callers must pre-aggregate duplicate keys.
+    """
+    if isinstance(rows, dict):
+        rows = [rows]
+    if not rows:
+        return
+
+    key_cols = [c.name for c in table.primary_key.columns]
+
+    # ON CONFLICT cannot touch the same row twice in one statement: last write wins
+    deduped = {}
+    for row in rows:
+        deduped[tuple(row[k] for k in key_cols)] = row
+    rows = list(deduped.values())
+
+    dialect = conn.dialect.name
+    if dialect not in ('postgresql', 'sqlite'):
+        for row in rows:
+            match = [table.c[k] == row[k] for k in key_cols]
+            if increment:
+                result = conn.execute(update(table).where(*match).values(
+                    {c: (func.coalesce(table.c[c], 0) + row[c]) if c in increment else row[c] for c in row if c not in key_cols}
+                ))
+                if result.rowcount:
+                    continue
+            else:
+                conn.execute(delete(table).where(*match))
+            conn.execute(insert(table).values(row))
+        return
+
+    insert_fn = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    update_cols = [c for c in rows[0] if c not in key_cols]
+    stmt = insert_fn(table)
+    if update_cols:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_cols,
+            set_={c: (func.coalesce(table.c[c], 0) + stmt.excluded[c]) if c in increment else stmt.excluded[c] for c in update_cols}
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=key_cols)
+
+    if len(rows) == 1:
+        conn.execute(stmt, rows[0])
+        return
+    for i in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        conn.execute(stmt.values(rows[i:i + UPSERT_CHUNK_SIZE]))
+
+# --- Schema Management ---
+# Monthly RANGE partitions on Postgres; the DEFAULT partition only catches stragglers
+ANALYSIS_PARTITION_DDL = """
+CREATE TABLE analysis_log (
+    id BIGSERIAL,
+    symbol VARCHAR,
+    "timestamp" TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    volume_ratio FLOAT,
+    sentiment_score FLOAT,
+    pe_ratio FLOAT,
+    technical_signal VARCHAR,
+    action_taken VARCHAR,
+    reason TEXT,
+    price FLOAT,
+    PRIMARY KEY (id, "timestamp")
+) PARTITION BY RANGE ("timestamp")
+"""
+
+def _month_start(d):
+    return datetime(d.year, d.month, 1)
+
+def _next_month(d):
+    return datetime(d.year + (d.month // 12), d.month % 12 + 1, 1)
+
+def _partition_name(month):
+    return f"analysis_log_y{month.year}m{month.month:02d}"
+
+def _analysis_relkind(conn):
+    return conn.execute(text("SELECT relkind FROM pg_class WHERE relname = 'analysis_log' AND relkind IN ('r', 'p')")).scalar()
+
+def _create_partitions(conn, start, end):
+    """Creates monthly partitions covering [start, end) if missing."""
+    month = _month_start(start)
+    while month < end:
+        nxt = _next_month(month)
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {_partition_name(month)} PARTITION OF analysis_log "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{nxt:%Y-%m-%d}')"
+        ))
+        month = nxt
+
+def _ensure_partitioned_analysis_log(conn, months_ahead=2):
+    relkind = _analysis_relkind(conn)
+    horizon = _next_month(datetime.now())
+    for _ in range(months_ahead):
+        horizon = _next_month(horizon)
+
+    if relkind == 'p':
+        _create_partitions(conn, datetime.now(), horizon)
+        return
+
+    if relkind == 'r':
+        # One-off conversion of the plain table created by older versions
+        logger.info("Converting analysis_log to a partitioned table...")
+        conn.execute(text("ALTER TABLE analysis_log RENAME TO analysis_log_legacy"))
+        for idx in ('ix_analysis_log_timestamp', 'ix_analysis_log_timestamp_id', 'ix_analysis_log_symbol_timestamp'):
+            conn.execute(text(f"DROP INDEX IF EXISTS {idx}"))
+        conn.execute(text(ANALYSIS_PARTITION_DDL))
+        conn.execute(text("CREATE TABLE analysis_log_default PARTITION OF analysis_log DEFAULT"))
+        oldest = conn.execute(text('SELECT MIN("timestamp") FROM analysis_log_legacy')).scalar()
+        _create_partitions(conn, oldest or datetime.now(), horizon)
+        conn.execute(text(
+            'INSERT INTO analysis_log (id, symbol, "timestamp", volume_ratio, sentiment_score, pe_ratio, '
+            'technical_signal, action_taken, reason, price) '
+            'SELECT id, symbol, COALESCE("timestamp", now()), volume_ratio, sentiment_score, pe_ratio, '
+            'technical_signal, action_taken, reason, price FROM analysis_log_legacy'
+        ))
+        conn.execute(text(
+            "SELECT setval(pg_get_serial_sequence('analysis_log', 'id'), "
+            "COALESCE((SELECT MAX(id) FROM analysis_log), 0) + 1, false)"
+        ))
+        conn.execute(text("DROP TABLE analysis_log_legacy"))
+        return
+
+    conn.execute(text(ANALYSIS_PARTITION_DDL))
+    conn.execute(text("CREATE TABLE analysis_log_default PARTITION OF analysis_log DEFAULT"))
+    _create_partitions(conn, datetime.now(), horizon)
+
+def ensure_partitions(months_ahead=2):
+    """Creates upcoming monthly analysis_log partitions (Postgres only; run nightly)."""
+    engine = get_engine()
+    if not engine or engine.dialect.name != 'postgresql': return
     try:
-        metadata.create_all(engine)
-        
-        # Init Portfolio with check
         with engine.begin() as conn:
-            result = conn.execute(select(portfolio)).fetchone()
-            if result is None:
-                # Default to $10,000
-                conn.execute(insert(portfolio).values(id=1, balance=10000.0))
-                
-        logger.info("Database initialized successfully (SQLAlchemy).")
+            _ensure_partitioned_analysis_log(conn, months_ahead)
     except Exception as e:
-        logger.error(f"Failed to init DB: {e}")
+        logger.error(f"Partition maintenance failed: {e}")
+
+# --- Migrations ---
+# Applied in order by migrate(), each in its own transaction, and recorded in
+# schema_version. Steps are idempotent so databases created before the
+# migration table existed are adopted without changes. Append new steps; never
+# edit or reorder ones that have shipped.
+schema_version = Table('schema_version', metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String),
+    Column('applied_at', DateTime)
+)
+
+def _create_indexes(conn, *tables):
+    # create_all skips indexes on tables that already exist
+    for table in tables:
+        for index in table.indexes:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+
+def _migration_base_tables(conn):
+    if conn.dialect.name == 'postgresql':
+        _ensure_partitioned_analysis_log(conn)
+    metadata.create_all(conn, tables=[fundamentals, portfolio, positions, trades, analysis_log, system_config, response_cache])
+
+def _migration_analysis_indexes(conn):
+    metadata.create_all(conn, tables=[analysis_log_daily])
+    _create_indexes(conn, analysis_log, trades)
+
+def _migration_analysis_stats(conn):
+    metadata.create_all(conn, tables=[analysis_stats_hourly])
+    if conn.execute(select(analysis_stats_hourly.c.bucket).limit(1)).first() is None:
+        _rebuild_analysis_stats(conn, 48)
+
+def _migration_kv_version(conn):
+    metadata.create_all(conn, tables=[kv_version])
+
+def _migration_seed_portfolio(conn):
+    if conn.execute(select(portfolio.c.id)).first() is None:
+        # Default to $10,000
+        conn.execute(insert(portfolio).values(id=1, balance=10000.0))
+
+def _migration_keyset_indexes(conn):
+    _create_indexes(conn, analysis_log, trades)
+    # Superseded by the (timestamp, id) / (date, id) indexes
+    for idx in ('ix_analysis_log_timestamp', 'ix_trades_date'):
+        conn.execute(text(f"DROP INDEX IF EXISTS {idx}"))
+
+def _add_column(conn, table, column):
+    if column.name not in {c['name'] for c in inspect(conn).get_columns(table.name)}:
+        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"))
+
+def _migration_fundamentals_freshness(conn):
+    for name in ('last_attempt', 'fetch_status', 'error_count'):
+        _add_column(conn, fundamentals, fundamentals.c[name])
+
+def _migration_portfolio_version(conn):
+    _add_column(conn, portfolio, portfolio.c.version)
+    conn.execute(update(portfolio).where(portfolio.c.version.is_(None)).values(version=0))
+
+def _migration_ledger(conn):
+    metadata.create_all(conn, tables=[ledger, portfolio_snapshots])
+    _create_indexes(conn, ledger)
+    if conn.execute(select(ledger.c.id).limit(1)).first() is None:
+        # Opening entries: the current tables become the ledger's starting state
+        now = datetime.now()
+        _append_ledger(conn, [_ledger_row('RESET', now, amount=_get_balance(conn))])
+        rows = [_ledger_row('POSITION', now, symbol, detail=_position_detail(symbol, pos))
+                for symbol, pos in _get_positions(conn).items()]
+        if rows:
+            _append_ledger(conn, rows)
+        _snapshot_portfolio(conn)
+
+def _migration_sweep_results(conn):
+    metadata.create_all(conn, tables=[sweep_results])
+    _create_indexes(conn, sweep_results)
+
+def _migration_equity_history(conn):
+    metadata.create_all(conn, tables=[equity_history])
+
+MIGRATIONS = [
+    (1, "Base tables (analysis_log partitioned on Postgres)", _migration_base_tables),
+    (2, "analysis_log/trades indexes and daily rollup", _migration_analysis_indexes),
+    (3, "Hourly analysis stats", _migration_analysis_stats),
+    (4, "kv_version for L1 cache invalidation", _migration_kv_version),
+    (5, "Seed portfolio balance", _migration_seed_portfolio),
+    (6, "Keyset pagination indexes", _migration_keyset_indexes),
+    (7, "Per-symbol fundamentals freshness", _migration_fundamentals_freshness),
+    (8, "Portfolio version for in-memory state", _migration_portfolio_version),
+    (9, "Portfolio ledger and snapshots", _migration_ledger),
+    (10, "Parameter sweep results", _migration_sweep_results),
+    (11, "Equity time series", _migration_equity_history)
+]
+
+def get_schema_version(conn=None):
+    if conn is None:
+        engine = get_engine()
+        if not engine: return 0
+        with engine.connect() as conn:
+            return get_schema_version(conn)
+    if not inspect(conn).has_table('schema_version'):
+        return 0
+    return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+def migrate():
+    """
+    Brings the schema up to date. Run once per deploy/startup by the
+    orchestrator (or `python database.py`), not on import.
+    Returns the resulting schema version, or None on failure.
+    """
+    engine = get_engine()
+    if not engine: return None
+    try:
+        with engine.begin() as conn:
+            metadata.create_all(conn, tables=[schema_version])
+            current = get_schema_version(conn)
+        for version, description, step in MIGRATIONS:
+            if version <= current:
+                continue
+            with engine.begin() as conn:
+                step(conn)
+                conn.execute(insert(schema_version).values(version=version, description=description, applied_at=datetime.now()))
+            current = version
+            logger.info(f"Applied migration {version}: {description}")
+        return current
+    except Exception as e:
+        logger.error(f"Migration failed: {e}")
+        return None
+
+def init_db():
+    """Kept for older scripts; equivalent to migrate()."""
+    migrate()
 
 # --- Fundamentals ---
+# Each public function below wraps a connection-level helper (_name(conn, ...)),
+# shared with the asyncio API in database_async.py via run_sync().
+def _fundamentals_cutoff():
+    return datetime.now() - timedelta(hours=FUNDAMENTALS_MAX_AGE_HOURS)
+
+def _get_fundamental(conn, symbol):
+    stmt = select(fundamentals.c.pe_ratio).where(fundamentals.c.symbol == symbol, fundamentals.c.last_updated > _fundamentals_cutoff())
+    return conn.execute(stmt).scalar()
+
+@traced("db.get_fundamental")
 def get_fundamental(symbol):
+    engine = get_engine()
     if not engine: return None
     try:
         with engine.connect() as conn:
-            stmt = select(fundamentals.c.pe_ratio, fundamentals.c.last_updated).where(fundamentals.c.symbol == symbol)
-            row = conn.execute(stmt).fetchone()
-            if row:
-                last_updated = row.last_updated
-                if datetime.now() - last_updated < timedelta(hours=24):
-                    return row.pe_ratio
-        return None
+            return _get_fundamental(conn, symbol)
     except Exception as e:
         logger.error(f"DB Error: {e}")
         return None
 
 def set_fundamental(symbol, pe_ratio):
-    if not engine: return
+    set_fundamentals_many({symbol: pe_ratio})
+
+def _set_fundamentals_many(conn, pe_by_symbol):
+    now = datetime.now()
+    _upsert(conn, fundamentals, [
+        {'symbol': sym, 'pe_ratio': pe, 'last_updated': now, 'last_attempt': now, 'fetch_status': 'ok', 'error_count': 0}
+        for sym, pe in pe_by_symbol.items()
+    ])
+
+def set_fundamentals_many(pe_by_symbol):
+    """Bulk upsert of {symbol: pe_ratio} in one transaction."""
+    engine = get_engine()
+    if not engine or not pe_by_symbol: return
     try:
         with engine.begin() as conn:
-            # Upsert Logic: Delete then Insert (Simplest cross-dialect for single row)
-            conn.execute(delete(fundamentals).where(fundamentals.c.symbol == symbol))
-            conn.execute(insert(fundamentals).values(
-                symbol=symbol, pe_ratio=pe_ratio, last_updated=datetime.now()
-            ))
+            _set_fundamentals_many(conn, pe_by_symbol)
     except Exception as e:
         logger.error(f"DB Error: {e}")
 
+def _get_fundamentals_many(conn, symbols):
+    cutoff = _fundamentals_cutoff()
+    symbols = list(dict.fromkeys(symbols))
+    found = {}
+    for i in range(0, len(symbols), UPSERT_CHUNK_SIZE):
+        rows = conn.execute(
+            select(fundamentals.c.symbol, fundamentals.c.pe_ratio)
+            .where(fundamentals.c.symbol.in_(symbols[i:i + UPSERT_CHUNK_SIZE]), fundamentals.c.last_updated > cutoff)
+        )
+        found.update({row.symbol: row.pe_ratio for row in rows})
+    return found
+
+def get_fundamentals_many(symbols):
+    """Fresh cached P/E ratios for `symbols` in one IN query; misses are absent."""
+    engine = get_engine()
+    if not engine or not symbols: return {}
+    try:
+        with engine.connect() as conn:
+            return _get_fundamentals_many(conn, symbols)
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+        return {}
+
+def record_fundamental_failures(statuses):
+    """
+    Records failed refresh attempts ({symbol: 'no_data' | 'error'}) without
+    touching any cached P/E; errors add to error_count.
+    """
+    engine = get_engine()
+    if not engine or not statuses: return
+    now = datetime.now()
+    try:
+        with engine.begin() as conn:
+            _upsert(conn, fundamentals, [
+                {'symbol': sym, 'last_attempt': now, 'fetch_status': status, 'error_count': int(status == 'error')}
+                for sym, status in statuses.items()
+            ], increment=('error_count',))
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+
+def get_fundamentals_due(symbols, older_than_hours):
+    """
+    Symbols whose last refresh attempt is missing or older than `older_than_hours`,
+    stalest first (never-attempted symbols lead). A refresh interrupted midway
+    resumes with whatever it had not reached yet.
+    """
+    engine = get_engine()
+    if not engine or not symbols: return []
+    cutoff = datetime.now() - timedelta(hours=older_than_hours)
+    symbols = list(dict.fromkeys(symbols))
+    try:
+        attempted = {}
+        with engine.connect() as conn:
+            for i in range(0, len(symbols), UPSERT_CHUNK_SIZE):
+                rows = conn.execute(
+                    select(fundamentals.c.symbol, func.coalesce(fundamentals.c.last_attempt, fundamentals.c.last_updated).label('attempt'))
+                    .where(fundamentals.c.symbol.in_(symbols[i:i + UPSERT_CHUNK_SIZE]))
+                )
+                attempted.update({row.symbol: row.attempt for row in rows})
+        due = [s for s in symbols if attempted.get(s) is None or attempted[s] < cutoff]
+        return sorted(due, key=lambda s: attempted.get(s) or datetime.min)
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+        return []
+
+def get_fundamentals_freshness():
+    """Universe-wide view: symbols tracked, fresh P/E count, last attempt status counts, oldest value."""
+    engine = get_engine()
+    if not engine: return {}
+    try:
+        with engine.connect() as conn:
+            total, fresh, oldest = conn.execute(select(
+                func.count(),
+                func.coalesce(func.sum(case((fundamentals.c.last_updated > _fundamentals_cutoff(), 1), else_=0)), 0),
+                func.min(fundamentals.c.last_updated)
+            )).one()
+            statuses = conn.execute(
+                select(fundamentals.c.fetch_status, func.count()).group_by(fundamentals.c.fetch_status)
+            ).all()
+        return {'symbols': total, 'fresh': int(fresh), 'oldest': oldest, 'status': {row[0] or 'unknown': row[1] for row in statuses}}
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+        return {}
+
 # --- Portfolio & Positions ---
+# PaperTrader keeps the portfolio in memory and treats it as authoritative.
+# Every write below bumps portfolio.version so the trader can detect foreign
+# writes with one cheap query, and record_fill can refuse to apply a fill
+# planned on stale state (expected_version).
+class PortfolioConflict(RuntimeError):
+    """The portfolio changed since the caller last loaded it."""
+
+def _bump_portfolio_version(conn):
+    conn.execute(update(portfolio).where(portfolio.c.id == 1).values(version=func.coalesce(portfolio.c.version, 0) + 1))
+
+def _get_portfolio_version(conn):
+    return conn.execute(select(portfolio.c.version).where(portfolio.c.id == 1)).scalar()
+
+def get_portfolio_version():
+    engine = get_engine()
+    if not engine: return None
+    try:
+        with engine.connect() as conn:
+            return _get_portfolio_version(conn)
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+        return None
+
+def _get_portfolio_state(conn):
+    row = conn.execute(select(portfolio.c.balance, portfolio.c.version).where(portfolio.c.id == 1)).fetchone()
+    return {
+        'balance': row.balance if row else 0.0,
+        'version': row.version if row else None,
+        'positions': _get_positions(conn),
+        'trade_count': _get_trade_count(conn)
+    }
+
+def get_portfolio_state():
+    """Balance, version, positions and trade count read on one connection (None on error)."""
+    engine = get_engine()
+    if not engine: return None
+    try:
+        with engine.connect() as conn:
+            return _get_portfolio_state(conn)
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+        return None
+
+def _get_balance(conn):
+    row = conn.execute(select(portfolio.c.balance).where(portfolio.c.id == 1)).fetchone()
+    return row.balance if row else 0.0
+
 def get_balance():
+    engine = get_engine()
     if not engine: return 0.0
     try:
         with engine.connect() as conn:
-            row = conn.execute(select(portfolio.c.balance).where(portfolio.c.id == 1)).fetchone()
-            return row.balance if row else 0.0
+            return _get_balance(conn)
     except Exception as e:
         logger.error(f"DB Error: {e}")
         return 0.0
 
 def update_balance(new_balance):
+    engine = get_engine()
+    if not engine: return
+    try:
+        with engine.begin() as conn:
+            old_balance = _get_balance(conn)
+            conn.execute(update(portfolio).where(portfolio.c.id == 1).values(
+                balance=new_balance, version=func.coalesce(portfolio.c.version, 0) + 1
+            ))
+            _append_ledger(conn, [_ledger_row('DEPOSIT', datetime.now(), amount=new_balance - old_balance)])
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+
+def reset_portfolio(balance):
+    """Closes every position (without trades) and sets the cash balance, recorded as a ledger RESET."""
+    engine = get_engine()
     if not engine: return
     try:
         with engine.begin() as conn:
-            conn.execute(update(portfolio).where(portfolio.c.id == 1).values(balance=new_balance))
+            conn.execute(delete(positions))
+            conn.execute(update(portfolio).where(portfolio.c.id == 1).values(
+                balance=balance, version=func.coalesce(portfolio.c.version, 0) + 1
+            ))
+            _append_ledger(conn, [_ledger_row('RESET', datetime.now(), amount=balance)])
     except Exception as e:
         logger.error(f"DB Error: {e}")
 
+def _get_positions(conn):
+    rows = conn.execute(select(positions)).mappings().all()
+    result = {}
+    for row in rows:
+        result[row['symbol']] = dict(row)
+        # Cleanup: remove symbol key from inner dict if desired, but keeping all is fine
+    return result
+
 def get_positions():
+    engine = get_engine()
     if not engine: return {}
     try:
         with engine.connect() as conn:
-            rows = conn.execute(select(positions)).mappings().all()
-            result = {}
-            for row in rows:
-                result[row['symbol']] = dict(row)
-                # Cleanup: remove symbol key from inner dict if desired, but keeping all is fine
-            return result
+            return _get_positions(conn)
     except Exception as e:
         logger.error(f"DB Error: {e}")
         return {}
 
+def _position_row(symbol, data):
+    return {
+        'symbol': symbol,
+        'shares': data['shares'],
+        'avg_price': data['avg_price'],
+        'fee_rate': data['fee_rate'],
+        'entry_date': data['entry_date'],
+        'cost_basis': data['cost_basis'],
+        'entry_price_with_fee': data['entry_price_with_fee']
+    }
+
 def add_position(symbol, data):
+    engine = get_engine()
     if not engine: return
     try:
         with engine.begin() as conn:
-            # Upsert
-            conn.execute(delete(positions).where(positions.c.symbol == symbol))
-            conn.execute(insert(positions).values(
-                symbol=symbol,
-                shares=data['shares'],
-                avg_price=data['avg_price'],
-                fee_rate=data['fee_rate'],
-                entry_date=data['entry_date'],
-                cost_basis=data['cost_basis'],
-                entry_price_with_fee=data['entry_price_with_fee']
-            ))
+            _upsert(conn, positions, _position_row(symbol, data))
+            _bump_portfolio_version(conn)
+            _append_ledger(conn, [_ledger_row('POSITION', datetime.now(), symbol, detail=_position_detail(symbol, data))])
     except Exception as e:
         logger.error(f"DB Error: {e}")
 
 def remove_position(symbol):
+    engine = get_engine()
     if not engine: return
     try:
         with engine.begin() as conn:
             conn.execute(delete(positions).where(positions.c.symbol == symbol))
+            _bump_portfolio_version(conn)
+            _append_ledger(conn, [_ledger_row('POSITION', datetime.now(), symbol)])
     except Exception as e:
         logger.error(f"DB Error: {e}")
 
 def log_trade(symbol, action, shares, price, fee_rate, pnl=0.0):
+    """Trade row only: moves no cash or positions, so nothing goes to the ledger."""
+    engine = get_engine()
     if not engine: return
     try:
         with engine.begin() as conn:
@@ -194,72 +812,515 @@ def log_trade(symbol, action, shares, price, fee_rate, pnl=0.0):
                 pnl=pnl,
                 date=datetime.now()
             ))
+            _bump_portfolio_version(conn)
     except Exception as e:
         logger.error(f"DB Error: {e}")
 
+def record_fill(symbol, action, shares, price, fee_rate, balance_delta, position=None, pnl=0.0, expected_version=None):
+    """
+    Unit of work for a single fill: the balance change, the position upsert
+    (BUY) or removal (SELL), the trade row and its FILL/FEE ledger entries are
+    applied in one transaction.
+    With expected_version, the fill only applies if portfolio.version still
+    matches. Returns the fill record (trade id, new balance, new version, date)
+    or None on failure/conflict, in which case nothing was written.
+    """
+    engine = get_engine()
+    if not engine: return None
+    try:
+        with engine.begin() as conn:
+            return _record_fill(conn, symbol, action, shares, price, fee_rate, balance_delta, position, pnl, expected_version)
+    except PortfolioConflict as e:
+        logger.warning(f"Fill {action} {symbol} rejected: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"DB Error (fill {action} {symbol}): {e}")
+        return None
+
+def _record_fill(conn, symbol, action, shares, price, fee_rate, balance_delta, position=None, pnl=0.0, expected_version=None):
+    return _record_fills(conn, [fill_row(symbol, action, shares, price, fee_rate, balance_delta, position, pnl)], expected_version)[0]
+
+def fill_row(symbol, action, shares, price, fee_rate, balance_delta, position=None, pnl=0.0):
+    return {
+        'symbol': symbol,
+        'action': action,
+        'shares': shares,
+        'price': price,
+        'fee_rate': fee_rate,
+        'balance_delta': balance_delta,
+        'position': position,
+        'pnl': pnl
+    }
+
+def _record_fills(conn, fills, expected_version=None):
+    now = datetime.now()
+    stmt = update(portfolio).where(portfolio.c.id == 1)
+    if expected_version is not None:
+        stmt = stmt.where(portfolio.c.version == expected_version)
+    row = conn.execute(
+        stmt.values(balance=portfolio.c.balance + sum(f['balance_delta'] for f in fills), version=func.coalesce(portfolio.c.version, 0) + 1)
+        .returning(portfolio.c.balance, portfolio.c.version)
+    ).fetchone()
+    if row is None:
+        if expected_version is not None:
+            raise PortfolioConflict(f"expected version {expected_version}")
+        raise RuntimeError("Portfolio row missing")
+    new_balance, new_version = row
+
+    buys = [_position_row(f['symbol'], f['position']) for f in fills if f['action'] == 'BUY']
+    sold = [f['symbol'] for f in fills if f['action'] != 'BUY']
+    if buys:
+        _upsert(conn, positions, buys)
+    if sold:
+        conn.execute(delete(positions).where(positions.c.symbol.in_(sold)))
+
+    trade_ids = conn.execute(
+        insert(trades).returning(trades.c.id, sort_by_parameter_order=True),
+        [{'symbol': f['symbol'], 'action': f['action'], 'shares': f['shares'], 'price': f['price'],
+          'fee_rate': f['fee_rate'], 'pnl': f['pnl'], 'date': now} for f in fills]
+    ).scalars().all()
+    _append_ledger(conn, _fill_ledger_rows(fills, trade_ids, now))
+    return [{
+        'trade_id': trade_id,
+        'symbol': f['symbol'],
+        'action': f['action'],
+        'balance': new_balance,
+        'version': new_version,
+        'date': now
+    } for trade_id, f in zip(trade_ids, fills)]
+
+@traced("db.record_fills")
+def record_fills(fills, expected_version=None):
+    """
+    Batched record_fill: all fills (see fill_row) share one transaction, one
+    balance/version update, one position delete/upsert, one trade insert and
+    one ledger insert.
+    Returns the fill records in order (balance/version are the final ones) or
+    None on failure/conflict, in which case nothing was written.
+    """
+    engine = get_engine()
+    if not engine: return None
+    if not fills: return []
+    try:
+        with engine.begin() as conn:
+            return _record_fills(conn, fills, expected_version)
+    except PortfolioConflict as e:
+        logger.warning(f"Batch of {len(fills)} fills rejected: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"DB Error (batch of {len(fills)} fills): {e}")
+        return None
+
+def _get_trade_count(conn):
+    return conn.execute(select(func.count()).select_from(trades)).scalar()
+
 def get_trade_count():
+    engine = get_engine()
     if not engine: return 0
     try:
         with engine.connect() as conn:
-            return conn.execute(select(func.count()).select_from(trades)).scalar()
+            return _get_trade_count(conn)
     except Exception as e:
         logger.error(f"DB Error: {e}")
         return 0
 
+# --- Ledger & Snapshots ---
+# Every portfolio write above also appends to the ledger in the same
+# transaction. Any state (current or historical) is the nearest snapshot at or
+# before the wanted offset plus a replay of the entries after it, so recovery
+# and point-in-time queries read only the tail, never the whole ledger.
+def _ledger_row(kind, ts, symbol=None, action=None, shares=None, price=None, fee_rate=None, amount=0.0, trade_id=None, detail=None):
+    return {
+        'kind': kind,
+        'ts': ts,
+        'symbol': symbol,
+        'action': action,
+        'shares': shares,
+        'price': price,
+        'fee_rate': fee_rate,
+        'amount': amount,
+        'trade_id': trade_id,
+        'detail': json.dumps(detail) if detail is not None else None
+    }
+
+def _position_detail(symbol, data):
+    row = _position_row(symbol, data)
+    del row['symbol']
+    return row
+
+def _fill_ledger_rows(fills, trade_ids, ts):
+    rows = []
+    for trade_id, f in zip(trade_ids, fills):
+        buy = f['action'] == 'BUY'
+        gross = f['shares'] * f['price'] * (-1 if buy else 1)
+        detail = _position_detail(f['symbol'], f['position']) if buy else None
+        common = (ts, f['symbol'], f['action'], f['shares'], f['price'], f['fee_rate'])
+        rows.append(_ledger_row('FILL', *common, amount=gross, trade_id=trade_id, detail=detail))
+        rows.append(_ledger_row('FEE', *common, amount=f['balance_delta'] - gross, trade_id=trade_id))
+    return rows
+
+def _append_ledger(conn, rows):
+    conn.execute(insert(ledger), rows)
+
+def _apply_ledger(state, rows):
+    """Replays ledger rows (in id order) onto state in place; returns it."""
+    for row in rows:
+        if row.kind == 'RESET':
+            state['balance'] = row.amount
+            state['positions'] = {}
+        else:
+            state['balance'] += row.amount or 0.0
+        if row.kind in ('FILL', 'POSITION'):
+            if row.detail:
+                state['positions'][row.symbol] = {'symbol': row.symbol, **json.loads(row.detail)}
+            else:
+                state['positions'].pop(row.symbol, None)
+        state['ledger_id'] = row.id
+        state['ts'] = row.ts
+        state['replayed'] += 1
+    return state
+
+def _load_snapshot(conn, until_id=None):
+    stmt = select(portfolio_snapshots).order_by(portfolio_snapshots.c.ledger_id.desc()).limit(1)
+    if until_id is not None:
+        stmt = stmt.where(portfolio_snapshots.c.ledger_id <= until_id)
+    row = conn.execute(stmt).fetchone()
+    if row is None:
+        return {'ledger_id': 0, 'ts': None, 'balance': 0.0, 'positions': {}, 'snapshot_id': None, 'replayed': 0}
+    return {'ledger_id': row.ledger_id, 'ts': row.ts, 'balance': row.balance,
+            'positions': json.loads(row.positions), 'snapshot_id': row.ledger_id, 'replayed': 0}
+
+def _replay_ledger(conn, until_id=None):
+    """Portfolio state after ledger entry until_id (default: the latest)."""
+    state = _load_snapshot(conn, until_id)
+    stmt = select(ledger).where(ledger.c.id > state['ledger_id'])
+    if until_id is not None:
+        stmt = stmt.where(ledger.c.id <= until_id)
+    return _apply_ledger(state, conn.execute(stmt.order_by(ledger.c.id)))
+
+def _ledger_offset_at(conn, as_of):
+    return conn.execute(select(func.max(ledger.c.id)).where(ledger.c.ts <= as_of)).scalar() or 0
+
+def get_portfolio_at(as_of=None):
+    """
+    Cash and open positions as of a datetime (default: now), rebuilt from the
+    nearest snapshot. Returns {'balance', 'positions', 'invested' (cost basis
+    of open positions), 'ledger_id', 'ts', 'snapshot_id', 'replayed'} or None on error.
+    """
+    engine = get_engine()
+    if not engine: return None
+    try:
+        with engine.connect() as conn:
+            until_id = _ledger_offset_at(conn, as_of) if as_of is not None else None
+            state = _replay_ledger(conn, until_id)
+        state['invested'] = sum(p['cost_basis'] for p in state['positions'].values())
+        return state
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+        return None
+
+def _snapshot_portfolio(conn):
+    state = _replay_ledger(conn)
+    if not state['replayed']:
+        return None  # Nothing new since the last snapshot
+    conn.execute(insert(portfolio_snapshots).values(
+        ledger_id=state['ledger_id'], ts=state['ts'], balance=state['balance'],
+        positions=json.dumps(state['positions']), created_at=datetime.now()
+    ))
+    return state['ledger_id']
+
+def snapshot_portfolio():
+    """Stores the current ledger state as a snapshot. Returns its ledger offset (None if nothing changed)."""
+    engine = get_engine()
+    if not engine: return None
+    try:
+        with engine.begin() as conn:
+            return _snapshot_portfolio(conn)
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+        return None
+
+def verify_ledger():
+    """
+    Audit: compares the portfolio/positions tables with the ledger replay.
+    Returns {'ok', 'ledger_id', 'balance_diff', 'missing' (open in the ledger
+    only), 'unexpected' (in the table only), 'mismatched' (share counts differ)}.
+    """
+    engine = get_engine()
+    if not engine: return None
+    try:
+        with engine.connect() as conn:
+            state = _replay_ledger(conn)
+            balance = _get_balance(conn)
+            table_positions = _get_positions(conn)
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+        return None
+    replayed = state['positions']
+    result = {
+        'ledger_id': state['ledger_id'],
+        'balance_diff': round(balance - state['balance'], 6),
+        'missing': sorted(set(replayed) - set(table_positions)),
+        'unexpected': sorted(set(table_positions) - set(replayed)),
+        'mismatched': sorted(s for s in set(replayed) & set(table_positions)
+                             if abs(replayed[s]['shares'] - table_positions[s]['shares']) > 1e-9)
+    }
+    result['ok'] = not (result['balance_diff'] or result['missing'] or result['unexpected'] or result['mismatched'])
+    return result
+
+def recover_portfolio():
+    """
+    Rewrites portfolio balance and positions from the ledger (e.g. after the
+    tables drifted or were lost). Bumps the version so running traders reload.
+    Returns the replayed state or None on error.
+    """
+    engine = get_engine()
+    if not engine: return None
+    try:
+        with engine.begin() as conn:
+            state = _replay_ledger(conn)
+            conn.execute(delete(positions))
+            if state['positions']:
+                _upsert(conn, positions, [_position_row(s, p) for s, p in state['positions'].items()])
+            conn.execute(update(portfolio).where(portfolio.c.id == 1).values(
+                balance=state['balance'], version=func.coalesce(portfolio.c.version, 0) + 1
+            ))
+        logger.info(f"Portfolio rebuilt from ledger offset {state['ledger_id']} ({state['replayed']} entries replayed).")
+        return state
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+        return None
+
+# --- Paginated Reads ---
+# Pages are ordered newest first by (time column, id). Pass the last row's
+# time/id back as before_ts/before_id for the next (older) page, or the newest
+# id seen as after_id to fetch only rows written since: the `limit` oldest of
+# them (still newest first), so passing the page's largest id back as after_id
+# walks forward through a backlog without gaps. `columns` limits the
+# projection (id and the time column are always included).
+def _projection(table, ts_col, columns):
+    if not columns:
+        return list(table.c)
+    names = ['id', ts_col.name] + [c for c in columns if c not in ('id', ts_col.name)]
+    return [table.c[name] for name in names]
+
+def _keyset_page(table, ts_col, columns, limit, before_ts, before_id, after_id, filters):
+    stmt = select(*_projection(table, ts_col, columns)).where(*filters)
+    if before_ts is not None:
+        if before_id is not None:
+            stmt = stmt.where(or_(ts_col < before_ts, and_(ts_col == before_ts, table.c.id < before_id)))
+        else:
+            stmt = stmt.where(ts_col < before_ts)
+    if after_id is not None:
+        # Take the rows right after after_id, not the newest ones, then present them newest first
+        window = stmt.where(table.c.id > after_id).order_by(table.c.id.asc()).limit(limit).subquery()
+        return select(*window.c).order_by(window.c[ts_col.name].desc(), window.c.id.desc())
+    return stmt.order_by(ts_col.desc(), table.c.id.desc()).limit(limit)
+
+def _fetch(conn, stmt, fmt):
+    """Runs stmt and returns list of dicts ('records'), a pandas DataFrame or a pyarrow Table."""
+    result = conn.execute(stmt)
+    if fmt == 'records':
+        return [dict(row) for row in result.mappings()]
+    keys = list(result.keys())
+    rows = result.fetchall()
+    if fmt == 'pandas':
+        import pandas as pd
+        return pd.DataFrame.from_records(rows, columns=keys)
+    if fmt == 'arrow':
+        import pyarrow as pa
+        values = list(zip(*rows)) if rows else [()] * len(keys)
+        return pa.Table.from_arrays([pa.array(list(v)) for v in values], names=keys)
+    raise ValueError(f"Unknown fmt '{fmt}'")
+
+def _empty_page(fmt):
+    return [] if fmt == 'records' else None
+
+def get_trades_page(limit=200, before_ts=None, before_id=None, after_id=None, columns=None, symbol=None, fmt='records'):
+    """One page of trades, newest first. Frame formats return None on error."""
+    engine = get_engine()
+    if not engine: return _empty_page(fmt)
+    try:
+        filters = [trades.c.symbol == symbol] if symbol else []
+        stmt = _keyset_page(trades, trades.c.date, columns, limit, before_ts, before_id, after_id, filters)
+        with engine.connect() as conn:
+            return _fetch(conn, stmt, fmt)
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+        return _empty_page(fmt)
+
+def get_ledger_page(limit=200, before_ts=None, before_id=None, after_id=None, columns=None, symbol=None, fmt='records'):
+    """One page of ledger entries, newest first (audits; see get_trades_page)."""
+    engine = get_engine()
+    if not engine: return _empty_page(fmt)
+    try:
+        filters = [ledger.c.symbol == symbol] if symbol else []
+        stmt = _keyset_page(ledger, ledger.c.ts, columns, limit, before_ts, before_id, after_id, filters)
+        with engine.connect() as conn:
+            return _fetch(conn, stmt, fmt)
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+        return _empty_page(fmt)
+
+def get_trade_summary():
+    """Trade count, realized P&L and winning trades, aggregated in SQL."""
+    engine = get_engine()
+    if not engine: return {'count': 0, 'total_pnl': 0.0, 'wins': 0}
+    try:
+        with engine.connect() as conn:
+            count, total_pnl, wins = conn.execute(select(
+                func.count(),
+                func.coalesce(func.sum(trades.c.pnl), 0.0),
+                func.coalesce(func.sum(case((trades.c.pnl > 0, 1), else_=0)), 0)
+            )).one()
+            return {'count': count, 'total_pnl': float(total_pnl), 'wins': int(wins)}
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+        return {'count': 0, 'total_pnl': 0.0, 'wins': 0}
+
 def get_all_trades():
+    """Entire trades table; prefer get_trades_page for anything user-facing."""
+    engine = get_engine()
     if not engine: return []
     try:
         with engine.connect() as conn:
-            rows = conn.execute(select(trades).order_by(trades.c.date.desc())).mappings().all()
+            rows = conn.execute(select(trades).order_by(trades.c.date.desc(), trades.c.id.desc())).mappings().all()
             return [dict(row) for row in rows]
     except Exception as e:
         logger.error(f"DB Error: {e}")
         return []
 
+def analysis_row(symbol, volume_ratio, sentiment_score, pe_ratio, technical_signal, action_taken, reason, price, timestamp=None):
+    return {
+        'symbol': symbol,
+        'timestamp': timestamp or datetime.now(),
+        'volume_ratio': volume_ratio,
+        'sentiment_score': sentiment_score,
+        'pe_ratio': pe_ratio,
+        'technical_signal': technical_signal,
+        'action_taken': action_taken,
+        'reason': reason,
+        'price': price
+    }
+
 def log_analysis(symbol, volume_ratio, sentiment_score, pe_ratio, technical_signal, action_taken, reason, price):
-    if not engine: return
+    log_analysis_many([analysis_row(symbol, volume_ratio, sentiment_score, pe_ratio, technical_signal, action_taken, reason, price)])
+
+@traced("db.log_analysis_many")
+def log_analysis_many(rows):
+    """
+    Writes a batch of analysis_row() dicts with one executemany in one transaction.
+    Returns True on success so buffered writers can account for failures.
+    """
+    engine = get_engine()
+    if not engine: return False
+    if not rows: return True
     try:
         with engine.begin() as conn:
-            conn.execute(insert(analysis_log).values(
-                symbol=symbol,
-                timestamp=datetime.now(),
-                volume_ratio=volume_ratio,
-                sentiment_score=sentiment_score,
-                pe_ratio=pe_ratio,
-                technical_signal=technical_signal,
-                action_taken=action_taken,
-                reason=reason,
-                price=price
-            ))
+            _log_analysis_many(conn, rows)
+        return True
     except Exception as e:
         logger.error(f"DB Error: {e}")
+        return False
 
-def get_recent_analysis(limit=1000):
-    if not engine: return []
+def _log_analysis_many(conn, rows):
+    conn.execute(insert(analysis_log), rows)
+    _upsert(conn, analysis_stats_hourly, _stats_deltas(rows), increment=('count',))
+    return True
+
+def _hour_bucket(ts):
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+def _stats_deltas(rows):
+    """
+    Pre-aggregates analysis rows into (hour, action, symbol) counter increments.
+    NULL action/symbol are stored as '' (they are part of the primary key).
+    """
+    deltas = {}
+    for row in rows:
+        key = (_hour_bucket(row['timestamp']), row['action_taken'] or '', row['symbol'] or '')
+        deltas[key] = deltas.get(key, 0) + 1
+    return [{'bucket': b, 'action_taken': a, 'symbol': sym, 'count': n} for (b, a, sym), n in deltas.items()]
+
+def get_analysis_page(limit=500, before_ts=None, before_id=None, after_id=None, columns=None, actions=None, symbol=None, fmt='records'):
+    """One page of analysis_log, newest first, optionally filtered by action/symbol."""
+    engine = get_engine()
+    if not engine: return _empty_page(fmt)
     try:
+        filters = []
+        if actions is not None:
+            filters.append(analysis_log.c.action_taken.in_(list(actions)))
+        if symbol:
+            filters.append(analysis_log.c.symbol == symbol)
+        stmt = _keyset_page(analysis_log, analysis_log.c.timestamp, columns, limit, before_ts, before_id, after_id, filters)
         with engine.connect() as conn:
-            rows = conn.execute(select(analysis_log).order_by(analysis_log.c.timestamp.desc()).limit(limit)).mappings().all()
-            return [dict(row) for row in rows]
+            return _fetch(conn, stmt, fmt)
     except Exception as e:
         logger.error(f"DB Error: {e}")
-        return []
+        return _empty_page(fmt)
+
+def get_recent_analysis(limit=1000):
+    return get_analysis_page(limit=limit)
+
+def _stats_window_start():
+    # 24 hourly buckets, the newest being the current (partial) hour
+    return _hour_bucket(datetime.now()) - timedelta(hours=23)
 
 def get_analysis_stats():
+    """
+    Last-24h analysis counts summed from the hourly counter table. The
+    counters have hour granularity: the window starts at the top of the hour
+    23 hours ago, so it spans 23-24h.
+    """
+    engine = get_engine()
     if not engine: return None
     try:
         with engine.connect() as conn:
-            start_time = datetime.now() - timedelta(hours=24)
-            
-            # Total
-            total = conn.execute(select(func.count()).select_from(analysis_log).where(analysis_log.c.timestamp > start_time)).scalar()
+            stats = analysis_stats_hourly
+            window = stats.c.bucket >= _stats_window_start()
+
+            total, unique = conn.execute(
+                select(func.coalesce(func.sum(stats.c.count), 0), func.count(func.distinct(func.nullif(stats.c.symbol, ''))))
+                .where(window)
+            ).one()
+
+            action_rows = conn.execute(
+                select(stats.c.action_taken, func.sum(stats.c.count))
+                .where(window)
+                .group_by(stats.c.action_taken)
+            ).all()
+            actions = {row[0] or None: row[1] for row in action_rows}
+
+            return {
+                'total_analyzed': total,
+                'unique_analyzed': unique,
+                'actions': actions
+            }
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+        return None
+
+def get_analysis_stats_full_scan(start_time=None):
+    """
+    Reference implementation scanning analysis_log directly (consistency
+    check). Defaults to the same hour-aligned window as get_analysis_stats.
+    """
+    engine = get_engine()
+    if not engine: return None
+    try:
+        with engine.connect() as conn:
+            start_time = start_time or _stats_window_start()
             
-            # Unique
-            unique = conn.execute(select(func.count(func.distinct(analysis_log.c.symbol))).where(analysis_log.c.timestamp > start_time)).scalar()
+            # Total + Unique (single index range scan)
+            total, unique = conn.execute(
+                select(func.count(), func.count(func.distinct(analysis_log.c.symbol)))
+                .where(analysis_log.c.timestamp >= start_time)
+            ).one()
             
             # Actions
             action_rows = conn.execute(
-                select(analysis_log.c.action_taken, func.count(analysis_log.c.action_taken))
-                .where(analysis_log.c.timestamp > start_time)
+                select(analysis_log.c.action_taken, func.count())
+                .where(analysis_log.c.timestamp >= start_time)
                 .group_by(analysis_log.c.action_taken)
             ).all()
             actions = {row[0]: row[1] for row in action_rows}
@@ -273,56 +1334,516 @@ def get_analysis_stats():
         logger.error(f"DB Error: {e}")
         return None
 
+def verify_analysis_stats():
+    """
+    Compares the counter-based stats against a full scan over the same
+    bucket-aligned window. Returns (consistent, counters, full_scan).
+    """
+    fast = get_analysis_stats()
+    full = get_analysis_stats_full_scan(_stats_window_start())
+    return fast == full, fast, full
+
+def _rebuild_analysis_stats(conn, hours):
+    start = _hour_bucket(datetime.now()) - timedelta(hours=hours - 1)
+    conn.execute(delete(analysis_stats_hourly).where(analysis_stats_hourly.c.bucket >= start))
+    result = conn.execution_options(yield_per=5000).execute(
+        select(analysis_log.c.timestamp, analysis_log.c.action_taken, analysis_log.c.symbol)
+        .where(analysis_log.c.timestamp >= start)
+    )
+    _upsert(conn, analysis_stats_hourly, _stats_deltas(result.mappings()), increment=('count',))
+
+def rebuild_analysis_stats(hours=48):
+    """Recomputes the hourly counters for the last `hours` from analysis_log."""
+    engine = get_engine()
+    if not engine: return
+    try:
+        with engine.begin() as conn:
+            _rebuild_analysis_stats(conn, hours)
+        logger.info(f"Rebuilt analysis stats for the last {hours}h.")
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+
+def prune_analysis_stats(keep_hours=48):
+    engine = get_engine()
+    if not engine: return
+    try:
+        with engine.begin() as conn:
+            cutoff = _hour_bucket(datetime.now()) - timedelta(hours=keep_hours)
+            conn.execute(delete(analysis_stats_hourly).where(analysis_stats_hourly.c.bucket < cutoff))
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+
+# --- Retention ---
+def _as_date(value):
+    # SQLite returns func.date() as 'YYYY-MM-DD' text, Postgres as a date
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+def _combine(fn, a, b):
+    values = [x for x in (a, b) if x is not None]
+    return fn(values) if values else None
+
+def rollup_analysis(retain_days=30, archive_dir="data/archive"):
+    """
+    Retention job for analysis_log.
+    Raw rows older than retain_days (cut at midnight) are aggregated into
+    analysis_log_daily, written to a gzipped JSONL archive and removed. On
+    Postgres, monthly partitions that lie entirely before the cutoff are
+    dropped instead of deleted row by row.
+    Returns the number of raw rows archived.
+    """
+    engine = get_engine()
+    if not engine: return 0
+    cutoff = datetime.combine(date.today() - timedelta(days=retain_days), datetime.min.time())
+    try:
+        with engine.begin() as conn:
+            old_rows = analysis_log.c.timestamp < cutoff
+            count = conn.execute(select(func.count()).select_from(analysis_log).where(old_rows)).scalar()
+            if not count:
+                return 0
+
+            # 1. Daily aggregates (additive, so re-running on a partial day is safe)
+            day = func.date(analysis_log.c.timestamp)
+            agg_rows = conn.execute(
+                select(
+                    day.label('day'),
+                    analysis_log.c.symbol,
+                    analysis_log.c.action_taken,
+                    func.count().label('count'),
+                    func.sum(analysis_log.c.volume_ratio).label('sum_volume_ratio'),
+                    func.sum(analysis_log.c.sentiment_score).label('sum_sentiment_score'),
+                    func.min(analysis_log.c.price).label('min_price'),
+                    func.max(analysis_log.c.price).label('max_price')
+                ).where(old_rows).group_by(day, analysis_log.c.symbol, analysis_log.c.action_taken)
+            ).mappings().all()
+
+            existing = {}
+            days = {_as_date(r['day']) for r in agg_rows}
+            for r in conn.execute(select(analysis_log_daily).where(analysis_log_daily.c.day.in_(days))).mappings():
+                existing[(r['day'], r['symbol'], r['action_taken'])] = r
+
+            merged = []
+            for r in agg_rows:
+                row = dict(r, day=_as_date(r['day']))
+                prev = existing.get((row['day'], row['symbol'], row['action_taken']))
+                if prev:
+                    row['count'] += prev['count']
+                    row['sum_volume_ratio'] = (row['sum_volume_ratio'] or 0) + (prev['sum_volume_ratio'] or 0)
+                    row['sum_sentiment_score'] = (row['sum_sentiment_score'] or 0) + (prev['sum_sentiment_score'] or 0)
+                    row['min_price'] = _combine(min, row['min_price'], prev['min_price'])
+                    row['max_price'] = _combine(max, row['max_price'], prev['max_price'])
+                merged.append(row)
+            _upsert(conn, analysis_log_daily, merged)
+
+            # 2. Archive the detail rows
+            os.makedirs(archive_dir, exist_ok=True)
+            path = os.path.join(archive_dir, f"analysis_log_before_{cutoff:%Y%m%d}_{datetime.now():%H%M%S}.jsonl.gz")
+            result = conn.execution_options(stream_results=True, yield_per=5000).execute(
+                select(analysis_log).where(old_rows).order_by(analysis_log.c.id)
+            )
+            with gzip.open(path, 'wt', encoding='utf-8') as f:
+                for row in result.mappings():
+                    f.write(json.dumps(dict(row), default=str) + "\n")
+
+            # 3. Remove them
+            if conn.dialect.name == 'postgresql' and _analysis_relkind(conn) == 'p':
+                month = _month_start(conn.execute(select(func.min(analysis_log.c.timestamp))).scalar())
+                while _next_month(month) <= cutoff:
+                    conn.execute(text(f"DROP TABLE IF EXISTS {_partition_name(month)}"))
+                    month = _next_month(month)
+            conn.execute(delete(analysis_log).where(old_rows))
+
+        logger.info(f"Rolled up {count} analysis rows older than {cutoff:%Y-%m-%d} -> {path}")
+        return count
+    except Exception as e:
+        logger.error(f"Analysis rollup failed: {e}")
+        return 0
+
+def get_daily_analysis_counts(days=90):
+    """Per-day action counts from the rollup table (history beyond retention)."""
+    engine = get_engine()
+    if not engine: return []
+    try:
+        with engine.connect() as conn:
+            start = date.today() - timedelta(days=days)
+            rows = conn.execute(
+                select(analysis_log_daily.c.day, analysis_log_daily.c.action_taken, func.sum(analysis_log_daily.c.count).label('count'))
+                .where(analysis_log_daily.c.day >= start)
+                .group_by(analysis_log_daily.c.day, analysis_log_daily.c.action_taken)
+                .order_by(analysis_log_daily.c.day)
+            ).mappings().all()
+            return [dict(row) for row in rows]
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+        return []
+
 # --- Configuration & Cache ---
-def init_kv_tables():
-    # Calling create_all in init_db handles this
-    pass
+# In-process read-through cache (L1) in front of system_config / response_cache.
+# Every write bumps kv_version (and NOTIFYs on Postgres); other processes drop
+# their L1 when they see a newer version.
+L1_ENABLED = os.getenv("DB_L1_CACHE", "1") != "0"
+L1_TTL_SECONDS = float(os.getenv("DB_L1_TTL_SECONDS", "60"))
+L1_POLL_SECONDS = float(os.getenv("DB_L1_POLL_SECONDS", "2"))
+# With a LISTEN connection up, polling is only a safety net
+L1_POLL_SECONDS_LISTENING = 30.0
+KV_CHANNEL = "kv_invalidate"
+
+_l1 = {}
+_l1_lock = threading.Lock()
+_l1_state = {'version': None, 'checked_at': 0.0, 'listening': False, 'listener': None}
+_l1_stats = {
+    'config': {'hits': 0, 'misses': 0},
+    'cache': {'hits': 0, 'misses': 0},
+    'invalidations': 0
+}
+
+def _bump_kv_version(conn, keys):
+    """Called inside the writing transaction; returns the new version."""
+    _upsert(conn, kv_version, {'id': 1, 'version': 1}, increment=('version',))
+    version = conn.execute(select(kv_version.c.version).where(kv_version.c.id == 1)).scalar()
+    if conn.dialect.name == 'postgresql':
+        # Delivered on commit. Postgres caps payloads at 8000 bytes: send no keys (= drop all) if too big
+        payload = json.dumps({'version': version, 'keys': keys})
+        if len(payload) > 7900:
+            payload = json.dumps({'version': version, 'keys': None})
+        conn.execute(text("SELECT pg_notify(:channel, :payload)"), {'channel': KV_CHANNEL, 'payload': payload})
+    return version
+
+def _l1_after_write(new_version, entries):
+    """Keeps our own L1 coherent after a local write."""
+    with _l1_lock:
+        if _l1_state['version'] is not None and new_version == _l1_state['version'] + 1:
+            _l1.update(entries)
+        else:
+            # Someone else wrote in between: we cannot tell what changed
+            _l1.clear()
+            _l1_stats['invalidations'] += 1
+        _l1_state['version'] = new_version
+
+def _l1_poll_due():
+    _ensure_kv_listener()
+    interval = L1_POLL_SECONDS_LISTENING if _l1_state['listening'] else L1_POLL_SECONDS
+    return time.monotonic() - _l1_state['checked_at'] >= interval
+
+def _l1_refresh(conn):
+    """Drops L1 if another process bumped kv_version."""
+    version = conn.execute(select(kv_version.c.version).where(kv_version.c.id == 1)).scalar() or 0
+    with _l1_lock:
+        if version != _l1_state['version']:
+            if _l1:
+                _l1_stats['invalidations'] += 1
+            _l1.clear()
+            _l1_state['version'] = version
+        _l1_state['checked_at'] = time.monotonic()
+
+def _l1_get(namespace, key):
+    if not L1_ENABLED:
+        return None
+    # Polled at most every few seconds
+    engine = get_engine()
+    if engine and _l1_poll_due():
+        with engine.connect() as conn:
+            _l1_refresh(conn)
+    return _l1_lookup(namespace, key)
+
+def _l1_lookup(namespace, key):
+    entry = _l1.get((namespace, key))
+    if entry and entry[1] > time.monotonic():
+        _l1_stats[namespace]['hits'] += 1
+        return entry
+    _l1_stats[namespace]['misses'] += 1
+    return None
+
+def _l1_put(namespace, key, raw_value, expires_at=None):
+    if not L1_ENABLED:
+        return
+    ttl = L1_TTL_SECONDS
+    if expires_at is not None:
+        ttl = min(ttl, (expires_at - datetime.now()).total_seconds())
+    with _l1_lock:
+        _l1[(namespace, key)] = (raw_value, time.monotonic() + ttl)
+
+def _ensure_kv_listener():
+    """Starts the Postgres LISTEN thread once; SQLite relies on polling."""
+    engine = get_engine()
+    if _l1_state['listener'] is not None or not engine or engine.dialect.name != 'postgresql':
+        return
+    _l1_state['listener'] = threading.Thread(target=_kv_listen_loop, name="KVInvalidationListener", daemon=True)
+    _l1_state['listener'].start()
+
+def _kv_listen_loop():
+    backoff = 1
+    while True:
+        raw = None
+        try:
+            raw = get_engine().raw_connection()
+            dbapi_conn = raw.driver_connection
+            dbapi_conn.autocommit = True
+            with dbapi_conn.cursor() as cur:
+                cur.execute(f"LISTEN {KV_CHANNEL}")
+            _l1_state['listening'] = True
+            backoff = 1
+            while True:
+                if select_module.select([dbapi_conn], [], [], 30) == ([], [], []):
+                    continue
+                dbapi_conn.poll()
+                while dbapi_conn.notifies:
+                    note = dbapi_conn.notifies.pop(0)
+                    _invalidate_keys(note.payload)
+        except Exception as e:
+            logger.warning(f"KV listener disconnected, falling back to polling: {e}")
+        finally:
+            _l1_state['listening'] = False
+            if raw is not None:
+                try: raw.invalidate()
+                except Exception: pass
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 60)
+
+def _invalidate_keys(payload):
+    try:
+        note = json.loads(payload)
+        version, keys = note['version'], note['keys']
+    except (ValueError, TypeError, KeyError):
+        version, keys = None, None
+    with _l1_lock:
+        known = _l1_state['version']
+        if version is not None and known is not None and version <= known:
+            return  # Our own write (already applied) or a stale notification
+        if keys is None or version is None or known is None or version != known + 1:
+            # Missed a notification somewhere: start over
+            _l1.clear()
+        else:
+            for k in keys:
+                _l1.pop(tuple(k), None)
+        _l1_state['version'] = version
+        _l1_stats['invalidations'] += 1
+
+def get_l1_stats():
+    stats = {'entries': len(_l1), 'invalidations': _l1_stats['invalidations'], 'listening': _l1_state['listening']}
+    for ns in ('config', 'cache'):
+        hits, misses = _l1_stats[ns]['hits'], _l1_stats[ns]['misses']
+        stats[ns] = {'hits': hits, 'misses': misses, 'hit_rate': round(hits / (hits + misses), 3) if hits + misses else 0.0}
+    return stats
 
 def set_config(key, value):
-    if not engine: return
+    set_config_many({key: value})
+
+def _set_config_many(conn, values):
+    """Returns (kv version, L1 entries) for _l1_after_write once committed."""
+    now = datetime.utcnow()
+    rows = [{'key': k, 'value': json.dumps(v), 'updated_at': now} for k, v in values.items()]
+    _upsert(conn, system_config, rows)
+    version = _bump_kv_version(conn, [('config', k) for k in values])
+    return version, {('config', r['key']): (r['value'], time.monotonic() + L1_TTL_SECONDS) for r in rows}
+
+def set_config_many(values):
+    """Bulk upsert of {key: value} config entries in one transaction."""
+    engine = get_engine()
+    if not engine or not values: return
     try:
         with engine.begin() as conn:
-            conn.execute(delete(system_config).where(system_config.c.key == key))
-            conn.execute(insert(system_config).values(key=key, value=json.dumps(value), updated_at=datetime.utcnow()))
+            version, entries = _set_config_many(conn, values)
+        _l1_after_write(version, entries)
     except Exception as e:
         logger.error(f"DB Error: {e}")
 
+def _get_config_raw(conn, key):
+    row = conn.execute(select(system_config.c.value).where(system_config.c.key == key)).fetchone()
+    raw_value = row.value if row else None
+    _l1_put('config', key, raw_value)
+    return raw_value
+
 def get_config(key, default=None):
+    engine = get_engine()
     if not engine: return default
     try:
-        with engine.connect() as conn:
-            row = conn.execute(select(system_config.c.value).where(system_config.c.key == key)).fetchone()
-            if row: return json.loads(row.value)
-            return default
+        entry = _l1_get('config', key)
+        if entry:
+            raw_value = entry[0]
+        else:
+            with engine.connect() as conn:
+                raw_value = _get_config_raw(conn, key)
+        if raw_value is not None: return json.loads(raw_value)
+        return default
     except Exception as e:
         logger.error(f"DB Error: {e}")
         return default
 
 def set_cache(key, value, ttl_minutes=60):
-    if not engine: return
+    set_cache_many({key: value}, ttl_minutes=ttl_minutes)
+
+def _set_cache_many(conn, values, ttl_minutes=60):
+    """Returns (kv version, L1 entries) for _l1_after_write once committed."""
+    expires = datetime.now() + timedelta(minutes=ttl_minutes)
+    rows = [{'key': k, 'value': json.dumps(v), 'expires_at': expires} for k, v in values.items()]
+    _upsert(conn, response_cache, rows)
+    version = _bump_kv_version(conn, [('cache', k) for k in values])
+    l1_expiry = time.monotonic() + min(L1_TTL_SECONDS, ttl_minutes * 60)
+    return version, {('cache', r['key']): (r['value'], l1_expiry) for r in rows}
+
+def set_cache_many(values, ttl_minutes=60):
+    """Bulk upsert of {key: value} cache entries sharing one TTL."""
+    engine = get_engine()
+    if not engine or not values: return
     try:
         with engine.begin() as conn:
-            expires = datetime.now() + timedelta(minutes=ttl_minutes)
-            conn.execute(delete(response_cache).where(response_cache.c.key == key))
-            conn.execute(insert(response_cache).values(key=key, value=json.dumps(value), expires_at=expires))
+            version, entries = _set_cache_many(conn, values, ttl_minutes)
+        _l1_after_write(version, entries)
     except Exception as e:
         logger.error(f"DB Error: {e}")
 
+def _get_cache_raw(conn, key):
+    row = conn.execute(
+        select(response_cache.c.value, response_cache.c.expires_at)
+        .where(response_cache.c.key == key)
+        .where(response_cache.c.expires_at > datetime.now())
+    ).fetchone()
+    if row:
+        _l1_put('cache', key, row.value, row.expires_at)
+        return row.value
+    # Negative entries are safe: any write bumps the version
+    _l1_put('cache', key, None)
+    return None
+
 def get_cache(key):
+    engine = get_engine()
     if not engine: return None
     try:
-        with engine.connect() as conn:
-            row = conn.execute(
-                select(response_cache.c.value)
-                .where(response_cache.c.key == key)
-                .where(response_cache.c.expires_at > datetime.now())
-            ).fetchone()
-            if row: return json.loads(row.value)
-            return None
+        entry = _l1_get('cache', key)
+        if entry:
+            raw_value = entry[0]
+        else:
+            with engine.connect() as conn:
+                raw_value = _get_cache_raw(conn, key)
+        if raw_value is not None: return json.loads(raw_value)
+        return None
     except Exception as e:
         logger.error(f"DB Error: {e}")
         return None
 
-# Init Tables
-if engine:
-    init_db()
+def _purge_expired_cache(conn):
+    return conn.execute(delete(response_cache).where(response_cache.c.expires_at <= datetime.now())).rowcount
+
+def purge_expired_cache():
+    """Deletes expired response_cache rows. Returns the number removed."""
+    engine = get_engine()
+    if not engine: return 0
+    try:
+        with engine.begin() as conn:
+            return _purge_expired_cache(conn)
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+        return 0
+
+# --- Equity History ---
+# (age, bucket): samples older than age keep only the last one per bucket
+EQUITY_DOWNSAMPLING = (
+    (timedelta(hours=48), lambda ts: ts.replace(minute=0, second=0, microsecond=0)),
+    (timedelta(days=30), lambda ts: ts.date())
+)
+
+def _record_equity(conn, sample):
+    _upsert(conn, equity_history, [{c: sample[c] for c in ('ts', 'equity', 'cash', 'exposure')}])
+
+@traced("db.record_equity")
+def record_equity(sample):
+    """sample: {'ts', 'equity', 'cash', 'exposure'} (see PaperTrader.mark_to_market)."""
+    engine = get_engine()
+    if not engine: return
+    try:
+        with engine.begin() as conn:
+            _record_equity(conn, sample)
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+
+def get_equity_history(since=None, until=None, fmt='records'):
+    """Equity samples in time order, optionally limited to [since, until]."""
+    engine = get_engine()
+    if not engine: return _empty_page(fmt)
+    stmt = select(equity_history).order_by(equity_history.c.ts)
+    if since is not None:
+        stmt = stmt.where(equity_history.c.ts >= since)
+    if until is not None:
+        stmt = stmt.where(equity_history.c.ts <= until)
+    try:
+        with engine.connect() as conn:
+            return _fetch(conn, stmt, fmt)
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+        return _empty_page(fmt)
+
+def _downsample_equity(conn, now):
+    removed = 0
+    for age, bucket in EQUITY_DOWNSAMPLING:
+        # Ascending, so the last ts seen per bucket is the one to keep
+        stamps = conn.execute(
+            select(equity_history.c.ts).where(equity_history.c.ts < now - age).order_by(equity_history.c.ts)
+        ).scalars().all()
+        keep = {bucket(ts): ts for ts in stamps}
+        drop = sorted(set(stamps) - set(keep.values()))
+        for i in range(0, len(drop), UPSERT_CHUNK_SIZE):
+            conn.execute(delete(equity_history).where(equity_history.c.ts.in_(drop[i:i + UPSERT_CHUNK_SIZE])))
+        removed += len(drop)
+    return removed
+
+def downsample_equity_history():
+    """
+    Retention job for equity_history: per-cycle samples are kept for 48 hours,
+    then thinned to the last sample of each hour, and after 30 days to the last
+    of each day. Returns the number of samples removed.
+    """
+    engine = get_engine()
+    if not engine: return 0
+    try:
+        with engine.begin() as conn:
+            return _downsample_equity(conn, datetime.now())
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+        return 0
+
+# --- Parameter Sweeps ---
+SWEEP_RESULT_COLUMNS = ('total_return_pct', 'max_drawdown_pct', 'turnover', 'sharpe', 'trades', 'win_rate_pct', 'rank')
+
+def save_sweep_results(run_id, results):
+    """results: [{'params': {...}, 'total_return_pct': ..., ..., 'rank': ...}]. Returns rows written."""
+    engine = get_engine()
+    if not engine: return 0
+    if not results: return 0
+    now = datetime.now()
+    rows = [{'run_id': run_id, 'created_at': now, 'params': json.dumps(r['params'], sort_keys=True),
+             **{c: r.get(c) for c in SWEEP_RESULT_COLUMNS}} for r in results]
+    try:
+        with engine.begin() as conn:
+            conn.execute(insert(sweep_results), rows)
+        return len(rows)
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+        return 0
+
+def get_sweep_results(run_id=None, limit=20):
+    """Best-ranked parameter sets of a run (default: the latest run), params decoded."""
+    engine = get_engine()
+    if not engine: return []
+    try:
+        with engine.connect() as conn:
+            if run_id is None:
+                run_id = conn.execute(
+                    select(sweep_results.c.run_id).order_by(sweep_results.c.created_at.desc(), sweep_results.c.id.desc()).limit(1)
+                ).scalar()
+            rows = conn.execute(
+                select(sweep_results).where(sweep_results.c.run_id == run_id).order_by(sweep_results.c.rank).limit(limit)
+            ).mappings().all()
+        return [{**row, 'params': json.loads(row['params'])} for row in rows]
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+        return []
+
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    print(f"Schema version: {migrate()}")
+    if 'verify-ledger' in sys.argv[1:]:
+        print(f"Ledger audit: {verify_ledger()}")
+    if 'recover-portfolio' in sys.argv[1:]:
+        state = recover_portfolio()
+        print(f"Recovered: balance {state['balance']:.2f}, {len(state['positions'])} positions" if state else "Recovery failed")
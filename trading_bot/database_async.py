@@ -0,0 +1,182 @@
+import asyncio
+import json
+import logging
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+import database as db
+from core.tracing import span
+
+# Asyncio flavour of database.py for the orchestrator paths.
+# Statements are shared with the sync module: each call runs the same
+# connection-level helper (db._name(conn, ...)) through AsyncConnection.run_sync,
+# so awaiting DB I/O no longer occupies a thread-pool slot.
+logger = logging.getLogger("DatabaseAsync")
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite'
+}
+
+_engine = None
+
+def async_url(url):
+    """Maps a sync DATABASE_URL onto its asyncio driver (asyncpg / aiosqlite)."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver configured for '{backend}'")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        try:
+            url = async_url(db.DB_URL)
+            _engine = create_async_engine(url, **db.engine_options(url))
+        except Exception as e:
+            logger.error(f"Failed to create async DB engine: {e}")
+            return None
+    return _engine
+
+async def dispose():
+    """Closes pooled connections (they are bound to the running event loop)."""
+    if _engine is not None:
+        await _engine.dispose()
+
+async def _run(fn, *args, default=None, write=False):
+    engine = get_engine()
+    if not engine: return default
+    try:
+        ctx = engine.begin() if write else engine.connect()
+        with span(f"db.{fn.__name__.lstrip('_')}"):
+            async with ctx as conn:
+                return await conn.run_sync(fn, *args)
+    except Exception as e:
+        logger.error(f"DB Error: {e}")
+        return default
+
+# --- Fundamentals ---
+async def get_fundamental(symbol):
+    return await _run(db._get_fundamental, symbol)
+
+async def get_fundamentals_many(symbols):
+    if not symbols: return {}
+    return await _run(db._get_fundamentals_many, symbols, default={})
+
+async def set_fundamental(symbol, pe_ratio):
+    await set_fundamentals_many({symbol: pe_ratio})
+
+async def set_fundamentals_many(pe_by_symbol):
+    if not pe_by_symbol: return
+    await _run(db._set_fundamentals_many, pe_by_symbol, write=True)
+
+# --- Portfolio & Positions ---
+async def get_portfolio_state():
+    return await _run(db._get_portfolio_state)
+
+async def get_portfolio_version():
+    return await _run(db._get_portfolio_version)
+
+async def get_balance():
+    return await _run(db._get_balance, default=0.0)
+
+async def get_positions():
+    return await _run(db._get_positions, default={})
+
+async def record_fill(symbol, action, shares, price, fee_rate, balance_delta, position=None, pnl=0.0, expected_version=None):
+    """See database.record_fill: one transaction, returns the fill record or None."""
+    engine = get_engine()
+    if not engine: return None
+    try:
+        async with engine.begin() as conn:
+            return await conn.run_sync(db._record_fill, symbol, action, shares, price, fee_rate, balance_delta, position, pnl, expected_version)
+    except db.PortfolioConflict as e:
+        logger.warning(f"Fill {action} {symbol} rejected: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"DB Error (fill {action} {symbol}): {e}")
+        return None
+
+async def record_fills(fills, expected_version=None):
+    """See database.record_fills."""
+    engine = get_engine()
+    if not engine: return None
+    if not fills: return []
+    try:
+        async with engine.begin() as conn:
+            return await conn.run_sync(db._record_fills, fills, expected_version)
+    except db.PortfolioConflict as e:
+        logger.warning(f"Batch of {len(fills)} fills rejected: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"DB Error (batch of {len(fills)} fills): {e}")
+        return None
+
+async def get_trade_count():
+    return await _run(db._get_trade_count, default=0)
+
+async def record_equity(sample):
+    await _run(db._record_equity, sample, write=True)
+
+# --- Analysis Log ---
+async def log_analysis(symbol, volume_ratio, sentiment_score, pe_ratio, technical_signal, action_taken, reason, price):
+    return await log_analysis_many([db.analysis_row(symbol, volume_ratio, sentiment_score, pe_ratio, technical_signal, action_taken, reason, price)])
+
+async def log_analysis_many(rows):
+    if not rows: return True
+    return await _run(db._log_analysis_many, rows, default=False, write=True)
+
+# --- Configuration & Cache ---
+async def _l1_get(namespace, key):
+    if not db.L1_ENABLED:
+        return None
+    if db._l1_poll_due():
+        await _run(db._l1_refresh)
+    return db._l1_lookup(namespace, key)
+
+async def set_config(key, value):
+    await set_config_many({key: value})
+
+async def set_config_many(values):
+    if not values: return
+    result = await _run(db._set_config_many, values, write=True)
+    if result:
+        db._l1_after_write(*result)
+
+async def get_config(key, default=None):
+    entry = await _l1_get('config', key)
+    raw_value = entry[0] if entry else await _run(db._get_config_raw, key)
+    if raw_value is not None: return json.loads(raw_value)
+    return default
+
+async def set_cache(key, value, ttl_minutes=60):
+    await set_cache_many({key: value}, ttl_minutes=ttl_minutes)
+
+async def set_cache_many(values, ttl_minutes=60):
+    if not values: return
+    result = await _run(db._set_cache_many, values, ttl_minutes, write=True)
+    if result:
+        db._l1_after_write(*result)
+
+async def get_cache(key):
+    entry = await _l1_get('cache', key)
+    raw_value = entry[0] if entry else await _run(db._get_cache_raw, key)
+    if raw_value is not None: return json.loads(raw_value)
+    return None
+
+async def purge_expired_cache():
+    return await _run(db._purge_expired_cache, default=0, write=True)
+
+def __getattr__(name):
+    """
+    Remaining public database functions (dashboard queries, maintenance) keep
+    the same API surface: they are awaited in a worker thread.
+    """
+    fn = getattr(db, name, None)
+    if name.startswith('_') or not callable(fn):
+        raise AttributeError(f"module 'database_async' has no attribute '{name}'")
+
+    async def wrapper(*args, **kwargs):
+        return await asyncio.to_thread(fn, *args, **kwargs)
+    wrapper.__name__ = name
+    return wrapper
@@ -10,15 +10,23 @@ import pytz
 from core.market_data import MarketData
 from agents.manager_otto import Otto
 import database as db
-from core.config import CRYPTO_TICKERS, TICKERS, BATCH_SIZE
+import database_async as adb
+from core.config import CRYPTO_TICKERS, TICKERS, BATCH_SIZE, ANALYSIS_RETENTION_DAYS, CYCLE_BUDGET_SECONDS
 from core.trade_executor import TradeExecutor
 from core.market_scanner import MarketScanner
+from core.stop_watch import StopWatch
+from core.tracing import tracer, span
+from core.metrics import metrics
 from technical_analyst import TechnicalAnalyst
 from core.logger import setup_logger
 
 # Configure Logging
 logger = setup_logger("Orchestrator", "logs/orchestrator.log")
 
+def now_et():
+    """Current US/Eastern time; the one clock trading hours and the conference follow (replay pins it)."""
+    return datetime.now(pytz.utc).astimezone(pytz.timezone('US/Eastern'))
+
 class Orchestrator:
     def __init__(self):
         self.otto = Otto()
@@ -26,8 +34,10 @@ class Orchestrator:
         self.current_budget = {'stock_agent': 0.5, 'crypto_agent': 0.5} # Default
         self.trade_executor = TradeExecutor()
         self.market_scanner = MarketScanner(self.trade_executor)
+        self.stop_watch = StopWatch(self.trade_executor)
         self.spy_analyst = TechnicalAnalyst("SPY")
         self.current_market_bias = "NEUTRAL"
+        self.last_maintenance = None
 
     def is_trading_hours(self):
         """Returns True if current time is within Trading Hours (08:30 - 17:00 ET) Mon-Fri"""
@@ -40,8 +50,7 @@ class Orchestrator:
         # ET is UTC-5 (Standard) or UTC-4 (Daylight).
         # robustness using pytz
         
-        utc_now = datetime.now(pytz.utc)
-        et_now = utc_now.astimezone(pytz.timezone('US/Eastern')) 
+        et_now = now_et()
         
         if et_now.weekday() > 4: return False # Weekend
         
@@ -56,8 +65,7 @@ class Orchestrator:
         if not self.is_trading_hours(): return
 
         # Check if we already ran today (in ET)
-        utc_now = datetime.now(pytz.utc)
-        et_now = utc_now.astimezone(pytz.timezone('US/Eastern'))
+        et_now = now_et()
         
         # safely handle initial state
         if self.last_conference == datetime.min:
@@ -93,8 +101,8 @@ class Orchestrator:
         
         # 4. Enact Policy
         self.current_budget = allocation
-        db.set_config("budget_allocation", allocation)
-        self.last_conference = datetime.now(pytz.utc) # Store as Aware UTC
+        await adb.set_config("budget_allocation", allocation)
+        self.last_conference = et_now # Store as Aware (ET)
         
         # Log Decision
         msg = (
@@ -113,7 +121,7 @@ class Orchestrator:
         # Base List (S&P 500 + Watchlist)
         sp500 = self.market_scanner.get_sp500_tickers()
         watchlist = TICKERS
-        all_tickers = list(set(sp500 + watchlist))
+        all_tickers = list(dict.fromkeys(sp500 + watchlist))  # ordered: same batches every cycle
         
         # Logic: If Crypto Budget < 0.1 (10%), CUT crypto completely
         if self.current_budget['crypto_agent'] < 0.1:
@@ -129,6 +137,11 @@ class Orchestrator:
 
         return all_tickers
 
+    async def get_fundamentals_universe(self):
+        """S&P 500 + watchlist: everything the scan may need a P/E for"""
+        sp500 = await asyncio.to_thread(self.market_scanner.get_sp500_tickers)
+        return list(dict.fromkeys(sp500 + TICKERS))
+
     async def check_market_panic(self):
         """Checks if SPY or BTC dropped > 2% in the last hour"""
         try:
@@ -166,9 +179,27 @@ class Orchestrator:
                 return True
             return False
         except Exception as e:
+            metrics.inc("yfinance_errors_total", call="panic_check")
             logger.error(f"Panic check failed: {e}")
             return False
 
+    async def run_maintenance(self):
+        """Nightly DB upkeep (once per day, outside trading hours)"""
+        today = datetime.now().date()
+        if self.last_maintenance == today:
+            return
+
+        logger.info("🧹 Running nightly DB maintenance...")
+        # Creates upcoming partitions, then applies retention
+        await asyncio.to_thread(db.ensure_partitions)
+        archived = await asyncio.to_thread(db.rollup_analysis, ANALYSIS_RETENTION_DAYS)
+        await asyncio.to_thread(db.prune_analysis_stats)
+        thinned = await asyncio.to_thread(db.downsample_equity_history)
+        # Keeps ledger replays (startup audit, point-in-time queries) to one day of entries
+        snapshot = await asyncio.to_thread(db.snapshot_portfolio)
+        logger.info(f"🧹 Maintenance done. Archived {archived} analysis rows, thinned {thinned} equity samples. Portfolio snapshot: {snapshot}.")
+        self.last_maintenance = today
+
     async def heartbeat(self):
         while True:
             # Respect Trading Hours (Silence at night)
@@ -177,12 +208,13 @@ class Orchestrator:
                 await asyncio.sleep(3600)
                 continue
 
-            stats = self.trade_executor.trader.get_summary()
+            stats = await self.trade_executor.trader.get_summary_async()
             bias_emoji = "✅" if self.current_market_bias == 'BUY' else ("🛑" if self.current_market_bias == 'SELL' else "⚖️")
             
             msg = (
                 f"💓 *Hourly STATUS REPORT*\n"
                 f"**Bias:** {self.current_market_bias} {bias_emoji}\n"
+                f"**Equity:** ${stats['equity']:.2f} (${stats['exposure']:.2f} invested)\n"
                 f"**Cash:** ${stats['cash']:.2f}\n"
                 f"**Pos:** {stats['open_positions']}\n"
                 f"**Trades:** {stats['realized_trades']}\n"
@@ -191,52 +223,124 @@ class Orchestrator:
             self.trade_executor.send_telegram_alert(msg)
             await asyncio.sleep(3600)
 
-    async def run_loop(self):
-        logger.info("🚀 Boardroom Orchestrator Started")
-        
-        # Start Heartbeat
-        asyncio.create_task(self.heartbeat())
-
+    async def cache_sweeper(self, interval=900):
+        """Purges expired response_cache rows every 15 minutes"""
         while True:
-            try:
-                # 0. PANIC CHECK (The Emergency Interrupter)
-                if await self.check_market_panic():
-                    logger.warning("🚨 EMERGENCY BOARD MEETING TRIGGERED!")
-                    # Force Otto to re-evaluate immediately
-                    self.last_conference = datetime.min 
+            purged = await adb.purge_expired_cache()
+            if purged:
+                logger.info(f"🧽 Purged {purged} expired cache rows. L1: {db.get_l1_stats()} Pool: {db.get_pool_stats()}")
+            await asyncio.sleep(interval)
+
+    def collect_metrics(self):
+        """Point-in-time gauges for /metrics: cycle progress, queue depths, DB pool."""
+        started = tracer.cycle_started
+        yield "cycle_budget_seconds", {}, CYCLE_BUDGET_SECONDS
+        yield "cycle_running_seconds", {}, time.monotonic() - started if started is not None else 0.0
+        last = tracer.last_trace
+        if last:
+            yield "last_cycle_seconds", {}, last['ms'] / 1000
+
+        executor = self.trade_executor
+        yield "queue_depth", {'queue': 'analysis_writer'}, executor.analysis_writer.stats()['queue_depth']
+        yield "queue_depth", {'queue': 'notifier'}, executor.notifier.stats()['queue_depth']
+        yield "queue_depth", {'queue': 'order_intents'}, executor.order_allocator.queue.qsize()
+        yield "queue_depth", {'queue': 'fundamentals_requests'}, len(self.market_scanner.fundamentals_refresher._pending)
+        yield "open_positions", {}, len(executor.trader.positions)
+
+        pool = db.get_pool_stats()
+        for key in ('size', 'checked_out', 'overflow'):
+            if key in pool:
+                yield f"db_pool_{key}", {}, pool[key]
+        yield "db_pool_checkouts_total", {}, pool['checkouts']
+        yield "db_pool_timeouts_total", {}, pool['timeouts']
+        yield "db_pool_max_wait_seconds", {}, pool['max_wait_ms'] / 1000
+
+    async def run_cycle(self):
+        """One pass: panic check, conference, portfolio monitor, then the market scan (or nightly maintenance)."""
+        with tracer.cycle():
+            # 0. PANIC CHECK (The Emergency Interrupter)
+            with span("orchestrator.panic_check"):
+                panic = await self.check_market_panic()
+            if panic:
+                logger.warning("🚨 EMERGENCY BOARD MEETING TRIGGERED!")
+                # Force Otto to re-evaluate immediately
+                self.last_conference = datetime.min 
+                with span("orchestrator.conference", emergency=True):
                     await self.morning_conference()
 
-                # 1. Strategy Check (Normal Schedule)
+            # 1. Strategy Check (Normal Schedule)
+            with span("orchestrator.conference"):
                 await self.morning_conference()
-                
-                # 2. Market Scan
-                # Monitor Portfolio First
+            
+            # 2. Market Scan
+            # Monitor Portfolio First
+            with span("orchestrator.monitor"):
                 await self.trade_executor.monitor_portfolio()
-                
-                if not self.is_trading_hours():
-                    logger.info("🌙 After Hours: Scanning paused.")
-                else:
-                    # Update Market Bias (SPY Check) - Only during market hours
+            
+            if not self.is_trading_hours():
+                logger.info("🌙 After Hours: Scanning paused.")
+                with span("orchestrator.maintenance"):
+                    await self.run_maintenance()
+            else:
+                # Update Market Bias (SPY Check) - Only during market hours
+                with span("orchestrator.spy_analysis"):
                     bias_result = await self.spy_analyst.analyze()
-                    self.current_market_bias = bias_result['signal']
-                    db.set_config("market_bias", self.current_market_bias)
-                    
-                    # Determine Scope
+                self.current_market_bias = bias_result['signal']
+                await adb.set_config("market_bias", self.current_market_bias)
+                
+                # Determine Scope
+                with span("orchestrator.resolve_tickers"):
                     targets = await self.get_target_tickers()
+                
+                # If budget is 0 for everything, sleep and skip
+                if not targets:
+                    logger.info("💤 Otto has set all budgets to 0. Sleeping...")
+                else:
+                    logger.info(f"🎯 Target Scope: {len(targets)} tickers (Otto's Orders)")
                     
-                    # If budget is 0 for everything, sleep and skip
-                    if not targets:
-                        logger.info("💤 Otto has set all budgets to 0. Sleeping...")
-                    else:
-                        logger.info(f"🎯 Target Scope: {len(targets)} tickers (Otto's Orders)")
-                        
-                        # Batch Scan
-                        for i in range(0, len(targets), BATCH_SIZE):
-                            batch = targets[i:i + BATCH_SIZE]
+                    # Batch Scan
+                    for i in range(0, len(targets), BATCH_SIZE):
+                        batch = targets[i:i + BATCH_SIZE]
+                        with span("orchestrator.scan_batch", tickers=len(batch)):
                             await self.market_scanner.scan_batch(batch, self.current_market_bias)
-                            await asyncio.sleep(1)
+                        await asyncio.sleep(1)
+
+        if tracer.last_trace['ms'] > CYCLE_BUDGET_SECONDS * 1000:
+            metrics.inc("cycle_overruns_total")
+            logger.warning(f"⏰ Cycle took {tracer.last_trace['ms'] / 1000:.0f}s (budget {CYCLE_BUDGET_SECONDS}s)")
+
+    async def load_reference_data(self):
+        # GICS sectors for the risk engine's sector limit (crypto proxies are built in)
+        self.trade_executor.risk_engine.sectors.update(await asyncio.to_thread(self.market_scanner.get_sp500_sectors))
+
+    async def run_loop(self):
+        logger.info("🚀 Boardroom Orchestrator Started")
+        await self.load_reference_data()
+        
+        # Prometheus endpoint + event-loop lag probe
+        metrics.register(self.collect_metrics)
+        metrics.inc("cycle_overruns_total", 0)
+        metrics.start_server()
+        asyncio.create_task(metrics.watch_event_loop())
+
+        # Start Heartbeat
+        asyncio.create_task(self.heartbeat())
+        asyncio.create_task(self.cache_sweeper())
+        # Stops/targets on held positions every few seconds, whatever the scan is doing
+        asyncio.create_task(self.stop_watch.run(self.is_trading_hours))
+        # Off-hours P/E refresh for the universe + background fetch of intraday misses
+        asyncio.create_task(self.market_scanner.fundamentals_refresher.run(
+            self.get_fundamentals_universe, self.is_trading_hours
+        ))
+
+        while True:
+            try:
+                await self.run_cycle()
                 
                 # Sleep
+                logger.info(f"📝 Analysis writer: {self.trade_executor.analysis_writer.stats()}")
+                logger.info(f"📨 Notifier: {self.trade_executor.notifier.stats()}")
+                logger.info(f"⏱️ Stage timings: {tracer.stats()}")
                 logger.info("💤 Resting for 5 minutes...")
                 await asyncio.sleep(300)
 
@@ -244,6 +348,22 @@ class Orchestrator:
                 logger.error(f"Orchestrator Loop Error: {e}")
                 await asyncio.sleep(60)
 
+async def main(orchestrator):
+    try:
+        await orchestrator.run_loop()
+    finally:
+        await orchestrator.trade_executor.notifier.stop()
+        # Async DB connections are bound to this event loop
+        await adb.dispose()
+
 if __name__ == "__main__":
+    db.migrate()
+    audit = db.verify_ledger()
+    if audit and not audit['ok']:
+        logger.warning(f"⚠️ Portfolio tables differ from the ledger: {audit}. Run `python database.py recover-portfolio` to rebuild them.")
     orchestrator = Orchestrator()
-    asyncio.run(orchestrator.run_loop())
+    try:
+        asyncio.run(main(orchestrator))
+    finally:
+        # Flush buffered analysis rows before exit
+        orchestrator.trade_executor.analysis_writer.stop()
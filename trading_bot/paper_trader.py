@@ -1,63 +1,151 @@
+import math
+import asyncio
 import logging
 import database as db
+import database_async as adb
 from datetime import datetime
+# Fee model and sizing are shared with the backtester
+from core.position_sizing import INITIAL_CAPITAL, TRADE_ALLOCATION, MIN_ALLOCATION, fee_rate_for, size_buy
 
 logger = logging.getLogger("PaperTrader")
 
-INITIAL_CAPITAL = 360.0 
-TRADE_ALLOCATION = 0.20 
+# A sale rejected because the portfolio changed is re-planned once after the resync
+SELL_ATTEMPTS = 2
 
 class PaperTrader:
+    """
+    In-memory portfolio, authoritative for the (single-writer) orchestrator.
+    Every fill is persisted in one transaction and applied locally from its
+    result; the DB is only re-read on an explicit reload_state() or when
+    sync() sees that portfolio.version moved (another process wrote to it).
+    The async fill paths (allocator buys, monitor/stop-watch sells) run one at
+    a time under write_lock, so they never race each other on the version:
+    a conflict always means a writer outside this process.
+    """
+
     def __init__(self):
-        # Initialize DB on startup
-        db.init_db()
+        # Schema is set up by db.migrate() at process startup
+        self.balance = 0.0
+        self.positions = {}
+        self.version = None
+        self.trade_count = 0
+        self.last_prices = {}  # latest observed price per symbol, for mark-to-market
+        self.write_lock = asyncio.Lock()  # plan + record + apply of one async fill batch
         self.reload_state()
 
     def reload_state(self):
-        """Refreshes local state from DB."""
-        self.balance = db.get_balance()
-        self.positions = db.get_positions()
+        """Explicit resync: replaces local state with the DB's."""
+        self._load(db.get_portfolio_state())
         logger.info(f"Portfolio loaded. Balance: ${self.balance:.2f}")
 
+    async def reload_state_async(self):
+        self._load(await adb.get_portfolio_state())
+
+    def _load(self, state):
+        if state is None:
+            return
+        self.balance = state['balance']
+        self.positions = state['positions']
+        self.version = state['version']
+        self.trade_count = state['trade_count']
+
+    def sync(self):
+        """One-query staleness check; reloads only if the version changed. Returns True if it did."""
+        version = db.get_portfolio_version()
+        if version is None or version == self.version:
+            return False
+        logger.info(f"Portfolio version {self.version} -> {version}: reloading.")
+        self.reload_state()
+        return True
+
+    async def sync_async(self):
+        version = await adb.get_portfolio_version()
+        if version is None or version == self.version:
+            return False
+        logger.info(f"Portfolio version {self.version} -> {version}: reloading.")
+        await self.reload_state_async()
+        return True
+
     def get_fee_rate(self, symbol):
+        return fee_rate_for(symbol)
+
+    def buy(self, symbol, price):
+        order = self._plan_buy(symbol, price)
+        if order is None:
+            return None
+
+        # Update DB (single transaction: balance + position + trade), only if nobody else wrote since
+        fill = db.record_fill(symbol, 'BUY', order['shares'], price, order['fee_rate'], -order['cost'],
+                              position=order['position'], expected_version=self.version)
+        if fill is None:
+            self.sync()
+        return self._apply_buy(symbol, price, order, fill)
+
+    async def buy_async(self, symbol, price):
+        """Same as buy(), awaiting the DB instead of blocking the event loop."""
+        async with self.write_lock:
+            order = self._plan_buy(symbol, price)
+            if order is None:
+                return None
+
+            fill = await adb.record_fill(symbol, 'BUY', order['shares'], price, order['fee_rate'], -order['cost'],
+                                         position=order['position'], expected_version=self.version)
+            if fill is None:
+                await self.sync_async()
+            return self._apply_buy(symbol, price, order, fill)
+
+    def buy_many(self, orders):
         """
-        Wealthsimple Logic:
-        - TSX Stocks (.TO): 0.0 (Free)
-        - US Stocks (Others): 0.015 (1.5% FX Fee)
+        Buys several symbols in one DB transaction. orders: [(symbol, price)] or
+        [(symbol, price, max_cost)] in priority order; each is sized from the
+        cash left after the ones before it (funds are reserved in order, so the
+        batch can never overspend), capped at max_cost when one is given.
+        Returns the receipts of the orders that could be funded, or None if the
+        batch was rejected because the portfolio changed (state is resynced).
         """
-        if symbol.endswith('.TO'):
-            return 0.0
-        return 0.015
+        planned = self._plan_buys(orders)
+        if not planned:
+            return []
+        fills = db.record_fills([self._buy_fill(symbol, price, order) for symbol, price, order in planned], expected_version=self.version)
+        if fills is None:
+            self.sync()
+            return None
+        return [self._apply_buy(symbol, price, order, fill) for (symbol, price, order), fill in zip(planned, fills)]
 
-    def buy(self, symbol, price):
-        self.reload_state() # Ensure fresh balance
-        
+    async def buy_many_async(self, orders):
+        """Same as buy_many(), awaiting the DB instead of blocking the event loop."""
+        async with self.write_lock:
+            planned = self._plan_buys(orders)
+            if not planned:
+                return []
+            fills = await adb.record_fills([self._buy_fill(symbol, price, order) for symbol, price, order in planned], expected_version=self.version)
+            if fills is None:
+                await self.sync_async()
+                return None
+            return [self._apply_buy(symbol, price, order, fill) for (symbol, price, order), fill in zip(planned, fills)]
+
+    def _plan_buys(self, orders):
+        planned, available = [], self.balance
+        for symbol, (price, *cap) in {symbol: rest for symbol, *rest in orders}.items():
+            order = self._plan_buy(symbol, price, available, *cap)
+            if order is not None:
+                available -= order['cost']  # Reserved for this order
+                planned.append((symbol, price, order))
+        return planned
+
+    @staticmethod
+    def _buy_fill(symbol, price, order):
+        return db.fill_row(symbol, 'BUY', order['shares'], price, order['fee_rate'], -order['cost'], position=order['position'])
+
+    def _plan_buy(self, symbol, price, available=None, max_cost=None):
         if symbol in self.positions:
             return None
 
-        # Allocation Logic
-        allocation = self.balance * TRADE_ALLOCATION
-        if allocation < 50: 
-             return None
-
         fee_rate = self.get_fee_rate(symbol)
-        
-        # Cost per share = Price * (1 + Fee)
-        # Cost per share = Price * (1 + Fee)
-        cost_per_share = price * (1 + fee_rate)
-        
-        # FRACTIONAL SHARES SUPPORT (Crypto/High-Priced Stocks)
-        raw_shares = allocation / cost_per_share
-        shares = round(raw_shares, 4) # 4 decimal places
-        
-        if shares <= 0:
+        sized = size_buy(self.balance if available is None else available, price, fee_rate, max_allocation=max_cost)
+        if sized is None:
             return None
-        
-        total_cost = shares * cost_per_share
-        
-        # Update DB
-        new_balance = self.balance - total_cost
-        db.update_balance(new_balance)
+        shares, cost_per_share, total_cost = sized
         
         position_data = {
             'shares': shares,
@@ -67,25 +155,110 @@ class PaperTrader:
             'entry_date': datetime.now().isoformat(),
             'cost_basis': total_cost
         }
-        db.add_position(symbol, position_data)
-        db.log_trade(symbol, 'BUY', shares, price, fee_rate)
-        
-        self.reload_state()
+        return {'shares': shares, 'fee_rate': fee_rate, 'break_even': cost_per_share, 'cost': total_cost, 'position': position_data}
+
+    def _apply_buy(self, symbol, price, order, fill):
+        if fill is None:
+            return None
+
+        # Apply locally instead of re-reading the whole portfolio
+        self._apply_fill(fill)
+        self.positions[symbol] = {'symbol': symbol, **order['position']}
         
-        logger.info(f"BUY: {symbol} | Shares: {shares} | Price: ${price:.2f} | Fee: {fee_rate*100:.1f}%")
+        logger.info(f"BUY: {symbol} | Shares: {order['shares']} | Price: ${price:.2f} | Fee: {order['fee_rate']*100:.1f}%")
         return {
             'action': 'BUY',
             'symbol': symbol,
-            'shares': shares,
+            'shares': order['shares'],
             'price': price,
-            'fee_rate': fee_rate,
-            'break_even': cost_per_share,
-            'cost': total_cost
+            'fee_rate': order['fee_rate'],
+            'break_even': order['break_even'],
+            'cost': order['cost']
         }
 
     def sell(self, symbol, price):
-        self.reload_state()
-        
+        for attempt in range(SELL_ATTEMPTS):
+            order = self._plan_sell(symbol, price)
+            if order is None:
+                return None
+
+            # Update DB (single transaction: balance + position + trade), only if nobody else wrote since
+            fill = db.record_fill(symbol, 'SELL', order['shares'], price, order['fee_rate'], order['proceeds'],
+                                  pnl=order['pnl'], expected_version=self.version)
+            if fill is not None:
+                return self._apply_sell(symbol, price, order, fill)
+            self._sell_rejected([symbol], attempt)
+            self.sync()
+        return None
+
+    async def sell_async(self, symbol, price):
+        """Same as sell(), awaiting the DB instead of blocking the event loop."""
+        async with self.write_lock:
+            for attempt in range(SELL_ATTEMPTS):
+                order = self._plan_sell(symbol, price)
+                if order is None:
+                    return None
+
+                fill = await adb.record_fill(symbol, 'SELL', order['shares'], price, order['fee_rate'], order['proceeds'],
+                                             pnl=order['pnl'], expected_version=self.version)
+                if fill is not None:
+                    return self._apply_sell(symbol, price, order, fill)
+                self._sell_rejected([symbol], attempt)
+                await self.sync_async()
+            return None
+
+    def sell_many(self, orders):
+        """
+        Sells several positions in one DB transaction. orders: [(symbol, price)].
+        Returns the sell records. A batch rejected because the portfolio changed
+        is re-planned against the resynced state and retried once.
+        """
+        for attempt in range(SELL_ATTEMPTS):
+            planned = self._plan_sells(orders)
+            if not planned:
+                return []
+            fills = db.record_fills([self._sell_fill(symbol, price, order) for symbol, price, order in planned], expected_version=self.version)
+            if fills is not None:
+                return [self._apply_sell(symbol, price, order, fill) for (symbol, price, order), fill in zip(planned, fills)]
+            self._sell_rejected([symbol for symbol, _, _ in planned], attempt)
+            self.sync()
+        return []
+
+    async def sell_many_async(self, orders):
+        """Same as sell_many(), awaiting the DB instead of blocking the event loop."""
+        async with self.write_lock:
+            for attempt in range(SELL_ATTEMPTS):
+                planned = self._plan_sells(orders)
+                if not planned:
+                    return []
+                fills = await adb.record_fills([self._sell_fill(symbol, price, order) for symbol, price, order in planned], expected_version=self.version)
+                if fills is not None:
+                    return [self._apply_sell(symbol, price, order, fill) for (symbol, price, order), fill in zip(planned, fills)]
+                self._sell_rejected([symbol for symbol, _, _ in planned], attempt)
+                await self.sync_async()
+            return []
+
+    @staticmethod
+    def _sell_rejected(symbols, attempt):
+        # A dropped exit is worse than a dropped entry: always leave a trace
+        if attempt + 1 < SELL_ATTEMPTS:
+            logger.warning(f"Sale of {', '.join(symbols)} rejected (portfolio changed); re-planning after resync.")
+        else:
+            logger.warning(f"Sale of {', '.join(symbols)} rejected again after resync; giving up until the next check.")
+
+    def _plan_sells(self, orders):
+        planned = []
+        for symbol, price in dict(orders).items():
+            order = self._plan_sell(symbol, price)
+            if order is not None:
+                planned.append((symbol, price, order))
+        return planned
+
+    @staticmethod
+    def _sell_fill(symbol, price, order):
+        return db.fill_row(symbol, 'SELL', order['shares'], price, order['fee_rate'], order['proceeds'], pnl=order['pnl'])
+
+    def _plan_sell(self, symbol, price):
         if symbol not in self.positions:
             return None
             
@@ -100,34 +273,71 @@ class PaperTrader:
         initial_cost = pos['cost_basis']
         pnl = proceeds - initial_cost
         pnl_percent = (pnl / initial_cost) * 100
-        
-        # Update DB
-        new_balance = self.balance + proceeds
-        db.update_balance(new_balance)
-        db.remove_position(symbol)
-        db.log_trade(symbol, 'SELL', shares, price, fee_rate, pnl)
+        return {'position': pos, 'shares': shares, 'fee_rate': fee_rate, 'proceeds': proceeds, 'pnl': pnl, 'pnl_percent': pnl_percent}
+
+    def _apply_sell(self, symbol, price, order, fill):
+        if fill is None:
+            return None
+
+        pos = order['position']
+        self._apply_fill(fill)
+        self.positions.pop(symbol, None)
         
         # Record for return
         record = {
             'symbol': symbol,
             'action': 'SELL',
             'entry_date': pos['entry_date'],
-            'exit_date': datetime.now().isoformat(),
+            'exit_date': fill['date'].isoformat(),
             'entry_price': pos['avg_price'],
             'exit_price': price,
-            'fee_rate': fee_rate,
-            'pnl': pnl,
-            'pnl_percent': pnl_percent
+            'fee_rate': order['fee_rate'],
+            'pnl': order['pnl'],
+            'pnl_percent': order['pnl_percent']
         }
         
-        self.reload_state()
-        logger.info(f"SELL: {symbol} | P&L: ${pnl:.2f} ({pnl_percent:.2f}%)")
+        logger.info(f"SELL: {symbol} | P&L: ${order['pnl']:.2f} ({order['pnl_percent']:.2f}%)")
         return record
 
+    def _apply_fill(self, fill):
+        self.balance = fill['balance']
+        self.version = fill['version']
+        self.trade_count += 1
+
     def get_summary(self):
-        self.reload_state()
+        self.sync()
+        return self._summary()
+
+    async def get_summary_async(self):
+        await self.sync_async()
+        return self._summary()
+
+    def position_values(self):
+        """{symbol: shares x latest observed price (entry price until one is seen)}."""
+        return {symbol: pos['shares'] * self.last_prices.get(symbol, pos['avg_price']) for symbol, pos in self.positions.items()}
+
+    def mark_to_market(self, prices=None):
+        """
+        Equity sample from local state: cash plus every position at its latest
+        observed price (prices: {symbol: price} fetched this cycle; symbols
+        without one keep their last price, or the entry price).
+        """
+        if prices is not None:
+            self.last_prices.update({s: float(p) for s, p in prices.items() if p is not None and math.isfinite(p)})
+        exposure = sum(self.position_values().values())
+        return {
+            'ts': datetime.now(),
+            'equity': self.balance + exposure,
+            'cash': self.balance,
+            'exposure': exposure
+        }
+
+    def _summary(self):
+        sample = self.mark_to_market()
         return {
             'cash': self.balance,
+            'equity': sample['equity'],
+            'exposure': sample['exposure'],
             'open_positions': len(self.positions),
-            'realized_trades': db.get_trade_count()
+            'realized_trades': self.trade_count
         }
@@ -5,7 +5,7 @@ from database import engine, metadata
 def reset_db():
     print("Resetting Database Schema...")
     metadata.drop_all(engine)
-    metadata.create_all(engine)
+    db.migrate()
     print("Database Reset Complete.")
 
 if __name__ == "__main__":
@@ -1,8 +1,11 @@
 import yfinance as yf
 import pandas as pd
+import numpy as np
 import ta
 import logging
 import asyncio
+from core.tracing import traced
+from core.metrics import metrics
 
 logger = logging.getLogger("TechnicalAnalyst")
 
@@ -15,7 +18,9 @@ class TechnicalAnalyst:
 
     def __init__(self, ticker: str = "SPY"):
         self.ticker = ticker
+        self.closes = None  # daily closes of the last analyze() (reused by the risk engine)
 
+    @traced("ta.download")
     async def fetch_data(self) -> pd.DataFrame:
         """
         Fetches last 365 days of daily data for the ticker.
@@ -43,6 +48,7 @@ class TechnicalAnalyst:
             
             return df
         except Exception as e:
+            metrics.inc("yfinance_errors_total", call="history")
             logger.error(f"Error fetching data for {self.ticker}: {e}")
             return pd.DataFrame()
 
@@ -75,11 +81,13 @@ class TechnicalAnalyst:
             logger.error(f"Indicator calculation failed: {e}")
             return df
 
+    @traced("ta.analyze")
     async def analyze(self) -> dict:
         """
         Main method to perform analysis and return signal.
         """
         df = await self.fetch_data()
+        self.closes = df['Close'] if 'Close' in df.columns else None
         if df.empty:
             return {'signal': 'HOLD', 'confidence': 'Low', 'reasoning': 'No Data'}
 
@@ -148,11 +156,147 @@ class TechnicalAnalyst:
         return {
             'signal': signal,
             'confidence': confidence,
+            'score': score,
             'reasoning': "; ".join(reasons),
             'latest_price': float(curr['Close']),
             'rsi': float(curr_rsi)
         }
 
+# --- Batched (wide) analysis ---
+# Same indicators and scoring as TechnicalAnalyst.analyze(), computed for many
+# tickers at once on a dates x tickers frame of closes from one download.
+
+@traced("ta.fetch_closes")
+async def fetch_closes(tickers, period="365d") -> pd.DataFrame:
+    """One yf.download for all tickers; returns daily closes (dates x tickers)."""
+    try:
+        data = await asyncio.to_thread(yf.download, tickers, period=period, interval="1d", group_by='ticker', progress=False, threads=True)
+        if data.empty:
+            return pd.DataFrame(columns=tickers)
+        if isinstance(data.columns, pd.MultiIndex):
+            closes = data.xs('Close', axis=1, level=1)
+        else:
+            closes = data[['Close']].set_axis(tickers[:1], axis=1)
+        return closes.reindex(columns=tickers)
+    except Exception as e:
+        metrics.inc("yfinance_errors_total", call="fetch_closes")
+        logger.error(f"Error fetching data for {len(tickers)} tickers: {e}")
+        return pd.DataFrame(columns=tickers)
+
+def _align_right(closes: pd.DataFrame) -> pd.DataFrame:
+    """
+    Moves each column's valid values to the bottom, keeping their order, so the
+    last row is every ticker's latest bar and per-ticker gaps (exchange
+    holidays, late listings) are dropped like analyze()'s dropna().
+    """
+    values = closes.to_numpy(dtype=float)
+    order = np.argsort(~np.isnan(values), axis=0, kind='stable')
+    return pd.DataFrame(np.take_along_axis(values, order, axis=0), columns=closes.columns)
+
+def calculate_indicators_wide(closes: pd.DataFrame) -> dict:
+    """SMA_50, SMA_200 and RSI_14 (Wilder, as in 'ta') for every column at once."""
+    return _indicators(_align_right(closes))
+
+def _indicators(close: pd.DataFrame) -> dict:
+    # close is already compacted: every column's bars are consecutive rows
+    diff = close.diff()
+    # Rows before a ticker's first bar stay NaN so the EWM starts where its data does
+    up = diff.where(diff > 0, 0.0).where(close.notna())
+    down = -diff.where(diff < 0, 0.0).where(close.notna())
+    ema_up = up.ewm(alpha=1 / 14, min_periods=14, adjust=False).mean()
+    ema_down = down.ewm(alpha=1 / 14, min_periods=14, adjust=False).mean()
+    rsi = pd.DataFrame(np.where(ema_down == 0, 100, 100 - (100 / (1 + ema_up / ema_down))), columns=close.columns)
+    return {
+        'Close': close,
+        'SMA_50': close.rolling(50).mean(),
+        'SMA_200': close.rolling(200).mean(),
+        'RSI': rsi
+    }
+
+# analyze()'s RSI thresholds; the backtester / parameter sweep can override them
+RSI_LOW = 40
+RSI_HIGH = 70
+RSI_OVERBOUGHT = 75
+
+def _score(curr: dict, prev: dict, rsi_low=RSI_LOW, rsi_high=RSI_HIGH, rsi_overbought=RSI_OVERBOUGHT):
+    """
+    analyze()'s scoring on arrays of current / previous bars (any shape).
+    Returns (score, signal, confidence); score is 0 where analyze() bails out.
+    """
+    enough = ~np.isnan(curr['SMA_200'])
+    trend = curr['Close'] > curr['SMA_50']
+    in_band = (curr['RSI'] >= rsi_low) & (curr['RSI'] <= rsi_high)
+    score = 1 + np.where(in_band, np.where(curr['RSI'] > prev['RSI'], 2, 1), 0)
+    score = np.where(curr['RSI'] > rsi_overbought, -10, score)
+    golden_cross = (prev['SMA_50'] < prev['SMA_200']) & (curr['SMA_50'] >= curr['SMA_200'])
+    score = score + golden_cross
+
+    valid = enough & trend
+    signal = np.where(valid & (score >= 2), 'BUY', 'HOLD')
+    confidence = np.where(valid & (score >= 3), 'High', np.where(valid & (score >= 2), 'Medium', 'Low'))
+    return np.where(valid, score, 0), signal, confidence
+
+def signals_wide(closes: pd.DataFrame) -> pd.DataFrame:
+    """
+    Vectorized TechnicalAnalyst.analyze() over all columns of `closes`.
+    Returns one row per ticker: latest_price, rsi, score, signal, confidence.
+    Tickers without a full 200-day history get HOLD (latest_price is still set).
+    """
+    ind = calculate_indicators_wide(closes)
+    curr = {name: frame.iloc[-1].to_numpy() for name, frame in ind.items()}
+    prev = {name: frame.iloc[-2].to_numpy() for name, frame in ind.items()}
+    score, signal, confidence = _score(curr, prev)
+    return pd.DataFrame({
+        'latest_price': curr['Close'],
+        'rsi': curr['RSI'],
+        'score': score,
+        'signal': signal,
+        'confidence': confidence
+    }, index=closes.columns)
+
+def indicator_history(closes: pd.DataFrame) -> dict:
+    """
+    Indicators for every past day and ticker, as dates x tickers arrays:
+    {'curr': {Close, SMA_50, SMA_200, RSI}, 'prev': same for the ticker's
+    previous bar}, NaN where the ticker has no bar. Row t only uses bars up to t.
+    """
+    values = closes.to_numpy(dtype=float)
+    valid = ~np.isnan(values)
+    # Same compaction as _align_right, but to the top so row k is each ticker's k-th bar
+    order = np.argsort(~valid, axis=0, kind='stable')
+    compact = pd.DataFrame(np.take_along_axis(values, order, axis=0))
+    ind = _indicators(compact)
+
+    def scatter(compacted):
+        out = np.empty_like(compacted)
+        np.put_along_axis(out, order, compacted, axis=0)
+        return np.where(valid, out, np.nan)
+
+    return {
+        'curr': {name: scatter(frame.to_numpy()) for name, frame in ind.items()},
+        'prev': {name: scatter(frame.shift(1).to_numpy()) for name, frame in ind.items()}
+    }
+
+def score_history(history: dict, **thresholds):
+    """analyze()'s score for every day of an indicator_history(); BUY where score >= 2."""
+    score, _, _ = _score(history['curr'], history['prev'], **thresholds)
+    return score
+
+def signal_history(closes: pd.DataFrame, **thresholds) -> dict:
+    """
+    What analyze() would have returned on every past day, for every ticker:
+    {'score', 'rsi', 'buy'} as dates x tickers arrays (NaN / False where the
+    ticker has no bar). Used by the backtester.
+    """
+    history = indicator_history(closes)
+    valid = ~np.isnan(history['curr']['Close'])
+    score = score_history(history, **thresholds)
+    return {
+        'score': np.where(valid, score, np.nan),
+        'rsi': history['curr']['RSI'],
+        'buy': valid & (score >= 2)
+    }
+
 if __name__ == "__main__":
     async def test():
         analyst = TechnicalAnalyst()
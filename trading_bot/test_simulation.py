@@ -15,11 +15,12 @@ def run_simulation():
         os.remove(TEST_FILE)
 
     print("🚀 Starting Wealthsimple Logic Simulation...")
+    import database as db
+    db.migrate()
     trader = PaperTrader()
     
     # TEST 1: US Stock (Fee 1.5%)
     print("\n--- TEST 1: BUY 'NVDA' (US) ---")
-    import database as db
     db.update_balance(2000.0) # Update DB so reload_state() gets correct value
     trader.reload_state()
     price_us = 100.0
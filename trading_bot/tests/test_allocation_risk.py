@@ -0,0 +1,107 @@
+import unittest
+import sys
+import os
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.risk_engine import RollingCovariance, RiskEngine, MIN_OVERLAP_DAYS, APPROVE, RESIZE, REJECT
+
+def factor_closes(groups, n_days=120, seed=0):
+    """Closes where each group of symbols shares one daily return factor (plus a little noise)."""
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range("2024-01-01", periods=n_days)
+    columns = {}
+    for symbols in groups:
+        factor = rng.normal(0, 0.02, n_days)
+        for symbol in symbols:
+            columns[symbol] = 100 * np.cumprod(1 + factor + rng.normal(0, 0.004, n_days))
+    return pd.DataFrame(columns, index=index)
+
+def intent(symbol):
+    return {'symbol': symbol, 'price': 10.0}
+
+class TestRollingCovariance(unittest.TestCase):
+    def assert_matches_full_recompute(self, cov, closes):
+        returns = closes.apply(lambda col: col.dropna().pct_change()).reindex(closes.index).iloc[-60:]
+        expected = returns.corr(min_periods=MIN_OVERLAP_DAYS)
+        self.assertEqual(cov.dates[-1], closes.index[-1])
+        self.assertEqual(len(cov.dates), 60)
+        for symbol in closes.columns:
+            np.testing.assert_allclose(cov.correlation(symbol, list(closes.columns)), expected.loc[symbol].to_numpy(), atol=1e-9)
+        return expected
+
+    def test_incremental_updates_match_full_recompute(self):
+        closes = factor_closes([["A", "B"], ["C"], ["D", "E"]], n_days=120)
+        closes.iloc[[30, 75, 90], 2] = np.nan  # C misses a few sessions (other exchange's holidays)
+        cov = RollingCovariance(window=60)
+        cov.update(closes.iloc[:80, :3])           # first symbols
+        cov.update(closes.iloc[:100, 3:])          # new symbols arrive with their history
+        cov.update(closes.iloc[70:119])            # days roll forward; row 118 is today
+        self.assert_matches_full_recompute(cov, closes.iloc[:119])
+
+        # Today's bar moves intraday: first one symbol (partial rank-1 revision), then all of them
+        edited = closes.copy()
+        revised = closes.iloc[110:119].copy()
+        revised.iloc[-1, 0] *= 1.01
+        edited.iloc[118] = revised.iloc[-1]
+        with patch.object(cov, '_revise', wraps=cov._revise) as partial:
+            cov.update(revised)
+        partial.assert_called_once()
+        self.assert_matches_full_recompute(cov, edited.iloc[:119])
+
+        revised.iloc[-1] *= 1.02
+        edited.iloc[118] = revised.iloc[-1]
+        with patch.object(cov, '_revise', wraps=cov._revise) as partial:
+            cov.update(revised)
+        partial.assert_not_called()
+        self.assert_matches_full_recompute(cov, edited.iloc[:119])
+
+        cov.update(edited.iloc[110:])              # next day arrives
+        expected = self.assert_matches_full_recompute(cov, edited)
+
+        cov.rebuild()
+        np.testing.assert_allclose(cov.correlation("C", list(closes.columns)), expected.loc["C"].to_numpy(), atol=1e-9)
+
+        cov.remove_symbols(["B"])
+        self.assertTrue(np.isnan(cov.correlation("A", ["B"])[0]))
+        np.testing.assert_allclose(cov.correlation("A", ["E"]), [expected.loc["A", "E"]], atol=1e-9)
+
+class TestRiskEngine(unittest.TestCase):
+    def setUp(self):
+        self.engine = RiskEngine(sectors={"AAA": "Tech", "BBB": "Tech", "CCC": "Tech", "XOM": "Energy"})
+        self.engine.observe(factor_closes([["HUT.TO", "BITF.TO", "HIVE.TO"], ["AAA", "BBB", "CCC"], ["XOM"]]))
+
+    def review(self, symbols, balance=1000.0, exposures=None):
+        return {i['symbol']: d for i, d in self.engine.review([intent(s) for s in symbols], balance, exposures or {})}
+
+    def test_crypto_wave_is_capped_by_sector(self):
+        decisions = self.review(["HUT.TO", "BITF.TO", "HIVE.TO", "XOM"])
+        self.assertEqual(decisions["HUT.TO"]['action'], APPROVE)   # $200
+        self.assertEqual(decisions["BITF.TO"]['action'], APPROVE)  # $160, crypto at 36%
+        self.assertEqual(decisions["HIVE.TO"]['action'], REJECT)   # $128 wanted, $40 of room
+        self.assertIn("Crypto sector", decisions["HIVE.TO"]['reason'])
+        self.assertEqual(decisions["XOM"]['action'], APPROVE)
+
+    def test_resize_to_remaining_room(self):
+        decisions = self.review(["BITF.TO"], balance=700.0, exposures={"HUT.TO": 300.0})
+        self.assertEqual(decisions["BITF.TO"]['action'], RESIZE)
+        self.assertAlmostEqual(decisions["BITF.TO"]['max_cost'], 100.0)
+
+    def test_correlated_exposure_across_sectors(self):
+        # Same return factor, but no sector to share: the correlation limit applies
+        self.engine.sectors = {}
+        decisions = self.review(["AAA", "BBB", "CCC", "XOM"])
+        self.assertEqual([decisions[s]['action'] for s in ("AAA", "BBB", "CCC", "XOM")], [APPROVE, APPROVE, REJECT, APPROVE])
+        self.assertIn("AAA, BBB", decisions["CCC"]['reason'])
+
+    def test_unknown_symbols_only_face_gross_limit(self):
+        decisions = self.review(["NEW1", "NEW2"], balance=250.0, exposures={"XOM": 2000.0})
+        self.assertEqual(decisions["NEW1"]['action'], REJECT)
+        self.assertIn("gross exposure", decisions["NEW1"]['reason'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+import unittest
+import sys
+import os
+import asyncio
+from unittest.mock import patch, MagicMock, AsyncMock
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from technical_analyst import signal_history, signals_wide
+from core.position_sizing import size_buy
+from core.backtester import prepare, simulate
+from core.sweep import SharedArrays, grid, random_search, run_sweep
+from tests.test_exit_rules import synthetic_closes
+
+class TestSignalHistory(unittest.TestCase):
+    def test_each_day_matches_live_signals(self):
+        closes = synthetic_closes(n_symbols=8, n_days=240)
+        history = signal_history(closes)
+        for t in range(200, 240, 7):
+            live = signals_wide(closes.iloc[:t + 1])
+            has_bar = closes.iloc[t].notna().to_numpy()
+            np.testing.assert_array_equal(history['buy'][t][has_bar], (live['signal'] == 'BUY').to_numpy()[has_bar])
+            np.testing.assert_array_equal(history['score'][t][has_bar], live['score'].to_numpy()[has_bar])
+
+class TestSimulate(unittest.TestCase):
+    def make_inputs(self, prices, buy_day=0, volume_ratio=2.0):
+        symbols = list(prices)
+        dates = pd.bdate_range("2024-01-01", periods=len(prices[symbols[0]])).to_numpy(dtype='datetime64[D]')
+        close = np.array([prices[s] for s in symbols], dtype=float).T
+        # Uptrend with rising RSI (score 3) on buy_day, below the SMA 50 otherwise
+        sma_50 = np.full_like(close, np.inf)
+        sma_50[buy_day] = 0.0
+        return {
+            'dates': dates,
+            'symbols': np.array(symbols),
+            'close': close,
+            'close_ffill': pd.DataFrame(close).ffill().to_numpy(),
+            'volume_ratio': np.full_like(close, volume_ratio),
+            'fee_rate': np.array([0.0 if s.endswith('.TO') else 0.015 for s in symbols]),
+            'curr_Close': close, 'curr_SMA_50': sma_50, 'curr_SMA_200': np.zeros_like(close), 'curr_RSI': np.full_like(close, 50.0),
+            'prev_Close': close, 'prev_SMA_50': np.zeros_like(close), 'prev_SMA_200': np.zeros_like(close), 'prev_RSI': np.full_like(close, 45.0)
+        }
+
+    def test_live_exit_rules_and_sizing(self):
+        flat = [100.0] * 8
+        inputs = self.make_inputs({
+            'TP.TO': [100.0, 106.0] + [106.0] * 6,          # take profit next day
+            'SL.TO': [100.0, 95.0] + [95.0] * 6,            # stop loss next day
+            'TIME': [100.0, 100.0, 100.0, 100.0, 100.0, 100.0, 101.0, 101.0],  # held past 5 days at -2.96%, sold at -1.98%
+            'DEEP': flat[:7] + [np.nan]                     # -2.96% after fees: kept; no bar on the last day
+        })
+        result = simulate(inputs, initial_capital=1000.0)
+        trades = result['trades'].set_index('symbol')
+
+        self.assertEqual(trades.loc['TP.TO', 'reason'], 'take_profit')
+        self.assertEqual(trades.loc['SL.TO', 'reason'], 'stop_loss')
+        self.assertEqual(trades.loc['TIME', 'reason'], 'time_stop')
+        self.assertEqual(trades.loc['TIME', 'exit_date'], np.datetime64('2024-01-09'))
+        self.assertNotIn('DEEP', trades.index)
+        self.assertEqual(result['stats']['open_positions'], 1)
+
+        # Sequential PaperTrader sizing, in universe order (equal score and volume ratio)
+        cash = 1000.0
+        costs = []
+        for fee in (0.0, 0.0, 0.015, 0.015):
+            shares, _, cost = size_buy(cash, 100.0, fee)
+            cash -= cost
+            costs.append((shares, cost))
+        self.assertAlmostEqual(trades.loc['TP.TO', 'shares'], costs[0][0])
+        self.assertAlmostEqual(trades.loc['TP.TO', 'pnl'], costs[0][0] * 106.0 - costs[0][1])
+        deep_value = costs[3][0] * 100.0 * 0.985
+        self.assertAlmostEqual(result['equity'].iloc[-1], cash + trades['pnl'].sum() + sum(c for _, c in costs[:3]) + deep_value)
+
+    def test_short_cash_funds_best_first(self):
+        # Cash for one full-size position; universe order would fund FIRST.TO
+        inputs = self.make_inputs({'FIRST.TO': [100.0] * 3, 'BEST.TO': [100.0] * 3})
+        inputs['curr_RSI'][0, 0] = 40.0                   # RSI in band but not rising: score 2 vs 3
+        inputs['volume_ratio'][0] = [3.0, 1.5]
+        result = simulate(inputs, initial_capital=1000.0, allocation_pct=1.0)
+        self.assertEqual(result['positions'], ['BEST.TO'])
+
+        inputs['curr_RSI'][0, 0] = 50.0                   # tied on score: the bigger volume spike wins
+        inputs['volume_ratio'][0] = [1.5, 3.0]
+        result = simulate(inputs, initial_capital=1000.0, allocation_pct=1.0)
+        self.assertEqual(result['positions'], ['BEST.TO'])
+
+    def test_volume_gate(self):
+        inputs = self.make_inputs({'SHOP.TO': [100.0, 110.0, 110.0]}, volume_ratio=1.1)
+        self.assertEqual(simulate(inputs, initial_capital=1000.0)['equity'].iloc[-1], 1000.0)
+        self.assertEqual(simulate(inputs, initial_capital=1000.0, vol_mult=1.0)['stats']['trades'], 1)
+        # RSI 50 is outside a 55-70 band: score 1, no BUY
+        self.assertEqual(simulate(inputs, initial_capital=1000.0, vol_mult=1.0, rsi_low=55)['stats']['trades'], 0)
+
+    def test_prepare_volume_ratio(self):
+        closes = synthetic_closes(n_symbols=3, n_days=30)
+        volumes = pd.DataFrame(1000.0, index=closes.index, columns=closes.columns)
+        volumes.iloc[20, 1] = 3000.0
+        ratio = prepare(closes, volumes)['volume_ratio']
+        # Mean of the last 5 bars including today, as in scan_batch
+        self.assertAlmostEqual(ratio[20, 1], 3000.0 / 1400.0)
+        self.assertAlmostEqual(ratio[21, 1], 1000.0 / 1400.0)
+
+class TestLiveParity(unittest.TestCase):
+    def test_scan_batch_and_simulate_pick_the_same_entries(self):
+        # Scores on the last day: kill switch (-10), HOLD (0, 1) and BUY (2, 3)
+        closes = synthetic_closes(n_symbols=12, n_days=260, seed=1)
+        volumes = pd.DataFrame(1e6, index=closes.index, columns=closes.columns).where(closes.notna())
+        spiked = [s for s in closes.columns if s not in ('S5', 'S9')]  # S5/S9 are BUYs without a volume spike
+        volumes.loc[closes.index[-1], spiked] = 5e6
+
+        def download(tickers, period=None, **kwargs):
+            bars = lambda s: pd.DataFrame({'Close': closes[s], 'Volume': volumes[s]})
+            if isinstance(tickers, list):  # scan_batch's volume screen
+                return pd.concat({s: bars(s).iloc[-5:] for s in tickers}, axis=1)
+            return bars(tickers).dropna()  # TechnicalAnalyst.fetch_data
+
+        executor = MagicMock()
+        executor.trader.positions = {}
+        executor.log_rejection = AsyncMock()
+        executor.execute_trade_logic = AsyncMock()
+        executor.execute_pending_orders = AsyncMock(return_value=[])
+        # The sentiment model is mocked below; only its import needs transformers
+        with patch.dict(sys.modules, {'transformers': MagicMock()}):
+            from core.market_scanner import MarketScanner
+            scanner = MarketScanner(executor)
+            scanner.sentiment_analyzer = MagicMock()
+            scanner.sentiment_analyzer.analyze.return_value = 1.0  # sentiment and P/E pass, as the backtester assumes
+            with patch.object(yf, 'download', download), \
+                 patch.object(scanner, 'get_symbol_news', return_value=[]), \
+                 patch.object(scanner, 'get_fundamentals_many', AsyncMock(return_value={})):
+                asyncio.run(scanner.scan_batch(list(closes.columns)))
+        live = sorted(call.args[0] for call in executor.execute_trade_logic.call_args_list)
+
+        backtest = simulate(prepare(closes, volumes), initial_capital=1e6)
+        self.assertEqual(backtest['stats']['trades'], 0)  # nothing spiked before the last day
+        self.assertEqual(sorted(backtest['positions']), live)
+        self.assertEqual(live, ['S1', 'S6'])
+        rejected = {call.args[0] for call in executor.log_rejection.call_args_list}
+        self.assertTrue({'S3', 'S7', 'S11'} <= rejected)  # score 0 / -10 / 1: HOLD
+
+class TestSweep(unittest.TestCase):
+    def test_parallel_sweep_matches_direct_runs(self):
+        closes = synthetic_closes(n_symbols=6, n_days=260)
+        volumes = pd.DataFrame(np.random.default_rng(1).lognormal(10, 0.5, closes.shape), index=closes.index, columns=closes.columns)
+        inputs = prepare(closes, volumes)
+        combos = grid({'vol_mult': [1.0, 1.5], 'take_profit_pct': [3.0, 5.0]})
+        self.assertEqual(len(random_search({'vol_mult': [1.0, 1.5], 'take_profit_pct': [3.0, 5.0]}, 3)), 3)
+
+        ranked = run_sweep(inputs, combos, workers=2, initial_capital=1000.0)
+        self.assertEqual(list(ranked['rank']), [1, 2, 3, 4])
+        self.assertEqual(list(ranked['score']), sorted(ranked['score']))
+        for row in ranked.to_dict('records'):
+            direct = simulate(inputs, initial_capital=1000.0, **row['params'])['stats']
+            self.assertEqual(row['total_return_pct'], direct['total_return_pct'])
+            self.assertEqual(row['turnover'], direct['turnover'])
+
+    def test_shared_arrays_round_trip(self):
+        arrays = {'close': np.arange(6.0).reshape(2, 3), 'symbols': np.array(['A', 'BB'])}
+        shared = SharedArrays(arrays)
+        try:
+            handles, views = SharedArrays.attach(shared.spec)
+            np.testing.assert_array_equal(views['close'], arrays['close'])
+            np.testing.assert_array_equal(views['symbols'], arrays['symbols'])
+            self.assertFalse(views['close'].flags.writeable)
+            del views
+            for shm in handles:
+                shm.close()
+        finally:
+            shared.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,609 @@
+import unittest
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Point the DB layer at a throwaway SQLite file before it is imported
+_tmp_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmp_dir, 'test.db')}"
+
+import asyncio
+import subprocess
+from unittest.mock import patch, MagicMock
+import pandas as pd
+from sqlalchemy import event
+import database as db
+import database_async as adb
+from paper_trader import PaperTrader
+from core.analysis_writer import AnalysisLogWriter
+from core.fundamentals_refresher import FundamentalsRefresher
+from core.order_allocator import OrderAllocator, order_intent
+from core.risk_engine import RiskEngine, RESIZE, REJECT
+from core.trade_executor import TradeExecutor
+from core.stop_watch import StopWatch
+from core.exit_rules import evaluate_exits
+
+# Create the schema once for every test below
+db.migrate()
+
+class TestLazyEngineAndMigrations(unittest.TestCase):
+    def test_import_does_no_db_work(self):
+        db_path = os.path.join(_tmp_dir, 'untouched.db')
+        code = "import database as db; print(db._engine is None)"
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             env={**os.environ, 'DATABASE_URL': f"sqlite:///{db_path}"})
+        self.assertEqual(out.stdout.strip(), "True")
+        self.assertFalse(os.path.exists(db_path))
+
+    def test_migrate_is_recorded_and_idempotent(self):
+        latest = db.MIGRATIONS[-1][0]
+        self.assertEqual(db.get_schema_version(), latest)
+        self.assertEqual(db.migrate(), latest)
+        with db.engine.connect() as conn:
+            self.assertEqual(conn.execute(db.select(db.func.count()).select_from(db.schema_version)).scalar(), latest)
+            self.assertEqual(conn.execute(db.select(db.func.count()).select_from(db.portfolio)).scalar(), 1)
+
+    def test_pool_stats(self):
+        db.get_balance()
+        stats = db.get_pool_stats()
+        self.assertEqual(stats['pool'], '_TimedQueuePool')
+        self.assertGreater(stats['checkouts'], 0)
+        self.assertEqual(stats['checked_out'], 0)
+        self.assertEqual(stats['size'], db.POOL_SIZE)
+
+class TestFillUnitOfWork(unittest.TestCase):
+    def setUp(self):
+        with db.engine.begin() as conn:
+            conn.execute(db.delete(db.trades))
+        db.reset_portfolio(1000.0)
+        self.trader = PaperTrader()
+
+    def test_buy_sell_round_trip(self):
+        receipt = self.trader.buy("SHOP.TO", 100.0)
+        self.assertIsNotNone(receipt)
+        self.assertAlmostEqual(self.trader.balance, 1000.0 - receipt['cost'])
+        self.assertIn("SHOP.TO", self.trader.positions)
+
+        # Local state must match what was committed
+        self.assertAlmostEqual(db.get_balance(), self.trader.balance)
+        self.assertIn("SHOP.TO", db.get_positions())
+
+        record = self.trader.sell("SHOP.TO", 110.0)
+        self.assertAlmostEqual(record['pnl'], receipt['shares'] * 10.0)
+        self.assertEqual(db.get_positions(), {})
+        self.assertEqual(db.get_trade_count(), 2)
+
+    def test_async_buy_sell(self):
+        async def run():
+            try:
+                receipt = await self.trader.buy_async("NVDA", 100.0)
+                summary = await self.trader.get_summary_async()
+                record = await self.trader.sell_async("NVDA", 100.0)
+                return receipt, summary, record
+            finally:
+                await adb.dispose()
+
+        receipt, summary, record = asyncio.run(run())
+        self.assertEqual(receipt['fee_rate'], 0.015)
+        self.assertEqual(summary['open_positions'], 1)
+        self.assertLess(record['pnl'], 0)  # Paid the FX fee both ways
+        self.assertAlmostEqual(db.get_balance(), 1000.0 + record['pnl'])
+
+    def test_foreign_write_is_detected_by_version(self):
+        db.update_balance(500.0)  # e.g. a manual top-up from another process
+        self.assertIsNone(self.trader.buy("SHOP.TO", 100.0))
+        self.assertAlmostEqual(self.trader.balance, 500.0)  # resynced after the rejected fill
+        self.assertEqual(db.get_trade_count(), 0)
+
+        receipt = self.trader.buy("SHOP.TO", 100.0)
+        self.assertAlmostEqual(receipt['cost'], 100.0)
+        self.assertEqual(self.trader.get_summary()['realized_trades'], 1)
+
+    def test_sale_is_replanned_after_foreign_write(self):
+        self.trader.buy("SHOP.TO", 100.0)
+        self.trader.buy("HUT.TO", 10.0)
+        db.update_balance(db.get_balance() + 250.0)  # deposit from another process
+        with self.assertLogs("PaperTrader", level="WARNING") as logs:
+            record = self.trader.sell("SHOP.TO", 110.0)
+        self.assertEqual(record['symbol'], "SHOP.TO")
+        self.assertIn("re-planning", logs.output[0])
+
+        db.update_balance(db.get_balance() + 250.0)
+
+        async def run():
+            try:
+                return await self.trader.sell_many_async([("HUT.TO", 11.0)])
+            finally:
+                await adb.dispose()
+
+        self.assertEqual([r['symbol'] for r in asyncio.run(run())], ["HUT.TO"])
+        self.assertEqual(db.get_positions(), {})
+        self.assertAlmostEqual(db.get_balance(), self.trader.balance)
+        self.assertEqual(db.get_trade_count(), 4)
+
+    def test_fill_does_not_reread_portfolio(self):
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            self.trader.buy("SHOP.TO", 100.0)
+            self.trader.get_summary()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+        # balance/version update, position upsert, trade insert, ledger insert, summary version check
+        self.assertEqual(len(statements), 5, statements)
+
+    def test_sell_many_is_one_transaction(self):
+        for symbol in ("SHOP.TO", "HUT.TO"):
+            self.trader.buy(symbol, 10.0)
+        records = self.trader.sell_many([("SHOP.TO", 11.0), ("HUT.TO", 9.0), ("NOT_HELD", 1.0)])
+        self.assertEqual([r['symbol'] for r in records], ["SHOP.TO", "HUT.TO"])
+        self.assertEqual(self.trader.positions, {})
+        self.assertEqual(db.get_positions(), {})
+        self.assertEqual(db.get_trade_count(), 4)
+        self.assertEqual(self.trader.trade_count, 4)
+        self.assertAlmostEqual(db.get_balance(), self.trader.balance)
+        self.assertFalse(self.trader.sync())
+
+    def test_failed_fill_rolls_back(self):
+        # Missing position fields fail after the balance update was issued
+        fill = db.record_fill("NVDA", 'BUY', 1.0, 100.0, 0.015, -101.5, position={'shares': 1.0})
+        self.assertIsNone(fill)
+        self.assertAlmostEqual(db.get_balance(), 1000.0)
+        self.assertEqual(db.get_positions(), {})
+        self.assertEqual(db.get_trade_count(), 0)
+
+class TestOrderAllocator(unittest.TestCase):
+    def setUp(self):
+        with db.engine.begin() as conn:
+            conn.execute(db.delete(db.trades))
+        db.reset_portfolio(1000.0)
+        self.trader = PaperTrader()
+        self.allocator = OrderAllocator(self.trader)
+
+    def intent(self, symbol, score, confidence='Medium', price=10.0):
+        return order_intent(symbol, {'latest_price': price, 'score': score, 'confidence': confidence, 'signal': 'BUY'}, {'volume_ratio': 2.0})
+
+    def run_batch(self, intents, foreign_write=False):
+        async def run():
+            try:
+                for intent in intents:
+                    self.allocator.submit(intent)
+                if foreign_write:
+                    await asyncio.to_thread(db.update_balance, 2000.0)
+                return await self.allocator.execute()
+            finally:
+                await adb.dispose()
+        return asyncio.run(run())
+
+    def test_best_intents_are_funded_first_in_one_commit(self):
+        # Arrival order is irrelevant: 8 intents, but 20% sizing only funds 8 of them down to $50
+        intents = [self.intent(f"S{i}.TO", score) for i, score in enumerate([1, 3, 2, 3, 1, 2, 3, 2])]
+        intents.append(self.intent("S1.TO", 0))  # duplicate symbol, lower score
+        transactions = []
+        listener = lambda conn: transactions.append(1)
+        event.listen(adb.get_engine().sync_engine, "commit", listener)
+        try:
+            outcomes = self.run_batch(intents)
+        finally:
+            event.remove(adb.get_engine().sync_engine, "commit", listener)
+
+        symbols = [intent['symbol'] for intent, _ in outcomes]
+        self.assertEqual(symbols[:3], ["S1.TO", "S3.TO", "S6.TO"])
+        self.assertEqual(len(symbols), 8)
+        funded = [receipt for _, receipt in outcomes if receipt]
+        costs = [r['cost'] for r in funded]
+        self.assertEqual(costs, sorted(costs, reverse=True))  # each sized from what was left
+        self.assertAlmostEqual(costs[0], 200.0)
+        self.assertAlmostEqual(costs[1], 160.0)
+        self.assertLess(1000.0 - sum(costs), 50.0 / 0.2)  # stopped once 20% fell under $50
+        self.assertEqual(len(transactions), 1)
+        self.assertAlmostEqual(db.get_balance(), self.trader.balance)
+        self.assertEqual(set(db.get_positions()), {r['symbol'] for r in funded})
+
+    def test_batch_is_replanned_after_foreign_write(self):
+        outcomes = self.run_batch([self.intent("SHOP.TO", 3), self.intent("HUT.TO", 2)], foreign_write=True)
+        receipts = [receipt for _, receipt in outcomes]
+        self.assertAlmostEqual(receipts[0]['cost'], 400.0)  # 20% of the new balance
+        self.assertAlmostEqual(db.get_balance(), 2000.0 - 400.0 - 320.0)
+
+    def test_risk_engine_resizes_and_rejects(self):
+        self.trader.buy("HUT.TO", 10.0)                  # $200 of crypto...
+        self.trader.mark_to_market({"HUT.TO": 15.0})     # ...now worth $300 of $1100
+        self.allocator.risk_engine = RiskEngine()
+        intents = [self.intent("BITF.TO", 3), self.intent("HIVE.TO", 2), self.intent("SHOP.TO", 1)]
+        outcomes = {intent['symbol']: (intent['risk']['action'], receipt) for intent, receipt in self.run_batch(intents)}
+
+        self.assertEqual(outcomes["BITF.TO"][0], RESIZE)
+        self.assertAlmostEqual(outcomes["BITF.TO"][1]['cost'], 0.40 * 1100 - 300)  # capped at the sector room
+        self.assertEqual(outcomes["HIVE.TO"], (REJECT, None))
+        self.assertIsNotNone(outcomes["SHOP.TO"][1])
+        self.assertEqual(set(db.get_positions()), {"HUT.TO", "BITF.TO", "SHOP.TO"})
+
+class TestStopWatch(unittest.TestCase):
+    def setUp(self):
+        with db.engine.begin() as conn:
+            conn.execute(db.delete(db.trades))
+        db.reset_portfolio(1000.0)
+        self.executor = TradeExecutor()
+        self.executor.send_telegram_alert = MagicMock()
+        for symbol in ("SHOP.TO", "HUT.TO"):
+            self.executor.trader.buy(symbol, 10.0)
+        self.stop_watch = StopWatch(self.executor)
+
+    def test_exit_is_sold_once_across_loops(self):
+        prices = {"SHOP.TO": 11.0, "HUT.TO": 10.0}  # SHOP.TO +10%: take profit
+
+        async def quotes(symbols):
+            await asyncio.sleep(0)
+            return prices
+
+        async def run():
+            try:
+                with patch.object(StopWatch, 'fetch_quotes', side_effect=quotes), \
+                     patch.object(adb, 'record_fills', wraps=adb.record_fills) as record_fills:
+                    # monitor_portfolio reaches the same exit while the stop-watch loops run
+                    exits = evaluate_exits(dict(self.executor.trader.positions), prices)
+                    results = await asyncio.gather(self.stop_watch.check(), self.executor.execute_exits(exits), self.stop_watch.check())
+                    return results, record_fills.call_count
+            finally:
+                await adb.dispose()
+
+        results, commits = asyncio.run(run())
+        self.assertEqual([r['symbol'] for receipts in results for r in receipts], ["SHOP.TO"])
+        self.assertEqual(commits, 1)  # the other loops skipped the claimed symbol instead of conflicting
+        self.assertEqual(set(db.get_positions()), {"HUT.TO"})
+        self.assertEqual(db.get_trade_count(), 3)
+        self.assertEqual(self.executor._selling, set())
+        self.executor.send_telegram_alert.assert_called_once()
+
+    def test_exit_and_buy_batch_in_flight_together_both_land(self):
+        prices = {"SHOP.TO": 11.0, "HUT.TO": 10.0}  # SHOP.TO +10%: take profit
+
+        async def quotes(symbols):
+            return prices
+
+        async def run():
+            try:
+                with patch.object(StopWatch, 'fetch_quotes', side_effect=quotes), \
+                     patch.object(adb, 'record_fills', wraps=adb.record_fills) as record_fills:
+                    self.executor.order_allocator.submit(order_intent(
+                        "NVDA", {'latest_price': 100.0, 'score': 3, 'confidence': 'High', 'signal': 'BUY'}, {'volume_ratio': 2.0}))
+                    sold, bought = await asyncio.gather(self.stop_watch.check(), self.executor.order_allocator.execute())
+                    return sold, bought, record_fills.call_count
+            finally:
+                await adb.dispose()
+
+        sold, bought, commits = asyncio.run(run())
+        self.assertEqual([r['symbol'] for r in sold], ["SHOP.TO"])
+        self.assertEqual([receipt['symbol'] for _, receipt in bought], ["NVDA"])
+        self.assertEqual(commits, 2)  # serialized in-process: neither write was rejected and retried
+        self.assertEqual(set(db.get_positions()), {"HUT.TO", "NVDA"})
+        self.assertAlmostEqual(db.get_balance(), self.executor.trader.balance)
+
+class TestLedger(unittest.TestCase):
+    def setUp(self):
+        db.reset_portfolio(1000.0)
+        self.start = db.get_portfolio_at()['ledger_id']
+        self.trader = PaperTrader()
+
+    def test_replay_matches_tables_and_history(self):
+        self.trader.buy("SHOP.TO", 100.0)
+        checkpoint = db.get_portfolio_at()
+        self.assertIsNotNone(db.snapshot_portfolio())
+        self.assertIsNone(db.snapshot_portfolio())  # nothing new since
+
+        self.trader.buy("NVDA", 50.0)
+        self.trader.sell_many([("SHOP.TO", 110.0)])
+        db.update_balance(self.trader.balance + 250.0)
+        audit = db.verify_ledger()
+        self.assertTrue(audit['ok'], audit)
+
+        # Latest state: snapshot + 2 fills (FILL + FEE each) + deposit
+        now = db.get_portfolio_at()
+        self.assertEqual(now['snapshot_id'], checkpoint['ledger_id'])
+        self.assertEqual(now['replayed'], 5)
+        self.assertAlmostEqual(now['balance'], db.get_balance())
+        self.assertEqual(now['positions'], db.get_positions())
+
+        # Point in time: rebuilt from the earlier state
+        then = db.get_portfolio_at(checkpoint['ts'])
+        self.assertEqual(then['ledger_id'], checkpoint['ledger_id'])
+        self.assertEqual(list(then['positions']), ["SHOP.TO"])
+        self.assertAlmostEqual(then['balance'], checkpoint['balance'])
+        self.assertAlmostEqual(then['invested'], 1000.0 - checkpoint['balance'])
+
+        entries = db.get_ledger_page(symbol="SHOP.TO", after_id=self.start, columns=['kind', 'action', 'amount'])
+        self.assertEqual([(e['kind'], e['action']) for e in entries], [('FEE', 'SELL'), ('FILL', 'SELL'), ('FEE', 'BUY'), ('FILL', 'BUY')])
+
+    def test_recover_portfolio_from_ledger(self):
+        self.trader.buy("SHOP.TO", 100.0)
+        balance = self.trader.balance
+        with db.engine.begin() as conn:
+            conn.execute(db.delete(db.positions))
+            conn.execute(db.update(db.portfolio).values(balance=0.0))
+        audit = db.verify_ledger()
+        self.assertEqual((audit['ok'], audit['missing']), (False, ["SHOP.TO"]))
+
+        db.recover_portfolio()
+        self.assertTrue(db.verify_ledger()['ok'])
+        self.assertAlmostEqual(db.get_balance(), balance)
+        self.assertTrue(self.trader.sync())
+        self.assertIn("SHOP.TO", self.trader.positions)
+
+class TestEquityHistory(unittest.TestCase):
+    def setUp(self):
+        with db.engine.begin() as conn:
+            conn.execute(db.delete(db.equity_history))
+
+    def test_mark_to_market_samples(self):
+        db.reset_portfolio(1000.0)
+        trader = PaperTrader()
+        trader.buy("SHOP.TO", 100.0)
+        cash = trader.balance
+        shares = trader.positions["SHOP.TO"]['shares']
+        # Entry price until a price is observed, then the last one seen
+        self.assertAlmostEqual(trader.mark_to_market()['exposure'], shares * 100.0)
+        trader.mark_to_market({"SHOP.TO": 110.0})
+        sample = trader.mark_to_market({"SHOP.TO": float('nan')})
+        self.assertAlmostEqual(sample['exposure'], shares * 110.0)
+        self.assertAlmostEqual(sample['equity'], cash + shares * 110.0)
+
+        asyncio.run(adb.record_equity(sample))
+        rows = db.get_equity_history()
+        self.assertEqual(len(rows), 1)
+        self.assertAlmostEqual(rows[0]['equity'], sample['equity'])
+
+    def test_downsampling_keeps_last_sample_per_bucket(self):
+        now = datetime.now().replace(minute=30, second=0, microsecond=0)
+        stamps = [now - timedelta(minutes=m) for m in range(0, 60 * 24 * 40, 20)]
+        for ts in stamps:
+            db.record_equity({'ts': ts, 'equity': 1.0, 'cash': 1.0, 'exposure': 0.0})
+        with db.engine.begin() as conn:
+            removed = db._downsample_equity(conn, now)
+        kept = [r['ts'] for r in db.get_equity_history()]
+        self.assertEqual(len(kept), len(stamps) - removed)
+
+        recent = [ts for ts in kept if ts >= now - timedelta(hours=48)]
+        hourly = [ts for ts in kept if now - timedelta(days=30) <= ts < now - timedelta(hours=48)]
+        daily = [ts for ts in kept if ts < now - timedelta(days=30)]
+        self.assertEqual(len(recent), 48 * 3 + 1)
+        self.assertEqual(len({ts.replace(minute=0) for ts in hourly}), len(hourly))
+        self.assertEqual(len({ts.date() for ts in daily}), len(daily))
+        with db.engine.begin() as conn:
+            self.assertEqual(db._downsample_equity(conn, now), 0)
+
+class TestSweepResults(unittest.TestCase):
+    def test_saved_runs_are_read_back_ranked(self):
+        results = [{'params': {'vol_mult': v}, 'total_return_pct': r, 'max_drawdown_pct': -5.0, 'turnover': 3.0,
+                    'sharpe': 1.0, 'trades': 10, 'win_rate_pct': 50.0, 'rank': rank}
+                   for rank, (v, r) in enumerate([(2.0, 12.0), (1.2, 8.0)], start=1)]
+        self.assertEqual(db.save_sweep_results("run-a", results), 2)
+        self.assertEqual(db.save_sweep_results("run-b", results[:1]), 1)
+        self.assertEqual([r['params'] for r in db.get_sweep_results("run-a")], [{'vol_mult': 2.0}, {'vol_mult': 1.2}])
+        self.assertEqual([r['run_id'] for r in db.get_sweep_results()], ["run-b"])
+
+class TestUpserts(unittest.TestCase):
+    def test_bulk_fundamentals_overwrite(self):
+        db.set_fundamentals_many({f"SYM{i}": float(i) for i in range(1200)})
+        db.set_fundamentals_many({"SYM1": 99.0, "SYM2": None})
+        self.assertEqual(db.get_fundamental("SYM1"), 99.0)
+        self.assertIsNone(db.get_fundamental("SYM2"))
+        self.assertEqual(db.get_fundamental("SYM1199"), 1199.0)
+
+    def test_fundamentals_many_single_query(self):
+        db.set_fundamentals_many({"FA": 10.0, "FB": 20.0})
+        with db.engine.begin() as conn:
+            conn.execute(db.update(db.fundamentals).where(db.fundamentals.c.symbol == "FB")
+                         .values(last_updated=datetime.now() - timedelta(days=3)))
+        self.assertEqual(db.get_fundamentals_many(["FA", "FB", "FC"]), {"FA": 10.0})
+        self.assertEqual(asyncio.run(adb.get_fundamentals_many(["FA", "FC"])), {"FA": 10.0})
+
+    def test_cache_and_config_upsert(self):
+        db.set_cache_many({"a": {"x": 1}, "b": [1, 2]}, ttl_minutes=5)
+        db.set_cache("a", {"x": 2})
+        self.assertEqual(db.get_cache("a"), {"x": 2})
+        self.assertEqual(db.get_cache("b"), [1, 2])
+
+        db.set_config("market_bias", "BUY")
+        db.set_config("market_bias", "SELL")
+        self.assertEqual(db.get_config("market_bias"), "SELL")
+
+class TestFundamentalsRefresher(unittest.TestCase):
+    def setUp(self):
+        with db.engine.begin() as conn:
+            conn.execute(db.delete(db.fundamentals))
+        self.calls = []
+
+    def fetch(self, symbol):
+        self.calls.append(symbol)
+        if symbol == "BAD":
+            raise RuntimeError("rate limited")
+        return {"AAA": 12.0, "BBB": 30.0}.get(symbol)
+
+    def test_refresh_records_freshness_and_resumes(self):
+        refresher = FundamentalsRefresher(rate_per_sec=1000, concurrency=2, write_every=2, fetch=self.fetch)
+        universe = ["AAA", "BBB", "NOPE", "BAD", "BTC-USD"]
+
+        stats = asyncio.run(refresher.refresh(universe))
+        self.assertEqual((stats['due'], stats['ok'], stats['no_data'], stats['error']), (4, 2, 1, 1))
+        self.assertEqual(db.get_fundamentals_many(universe), {"AAA": 12.0, "BBB": 30.0})
+
+        # Everything was attempted just now: a second run (e.g. after a restart) fetches nothing
+        self.calls.clear()
+        self.assertEqual(asyncio.run(refresher.refresh(universe))['due'], 0)
+        self.assertEqual(self.calls, [])
+
+        # Once stale, failures are retried first and keep counting errors
+        with db.engine.begin() as conn:
+            conn.execute(db.update(db.fundamentals).values(last_attempt=datetime.now() - timedelta(days=1)))
+            conn.execute(db.update(db.fundamentals).where(db.fundamentals.c.symbol == "BAD")
+                         .values(last_attempt=datetime.now() - timedelta(days=2)))
+        self.assertEqual(db.get_fundamentals_due(universe[:4], 20)[0], "BAD")
+        asyncio.run(refresher.refresh(["BAD"]))
+        with db.engine.connect() as conn:
+            row = conn.execute(db.select(db.fundamentals).where(db.fundamentals.c.symbol == "BAD")).mappings().one()
+        self.assertEqual((row['fetch_status'], row['error_count']), ('error', 2))
+
+        freshness = db.get_fundamentals_freshness()
+        self.assertEqual((freshness['symbols'], freshness['fresh']), (4, 2))
+
+class TestL1Cache(unittest.TestCase):
+    def test_reads_hit_l1_and_see_foreign_writes(self):
+        db.set_config("budget_allocation", {'stock_agent': 0.5})
+        before = db.get_l1_stats()['config']['hits']
+        for _ in range(5):
+            self.assertEqual(db.get_config("budget_allocation"), {'stock_agent': 0.5})
+        self.assertEqual(db.get_l1_stats()['config']['hits'], before + 5)
+
+        # Another process writes: row + version bump, no local L1 update
+        other = db.create_engine(os.environ['DATABASE_URL'])
+        with other.begin() as conn:
+            conn.execute(db.update(db.system_config).where(db.system_config.c.key == "budget_allocation").values(value='{"stock_agent": 0.9}'))
+            db._bump_kv_version(conn, [('config', 'budget_allocation')])
+        other.dispose()
+
+        db._l1_state['checked_at'] = 0.0  # Skip the poll interval
+        self.assertEqual(db.get_config("budget_allocation"), {'stock_agent': 0.9})
+
+    def test_purge_expired_cache(self):
+        db.set_cache("stale", "x", ttl_minutes=-1)
+        db.set_cache("fresh", "y", ttl_minutes=5)
+        self.assertGreaterEqual(db.purge_expired_cache(), 1)
+        self.assertIsNone(db.get_cache("stale"))
+        self.assertEqual(db.get_cache("fresh"), "y")
+
+class TestAnalysisLogWriter(unittest.TestCase):
+    def test_buffered_rows_are_flushed(self):
+        with db.engine.begin() as conn:
+            conn.execute(db.delete(db.analysis_log))
+
+        writer = AnalysisLogWriter(batch_size=100, flush_interval=60)
+        for i in range(250):
+            self.assertTrue(writer.submit(f"SYM{i}", 1.5, 0.9, 20.0, 'BUY', 'REJECTED', 'test', 10.0))
+        writer.stop()
+
+        stats = writer.stats()
+        self.assertEqual(stats['written'], 250)
+        self.assertEqual(stats['dropped'], 0)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertEqual(len(db.get_recent_analysis(limit=1000)), 250)
+
+class TestAnalysisStats(unittest.TestCase):
+    def test_counters_match_full_scan(self):
+        with db.engine.begin() as conn:
+            conn.execute(db.delete(db.analysis_log))
+            conn.execute(db.delete(db.analysis_stats_hourly))
+
+        now = datetime.now()
+        rows = [db.analysis_row(f"SYM{i % 7}", 1.0, 0.5, 10.0, 'BUY', ['REJECTED', 'BOUGHT', 'SCAN'][i % 3], 'x', 1.0,
+                                timestamp=now - timedelta(hours=i % 30)) for i in range(300)]
+        db.log_analysis_many(rows[:150])
+        db.log_analysis_many(rows[150:])
+
+        consistent, fast, full = db.verify_analysis_stats()
+        self.assertTrue(consistent, (fast, full))
+        self.assertLess(fast['total_analyzed'], 300)
+
+        db.rebuild_analysis_stats(hours=48)
+        self.assertEqual(db.get_analysis_stats(), fast)
+
+    def test_null_symbol_and_action(self):
+        with db.engine.begin() as conn:
+            conn.execute(db.delete(db.analysis_log))
+            conn.execute(db.delete(db.analysis_stats_hourly))
+
+        db.log_analysis_many([
+            db.analysis_row("SHOP.TO", 1.0, 0.5, 10.0, 'BUY', 'BOUGHT', 'x', 1.0),
+            db.analysis_row(None, 1.0, 0.5, 10.0, 'BUY', None, 'x', 1.0),
+        ])
+
+        consistent, fast, full = db.verify_analysis_stats()
+        self.assertTrue(consistent, (fast, full))
+        self.assertEqual(fast, {'total_analyzed': 2, 'unique_analyzed': 1, 'actions': {'BOUGHT': 1, None: 1}})
+        self.assertEqual(db.get_analysis_stats_full_scan(), fast)
+
+class TestAnalysisRetention(unittest.TestCase):
+    def test_rollup_archives_old_rows(self):
+        with db.engine.begin() as conn:
+            conn.execute(db.delete(db.analysis_log))
+            conn.execute(db.delete(db.analysis_log_daily))
+
+        now = datetime.now()
+        db.log_analysis_many(
+            [db.analysis_row("OLD", 1.0, 0.5, 10.0, 'BUY', 'REJECTED', 'x', 5.0, timestamp=now - timedelta(days=45))] * 3 +
+            [db.analysis_row("NEW", 1.0, 0.5, 10.0, 'BUY', 'REJECTED', 'x', 5.0, timestamp=now)]
+        )
+
+        archive_dir = os.path.join(_tmp_dir, 'archive')
+        self.assertEqual(db.rollup_analysis(retain_days=30, archive_dir=archive_dir), 3)
+        self.assertEqual(db.rollup_analysis(retain_days=30, archive_dir=archive_dir), 0)
+
+        remaining = db.get_recent_analysis(limit=100)
+        self.assertEqual([r['symbol'] for r in remaining], ["NEW"])
+        self.assertEqual(sum(r['count'] for r in db.get_daily_analysis_counts(days=90)), 3)
+        self.assertEqual(len(os.listdir(archive_dir)), 1)
+
+class TestPaginatedReads(unittest.TestCase):
+    def setUp(self):
+        with db.engine.begin() as conn:
+            conn.execute(db.delete(db.trades))
+            base = datetime(2024, 1, 1)
+            # Pairs of trades share a timestamp so pages must break ties on id
+            conn.execute(db.insert(db.trades), [
+                {'symbol': f"T{i}", 'action': 'SELL', 'shares': 1.0, 'price': 10.0, 'fee_rate': 0.0,
+                 'pnl': 1.0 if i % 3 else -1.0, 'date': base + timedelta(minutes=i // 2)}
+                for i in range(25)
+            ])
+
+    def test_keyset_pages_cover_table_once(self):
+        seen, cursor = [], (None, None)
+        while True:
+            page = db.get_trades_page(limit=10, before_ts=cursor[0], before_id=cursor[1], columns=['pnl'])
+            if not page:
+                break
+            self.assertEqual(set(page[0]), {'id', 'date', 'pnl'})
+            seen.extend(row['id'] for row in page)
+            cursor = (page[-1]['date'], page[-1]['id'])
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+        self.assertEqual(seen, [row['id'] for row in db.get_all_trades()])
+
+        newest = seen[0]
+        self.assertEqual(db.get_trades_page(after_id=newest), [])
+        self.assertEqual(len(db.get_trades_page(after_id=seen[2])), 2)
+
+    def test_after_id_walks_forward_through_backlog(self):
+        # A poller that last saw the oldest trade, with more new rows than one page holds
+        ids = sorted(row['id'] for row in db.get_all_trades())
+        polled, cursor = [], ids[0]
+        while True:
+            page = db.get_trades_page(limit=10, after_id=cursor, columns=['symbol'])
+            if not page:
+                break
+            self.assertEqual([row['id'] for row in page], sorted((row['id'] for row in page), reverse=True))
+            polled.extend(row['id'] for row in page)
+            cursor = page[0]['id']
+        self.assertEqual(sorted(polled), ids[1:])
+        self.assertEqual(len(polled), len(set(polled)))
+
+    def test_summary_and_frames(self):
+        summary = db.get_trade_summary()
+        self.assertEqual(summary['count'], 25)
+        self.assertEqual(summary['wins'], 16)
+        self.assertAlmostEqual(summary['total_pnl'], 16 - 9)
+
+        # test_logic swaps pandas for a mock in sys.modules; use the real one here
+        with patch.dict(sys.modules, {'pandas': pd}):
+            df = db.get_trades_page(limit=5, columns=['symbol', 'pnl'], fmt='pandas')
+        self.assertIsInstance(df, pd.DataFrame)
+        self.assertEqual(list(df.columns), ['id', 'date', 'symbol', 'pnl'])
+        self.assertEqual(len(df), 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import sys
+import os
+import asyncio
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from technical_analyst import TechnicalAnalyst, signals_wide
+from core.exit_rules import evaluate_exits
+
+def synthetic_closes(n_symbols=12, n_days=260, seed=7):
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range("2024-01-01", periods=n_days)
+    closes = {}
+    for k in range(n_symbols):
+        drift = 0.002 if k % 2 else -0.001
+        series = pd.Series(100 * np.exp(np.cumsum(rng.normal(drift, 0.02, n_days))), index=index)
+        if k % 3 == 0:
+            series.iloc[rng.choice(n_days, 8, replace=False)] = np.nan  # exchange holidays
+        if k == 4:
+            series.iloc[:120] = np.nan  # recent listing: not enough history
+        closes[f"S{k}"] = series
+    return pd.DataFrame(closes)
+
+class TestSignalsWide(unittest.TestCase):
+    def test_matches_per_symbol_analyze(self):
+        closes = synthetic_closes()
+        wide = signals_wide(closes)
+
+        for symbol in closes:
+            analyst = TechnicalAnalyst(symbol)
+            frame = pd.DataFrame({'Close': closes[symbol]})
+
+            async def fetch_data(frame=frame):
+                return frame.copy()
+            analyst.fetch_data = fetch_data
+            expected = asyncio.run(analyst.analyze())
+
+            row = wide.loc[symbol]
+            self.assertEqual((row['signal'], row['confidence']), (expected['signal'], expected['confidence']), symbol)
+            if 'latest_price' in expected:
+                self.assertAlmostEqual(row['latest_price'], expected['latest_price'])
+                self.assertAlmostEqual(row['rsi'], expected['rsi'], places=6)
+
+class TestExitRules(unittest.TestCase):
+    def position(self, avg_price, days_ago, fee_rate=0.0, shares=10.0):
+        return {
+            'shares': shares,
+            'avg_price': avg_price,
+            'fee_rate': fee_rate,
+            'cost_basis': shares * avg_price * (1 + fee_rate),
+            'entry_date': (datetime.now() - timedelta(days=days_ago)).isoformat()
+        }
+
+    def test_rules_in_priority_order(self):
+        positions = {
+            'TP': self.position(100.0, 1),
+            'TIME': self.position(100.0, 6),
+            'DEEP_LOSER': self.position(100.0, 6),
+            'SL': self.position(100.0, 1),
+            'TECH': self.position(100.0, 1),
+            'HOLD': self.position(100.0, 1),
+            'NO_PRICE': self.position(100.0, 1)
+        }
+        prices = {'TP': 106.0, 'TIME': 99.0, 'DEEP_LOSER': 90.0, 'SL': 95.0, 'TECH': 101.0, 'HOLD': 101.0}
+        exits = evaluate_exits(positions, prices, signals={'TECH': 'SELL'}, rsi={'TECH': 80.0})
+
+        sells = exits[exits['action'] == 'SELL']
+        self.assertEqual(sorted(sells.index), ['SL', 'TECH', 'TIME', 'TP'])
+        self.assertTrue(sells.loc['TP', 'reason'].startswith("🎯"))
+        self.assertTrue(sells.loc['TIME', 'reason'].startswith("⏳"))
+        self.assertTrue(sells.loc['SL', 'reason'].startswith("🛑"))
+        self.assertIn("RSI: 80.0", sells.loc['TECH', 'reason'])
+        # Past the time stop but below -2%: held (the stop loss is not re-checked)
+        self.assertEqual(exits.loc['DEEP_LOSER', 'action'], 'HOLD')
+        self.assertNotIn('NO_PRICE', exits.index)
+
+    def test_net_pnl_includes_fees(self):
+        exits = evaluate_exits({'NVDA': self.position(100.0, 1, fee_rate=0.015)}, {'NVDA': 104.0})
+        # +4% gross is +2.4% net after 1.5% each way: no take-profit
+        self.assertAlmostEqual(exits.loc['NVDA', 'pnl_percent'], (104 * 0.985 / 101.5 - 1) * 100)
+        self.assertEqual(exits.loc['NVDA', 'action'], 'HOLD')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,22 +4,30 @@ from unittest.mock import MagicMock, patch, AsyncMock
 import asyncio
 import sys
 import os
+import numpy  # real and imported up front: modules first imported under the mocks are dropped afterwards, and numpy can't be imported twice
 
 # Add parent dir to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# MOCK ALL DEPENDENCIES
-sys.modules['database'] = MagicMock()
-sys.modules['sqlalchemy'] = MagicMock()
-sys.modules['sqlalchemy.dialects.postgresql'] = MagicMock()
-sys.modules['ta'] = MagicMock()
-sys.modules['ta.momentum'] = MagicMock()
-sys.modules['ta.trend'] = MagicMock()
-sys.modules['pandas'] = MagicMock()
-sys.modules['yfinance'] = MagicMock()
-sys.modules['transformers'] = MagicMock()
+# MOCK ALL DEPENDENCIES (only while this module imports and runs, so other test modules keep the real ones)
+MOCKED_MODULES = {name: MagicMock() for name in (
+    'database', 'database_async', 'sqlalchemy', 'sqlalchemy.dialects.postgresql',
+    'ta', 'ta.momentum', 'ta.trend', 'pandas', 'yfinance', 'transformers'
+)}
 
-from core.market_scanner import MarketScanner
+with patch.dict(sys.modules, MOCKED_MODULES):
+    import core.market_scanner
+    from core.market_scanner import MarketScanner
+    # patch("core.market_scanner...") must resolve to the module imported against the mocks
+    MOCKED_MODULES['core.market_scanner'] = core.market_scanner
+
+_mocked_modules = patch.dict(sys.modules, MOCKED_MODULES)
+
+def setUpModule():
+    _mocked_modules.start()
+
+def tearDownModule():
+    _mocked_modules.stop()
 
 class TestMarketScannerLogic(unittest.TestCase):
     def setUp(self):
@@ -42,7 +50,7 @@ class TestMarketScannerLogic(unittest.TestCase):
         
         mock_ta_instance = MockTA.return_value
         mock_ta_instance.analyze = AsyncMock(return_value={
-            'signal': 'NEUTRAL', 
+            'signal': 'BUY',
             'latest_price': 50000
         })
         
@@ -107,5 +115,15 @@ class TestMarketScannerLogic(unittest.TestCase):
         self.mock_executor.execute_trade_logic.assert_called_once()
         self.mock_executor.log_rejection.assert_not_called()
 
+    @patch("core.market_scanner.adb")
+    def test_fundamentals_many_is_cache_only(self, MockAdb):
+        MockAdb.get_fundamentals_many = AsyncMock(return_value={"NVDA": 45.0})
+
+        result = asyncio.run(self.scanner.get_fundamentals_many(["NVDA", "AMD", "BTC-USD"]))
+
+        self.assertEqual(result, {"NVDA": 45.0, "AMD": None, "BTC-USD": None})
+        # Misses go to the background refresher (crypto has no P/E to fetch)
+        self.assertEqual(self.scanner.fundamentals_refresher._pending, {"AMD"})
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import sys
+import os
+import time
+import asyncio
+import socket
+import urllib.request
+import urllib.error
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.tracing import Tracer
+from core.metrics import Metrics
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.tracer = Tracer(trace_file=None)
+        self.metrics = Metrics(tracer=self.tracer)
+
+    def test_endpoint_renders_counters_gauges_and_histograms(self):
+        self.metrics.inc("symbols_scanned_total", 100)
+        self.metrics.inc("symbols_scanned_total", 50)
+        self.metrics.inc("gate_candidates_total", 3, gate="sentiment", result="reject")
+        self.metrics.register(lambda: [("queue_depth", {'queue': 'notifier'}, 2), ("cycle_running_seconds", {}, 12.5)])
+        self.metrics.register(lambda: 1 / 0)  # a broken collector doesn't break the scrape
+        for seconds in (0.02, 0.2, 3.0):
+            self.tracer.observe("scanner.sentiment", seconds)
+
+        with socket.socket() as sock:  # port 0 means disabled, so pick a free one
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.assertIsNone(self.metrics.start_server(port=0))
+        server = self.metrics.start_server(host="127.0.0.1", port=port)
+        try:
+            url = f"http://127.0.0.1:{server.server_port}"
+            with urllib.request.urlopen(f"{url}/metrics") as resp:
+                self.assertTrue(resp.headers['Content-Type'].startswith("text/plain; version=0.0.4"))
+                lines = resp.read().decode().splitlines()
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(f"{url}/other")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertIn("# TYPE trading_bot_symbols_scanned_total counter", lines)
+        self.assertIn("trading_bot_symbols_scanned_total 150", lines)
+        self.assertIn('trading_bot_gate_candidates_total{gate="sentiment",result="reject"} 3', lines)
+        self.assertIn("# TYPE trading_bot_queue_depth gauge", lines)
+        self.assertIn('trading_bot_queue_depth{queue="notifier"} 2', lines)
+        self.assertIn("trading_bot_cycle_running_seconds 12.5", lines)
+        self.assertIn("# TYPE trading_bot_span_duration_seconds histogram", lines)
+        self.assertIn('trading_bot_span_duration_seconds_bucket{span="scanner.sentiment",le="0.025"} 1', lines)
+        self.assertIn('trading_bot_span_duration_seconds_bucket{span="scanner.sentiment",le="0.25"} 2', lines)
+        self.assertIn('trading_bot_span_duration_seconds_bucket{span="scanner.sentiment",le="+Inf"} 3', lines)
+        self.assertIn('trading_bot_span_duration_seconds_count{span="scanner.sentiment"} 3', lines)
+
+    def test_event_loop_lag(self):
+        async def scenario():
+            probe = asyncio.create_task(self.metrics.watch_event_loop(interval=0.01))
+            await asyncio.sleep(0.02)
+            time.sleep(0.2)  # blocking call on the loop
+            await asyncio.sleep(0.03)
+            probe.cancel()
+
+        asyncio.run(scenario())
+        self.assertGreater(self.tracer.histograms["event_loop.lag"].max, 0.1)
+        self.assertLess(self.metrics.get("event_loop_lag_seconds"), 0.1)
+
+if __name__ == '__main__':
+    unittest.main()
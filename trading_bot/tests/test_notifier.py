@@ -0,0 +1,143 @@
+import unittest
+import sys
+import os
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.notifier import TelegramNotifier, DIGEST_SEPARATOR, escape_markdown
+
+class StubTelegram:
+    """
+    Local stand-in for the Bot API's sendMessage. Replies with the queued
+    (status, body) pairs in order, then 200; every request body is recorded.
+    Markdown texts containing `malformed` get the 400 Telegram gives for
+    entities it can't parse.
+    """
+
+    def __init__(self, delay=0.0, malformed=None):
+        self.delay = delay
+        self.malformed = malformed
+        self.replies = []
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                stub.requests.append({'path': self.path, **body})
+                time.sleep(stub.delay)
+                if stub.malformed and body.get('parse_mode') and stub.malformed in body['text']:
+                    status, reply = 400, {'ok': False, 'description': "Bad Request: can't parse entities"}
+                else:
+                    status, reply = stub.replies.pop(0) if stub.replies else (200, {'ok': True})
+                stub.requests[-1]['status'] = status
+                data = json.dumps(reply).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class TestTelegramNotifier(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubTelegram()
+
+    def tearDown(self):
+        self.stub.close()
+
+    def notifier(self, **kwargs):
+        kwargs = {'min_interval': 0.0, 'coalesce_window': None, 'backoff': 0.01, **kwargs}
+        return TelegramNotifier(token="TEST", chat_id="42", api_url=self.stub.url, **kwargs)
+
+    def test_send_never_waits_for_the_api(self):
+        self.stub.delay = 0.3
+        notifier = self.notifier()
+
+        async def scenario():
+            start = time.perf_counter()
+            notifier.send("*BUY EXEC: SHOP.TO*")
+            notifier.send("*SELL EXEC: HUT.TO*")
+            queued = time.perf_counter() - start
+            await notifier.stop()
+            return queued
+
+        self.assertLess(asyncio.run(scenario()), 0.05)
+        self.assertEqual([r['text'] for r in self.stub.requests], ["*BUY EXEC: SHOP.TO*", "*SELL EXEC: HUT.TO*"])
+        self.assertEqual(self.stub.requests[0]['path'], "/botTEST/sendMessage")
+        self.assertEqual(self.stub.requests[0]['chat_id'], "42")
+        self.assertEqual(notifier.stats()['sent'], 2)
+
+    def test_burst_is_one_digest_and_retried(self):
+        self.stub.replies = [(500, {'ok': False}), (429, {'ok': False, 'parameters': {'retry_after': 0}})]
+        notifier = self.notifier(coalesce_window=0.1)
+
+        async def scenario():
+            for symbol in ("SHOP.TO", "HUT.TO", "NVDA"):
+                notifier.send(f"BUY {symbol}")
+            await notifier.stop()
+
+        asyncio.run(scenario())
+        self.assertEqual(len(self.stub.requests), 3)  # 500, 429, then delivered
+        self.assertEqual(self.stub.requests[-1]['text'], DIGEST_SEPARATOR.join(["BUY SHOP.TO", "BUY HUT.TO", "BUY NVDA"]))
+        stats = notifier.stats()
+        self.assertEqual((stats['sent'], stats['digests'], stats['retries'], stats['failed']), (1, 1, 2, 0))
+
+    def test_client_errors_are_not_retried_and_full_queue_drops(self):
+        self.stub.replies = [(400, {'ok': False, 'description': "chat not found"})] * 2
+        notifier = self.notifier(max_queue=2)
+
+        async def scenario():
+            results = [notifier.send(f"alert {i}") for i in range(3)]
+            await notifier.stop()
+            return results
+
+        self.assertEqual(asyncio.run(scenario()), [True, True, False])
+        # alert 0: rejected, rejected again as plain text, given up; alert 1 delivered
+        self.assertEqual([(r['text'], 'parse_mode' in r) for r in self.stub.requests],
+                         [("alert 0", True), ("alert 0", False), ("alert 1", True)])
+        stats = notifier.stats()
+        self.assertEqual((stats['sent'], stats['failed'], stats['retries'], stats['dropped']), (1, 1, 0, 1))
+
+    def test_malformed_alert_does_not_sink_its_digest(self):
+        self.stub.malformed = "_ETF"
+        notifier = self.notifier(coalesce_window=0.1)
+        alerts = ["*BUY EXEC: SHOP.TO*", "*BUY EXEC: XIU.TO*\n- Top_ETF picks", "*SELL EXEC: NVDA*"]
+
+        async def scenario():
+            for alert in alerts:
+                notifier.send(alert)
+            await notifier.stop()
+
+        asyncio.run(scenario())
+        delivered = [r['text'] for r in self.stub.requests if r['status'] == 200]
+        self.assertEqual(delivered, alerts)
+        self.assertNotIn('parse_mode', self.stub.requests[-2])  # the malformed one, as plain text
+        stats = notifier.stats()
+        self.assertEqual((stats['sent'], stats['failed'], stats['digests']), (3, 0, 1))
+
+    def test_escape_markdown(self):
+        self.assertEqual(escape_markdown("Top_ETF *hot* [pick] `x`"), "Top\\_ETF \\*hot\\* \\[pick] \\`x\\`")
+
+    def test_digest_respects_size_limit(self):
+        texts = TelegramNotifier.digest(["a" * 30, "b" * 30, "c" * 30], limit=80)
+        self.assertEqual(texts, ["a" * 30 + DIGEST_SEPARATOR + "b" * 30, "c" * 30])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+import sys
+import os
+import time
+import tempfile
+import threading
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.replay import Recorder, Replayer, ReplayMiss, ReplayError
+
+class CountingServer:
+    """Local endpoint answering GET with how many requests it has served."""
+
+    def __init__(self, delay=0.0):
+        self.hits = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.hits += 1
+                time.sleep(delay)
+                body = str(server.hits).encode()
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/table"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def quote(symbol):
+    if symbol == "BAD":
+        raise KeyError(symbol)
+    return {'symbol': symbol, 'closes': [10.0, 10.5]}
+
+class TestRecordReplay(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "cycle.pkl.gz")
+        self.feed = SimpleNamespace(quote=quote)
+
+    def record(self, server, calls):
+        with Recorder(self.path) as session:
+            session.intercept(self.feed, 'quote', 'feed.quote')
+            session.meta['cycles'] = 1
+            calls()
+        server.close()
+        self.assertIs(requests.get, self.real_get)
+        return session
+
+    def test_replays_responses_in_order_offline(self):
+        server = CountingServer()
+        self.real_get = requests.get
+
+        def live_calls():
+            self.assertEqual(requests.get(server.url).text, "1")
+            self.assertEqual(requests.get(server.url).text, "2")
+            self.assertEqual(self.feed.quote("AAA")['closes'], [10.0, 10.5])
+            with self.assertRaises(KeyError):
+                self.feed.quote("BAD")
+        recorded = self.record(server, live_calls)
+        self.assertEqual(recorded.stats(), {'keys': 3, 'responses': 4})
+
+        with Replayer(self.path, latency=0) as session:
+            session.intercept(self.feed, 'quote', 'feed.quote')
+            self.assertEqual([requests.get(server.url).text for _ in range(3)], ["1", "2", "2"])
+            first = self.feed.quote("AAA")
+            first['closes'].append(99.0)  # callers may mutate what they get
+            self.assertEqual(self.feed.quote("AAA")['closes'], [10.0, 10.5])
+            with self.assertRaisesRegex(ReplayError, "KeyError"):
+                self.feed.quote("BAD")
+            with self.assertRaises(ReplayMiss):
+                self.feed.quote("ZZZ")
+        self.assertEqual(session.meta, {'cycles': 1})
+        self.assertEqual(session.stats()['misses'], 1)
+        self.assertEqual(server.hits, 2)
+        self.assertIs(self.feed.quote, quote)
+
+    def test_injected_latency(self):
+        server = CountingServer(delay=0.2)
+        self.real_get = requests.get
+        self.record(server, lambda: requests.get(server.url))
+
+        def timed_get(session):
+            with session:
+                start = time.perf_counter()
+                requests.get(server.url)
+                return time.perf_counter() - start
+
+        self.assertLess(timed_get(Replayer(self.path, latency=0)), 0.05)
+        self.assertGreaterEqual(timed_get(Replayer(self.path, scale=0.5)), 0.1)
+        self.assertGreaterEqual(timed_get(Replayer(self.path, latency=0.05)), 0.05)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import sys
+import os
+import json
+import time
+import asyncio
+import tempfile
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.tracing import Tracer, Histogram
+
+class TestTracer(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "traces.jsonl")
+        self.tracer = Tracer(trace_file=self.path)
+
+    def test_cycle_collects_concurrent_and_threaded_spans(self):
+        tracer = self.tracer
+
+        @tracer.traced("scanner.news")
+        def fetch_news():
+            time.sleep(0.01)
+
+        async def candidate(symbol):
+            with tracer.span("scanner.candidate", symbol=symbol):
+                await asyncio.to_thread(fetch_news)
+
+        async def cycle():
+            with tracer.cycle():
+                with tracer.span("orchestrator.monitor"):
+                    await asyncio.sleep(0)
+                with tracer.span("orchestrator.scan_batch"):
+                    await asyncio.gather(candidate("SHOP.TO"), candidate("HUT.TO"))
+
+        asyncio.run(cycle())
+        with tracer.span("stop_watch.check"):  # outside any cycle: histogram only
+            pass
+
+        trace = tracer.last_trace
+        by_id = {s['id']: s for s in trace['spans']}
+        names = sorted(s['name'] for s in trace['spans'])
+        self.assertEqual(names, ["cycle", "orchestrator.monitor", "orchestrator.scan_batch",
+                                 "scanner.candidate", "scanner.candidate", "scanner.news", "scanner.news"])
+        for s in trace['spans']:
+            if s['name'] == "scanner.news":
+                self.assertEqual(by_id[s['parent']]['name'], "scanner.candidate")
+            if s['name'] == "scanner.candidate":
+                self.assertEqual(by_id[s['parent']]['name'], "orchestrator.scan_batch")
+                self.assertIn(s['symbol'], ("SHOP.TO", "HUT.TO"))
+        self.assertGreaterEqual(trace['ms'], 10)
+        self.assertTrue(tracer.summary(trace).startswith("⏱️ cycle"))
+
+        stats = tracer.stats()
+        self.assertEqual(stats["scanner.news"]['count'], 2)
+        self.assertEqual(stats["stop_watch.check"]['count'], 1)
+        with open(self.path) as f:
+            self.assertEqual(json.loads(f.readline())['spans'], trace['spans'])
+
+    def test_histogram_quantiles(self):
+        hist = Histogram()
+        for ms in [2] * 90 + [400] * 10:
+            hist.observe(ms / 1000)
+        snapshot = hist.snapshot()
+        self.assertEqual(snapshot['count'], 100)
+        self.assertLessEqual(snapshot['p50_ms'], 2.5)
+        self.assertGreater(snapshot['p95_ms'], 250)
+        self.assertLessEqual(snapshot['p95_ms'], 400)
+        self.assertEqual(snapshot['max_ms'], 400)
+
+if __name__ == '__main__':
+    unittest.main()